@@ -1,63 +1,245 @@
 # -*- coding: utf-8 -*-
-from flask import Flask, Response, request
+from flask import Flask, Response, request, g
 from http import HTTPStatus
 from flask_cors import CORS
-from openai import OpenAI
-from dashscope import Application
+import gc
 import json
-import requests
+import time
 import uuid
-from rich.console import Console
 from concurrent.futures import ThreadPoolExecutor
 
-from db import add_knowledge_search_result, create_apisession, get_apisession, init_db, create_session, add_question_to_session, add_question_answer, get_answer_by_question_id, add_question_summary, get_question_by_id, add_web_search_result, get_retrieve_data
-from utils.result import success_response, error_response
-from config import AppConfig, ApiKeyConfig, PromptConfig
+from db import add_knowledge_search_result, create_apisession, init_db, create_session, add_question_to_session, add_question_answer, get_question_by_id, add_web_search_result, add_rag_result, add_retrieve_results, get_question_with_results, transaction, init_write_behind, enqueue_write, enqueue_job, get_job_stats, begin_answer, checkpoint_answer, get_answer_state, get_conversation, get_question_summaries, set_question_category, get_category_history, init_archive, ANSWER_STREAMING, ANSWER_DONE, ANSWER_INTERRUPTED
+from utils.result import success_response, error_response, raw_json_response, overload_response, dumps, RawJson, ResponseCompressor
+from utils.knowledge_base import KnowledgeBase, RESPONSE_FIELDS
+from utils.rag_index import RagIndex, HashingEmbedder
+from utils.stream_pipeline import AnswerRecorder, StreamFormatter, slice_from_offset, wants_sse
+from utils.tracing import create_tracer
+from utils.admission import AdmissionRejected, create_admission_controller
+from utils.recommender import CooccurrenceRecommender
+from utils.conversation_cache import ConversationCache, build_history_prompt, question_text
+from utils.fanout import fan_out, STATUS_OK, STATUS_EMPTY
+from utils.prefetch import PrefetchRegistry
+from utils.model_router import create_model_router, TASK_INTENT, TASK_CATEGORY, TASK_KEYWORDS, TASK_SUMMARY, TASK_RECOMMEND
+from utils.prompt_builder import build_references, estimate_tokens
+from utils.upstream import UpstreamClient, UpstreamPolicy, UpstreamError, create_http_session, create_openai_http_client
+from utils.answer_cache import create_answer_cache, normalize_text, question_cache_text, replay_chunks, KIND_STREAM_CHAT, KIND_RECOMMEND, KIND_KEYWORDS, KIND_SUMMARY, KIND_WEB_SEARCH
+from utils.singleflight import SingleFlight
+from utils.web_search import compact_results, keyword_cache_text
+from utils.lazy import Lazy, LazyConsole
+from utils.archive import ArchiveReader
+from config import AppConfig, ApiKeyConfig, PromptConfig, KnowledgeConfig, RetrieveConfig, CacheConfig, UpstreamConfig, JobConfig, RagConfig, StreamConfig, ObservabilityConfig, ConversationConfig, RecommendConfig, WebSearchConfig, PrefetchConfig, ModelRouterConfig, ArchiveConfig, ResponseConfig
 
 
 
 app = Flask(__name__)
-executor = ThreadPoolExecutor(max_workers=5)
+# 检索专用线程池
+retrieve_executor = ThreadPoolExecutor(max_workers=RetrieveConfig.MAX_WORKERS)
+# 客户端断开后继续接收上游流的后台线程池
+stream_executor = ThreadPoolExecutor(max_workers=StreamConfig.MAX_DETACHED_STREAMS)
 
 CORS(app, resources=r'/*') 
 
 app.config.from_object(AppConfig)
 
-qwen_client = OpenAI(
-    api_key=ApiKeyConfig.QWEN_API_KEY,
-    base_url=ApiKeyConfig.QWEN_BASE_URL
-)
+# 阶段耗时直方图 + 采样追踪日志
+tracer = create_tracer(ObservabilityConfig)
+
+def upstream_policy(read_timeout, max_concurrency):
+    return UpstreamPolicy(
+        connect_timeout=UpstreamConfig.CONNECT_TIMEOUT,
+        read_timeout=read_timeout,
+        max_concurrency=max_concurrency,
+        acquire_timeout=UpstreamConfig.ACQUIRE_TIMEOUT,
+        max_retries=UpstreamConfig.MAX_RETRIES,
+        backoff_base=UpstreamConfig.BACKOFF_BASE,
+        backoff_max=UpstreamConfig.BACKOFF_MAX,
+        failure_threshold=UpstreamConfig.BREAKER_FAILURE_THRESHOLD,
+        reset_timeout=UpstreamConfig.BREAKER_RESET_TIMEOUT,
+    )
 
-zhipu_client = OpenAI(
-    api_key=ApiKeyConfig.ZHIPU_API_KEY,
-    base_url=ApiKeyConfig.ZHIPU_BASE_URL 
-)
+# 所有外部调用经由 UpstreamClient：共享连接池 + 并发隔离 + 重试 + 熔断
+http_session = Lazy(lambda: create_http_session(UpstreamConfig.POOL_MAXSIZE), reset_after_fork=True)
+qwen_upstream = UpstreamClient("qwen", upstream_policy(UpstreamConfig.QWEN_READ_TIMEOUT, UpstreamConfig.QWEN_MAX_CONCURRENCY), observe=tracer.observe_upstream)
+zhipu_upstream = UpstreamClient("zhipu", upstream_policy(UpstreamConfig.ZHIPU_READ_TIMEOUT, UpstreamConfig.ZHIPU_MAX_CONCURRENCY), session=http_session, observe=tracer.observe_upstream)
+dashscope_upstream = UpstreamClient("dashscope", upstream_policy(UpstreamConfig.DASHSCOPE_READ_TIMEOUT, UpstreamConfig.DASHSCOPE_MAX_CONCURRENCY), observe=tracer.observe_upstream)
+
+def create_openai_client(upstream, api_key, base_url):
+    """OpenAI 兼容客户端；openai 导入较慢，首次调用时才导入"""
+    from openai import OpenAI
+
+    # 重试由 UpstreamClient 负责，SDK 自身不再重试
+    return OpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        max_retries=0,
+        http_client=create_openai_http_client(upstream.policy, UpstreamConfig.POOL_MAXSIZE)
+    )
 
-console = Console()
+# 客户端首次使用时创建；连接池不跨 fork 共享，worker 内各自重建
+qwen_client = Lazy(lambda: create_openai_client(qwen_upstream, ApiKeyConfig.QWEN_API_KEY, ApiKeyConfig.QWEN_BASE_URL), reset_after_fork=True)
+zhipu_client = Lazy(lambda: create_openai_client(zhipu_upstream, ApiKeyConfig.ZHIPU_API_KEY, ApiKeyConfig.ZHIPU_BASE_URL), reset_after_fork=True)
+
+def qwen_chat(**kwargs):
+    """调用 Qwen 对话补全"""
+    return qwen_upstream.call(qwen_client.get().chat.completions.create, **kwargs)
+
+# 模型路由：按任务类型、输入长度、上游负载与各模型近期延迟 / 错误率选择模型
+model_router = create_model_router(ModelRouterConfig, load=qwen_upstream.utilization)
+
+def routed_chat(task, messages, input_text):
+    """
+    按路由策略选择模型调用 Qwen，所选模型调用失败时回退到下一个候选模型
+    :param input_text: 决定输入长度的可变部分（通常为用户问题），不含固定提示词
+    """
+    models = model_router.route(task, len(input_text or ""))
+    for index, model in enumerate(models):
+        start = time.perf_counter()
+        try:
+            response = qwen_chat(model=model, messages=messages)
+        except UpstreamError:
+            seconds = time.perf_counter() - start
+            model_router.record(task, model, seconds, ok=False)
+            tracer.observe_llm(model, task, "error", seconds)
+            if index == len(models) - 1:
+                raise
+            console.print(f'[red]@llm - {task}: {model} failed, fall back to {models[index + 1]}[/red]')
+            continue
+        seconds = time.perf_counter() - start
+        model_router.record(task, model, seconds, ok=True, usage=getattr(response, "usage", None))
+        tracer.observe_llm(model, task, "ok", seconds)
+        return response
+
+
+def load_dashscope_application():
+    """首次调用智能体应用时导入 dashscope"""
+    import dashscope
+
+    if ApiKeyConfig.DASHSCOPE_BASE_URL:
+        dashscope.base_http_api_url = ApiKeyConfig.DASHSCOPE_BASE_URL
+    return dashscope.Application
+
+dashscope_application = Lazy(load_dashscope_application)
+
+console = LazyConsole(ObservabilityConfig.CONSOLE_LOG)
+
+# 知识库首次访问时加载；create_app 中预加载
+knowledge_base = KnowledgeBase(KnowledgeConfig.KNOWLEDGE_FILE, KnowledgeConfig.RELOAD_INTERVAL)
+
+# 后台任务类别
+JOB_SUMMARY = "summary"
+JOB_RECOMMEND = "recommend"
+
+# LLM 回答缓存
+answer_cache = create_answer_cache(app, CacheConfig)
+
+
+def load_conversation(session_id, limit):
+    """会话历史缓存未命中时从数据库加载"""
+    success, (api_session_id, rows) = get_conversation(session_id, limit, ConversationConfig.TURN_MAX_CHARS)
+    return api_session_id, [
+        (question_id, question_text(json.loads(content)), summary, answer)
+        for question_id, content, summary, answer in rows
+    ]
+
+
+# 会话历史缓存：API 会话ID与最近几轮问答的紧凑记录
+conversation_cache = ConversationCache(
+    load_conversation,
+    (lambda question_ids: get_question_summaries(question_ids)[1]) if JobConfig.SUMMARY_ENABLED else None,
+    max_sessions=ConversationConfig.MAX_SESSIONS,
+    max_turns=ConversationConfig.MAX_TURNS,
+    turn_max_chars=ConversationConfig.TURN_MAX_CHARS,
+    ttl=ConversationConfig.TTL,
+    idle_timeout=ConversationConfig.IDLE_TIMEOUT,
+)
 
 def extract_search_keywords(user_question):
+    cache_text = normalize_text(user_question)
+    cached = answer_cache.get(KIND_KEYWORDS, cache_text, near_duplicate=True)
+    if cached is not None:
+        return json.loads(cached)
+
     prompt = PromptConfig.KEYWORD_EXTRACTION_PROMPT + f'用户问题：{user_question}'
 
-    response = qwen_client.chat.completions.create(
-        model="qwen-plus",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant."},
-            {"role": "user", "content": prompt}
-        ]
-    )
-    
-    console.print(f"[yellow](func: extract_search_keywords)[yellow] [green]response:{response}[/green] ")
+    with tracer.span("llm_keywords"):
+        response = routed_chat(
+            TASK_KEYWORDS,
+            [
+                {"role": "system", "content": "You are a helpful assistant."},
+                {"role": "user", "content": prompt}
+            ],
+            user_question,
+        )
+
+    console.print(f"[yellow](func: extract_search_keywords)[yellow] [green]response:{response.choices[0].message.content[:100] if response.choices else None}[/green] ")
 
     try:
         result = json.loads(response.choices[0].message.content)
-        if result["related"]:
-            return result["keywords"]
-        else:
-            return []
+        keywords = result["keywords"] if result["related"] else []
+        answer_cache.put(KIND_KEYWORDS, cache_text, json.dumps(keywords), near_duplicate=True)
+        return keywords
     except Exception as e:
         console.print(f"[red]Error parsing response: {e}[/red]")
         return []
 
+@app.before_request
+def start_request_trace():
+    g.trace = tracer.start(request.endpoint or "unmatched", method=request.method)
+
+@app.after_request
+def finish_request_trace(response):
+    trace = g.pop("trace", None)
+    if trace is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        tracer.observe_request(route, request.method, response.status_code, trace.elapsed())
+        trace.attrs["status"] = response.status_code
+        tracer.detach(trace)
+    return response
+
+# 准入控制：会话限流 + 路由并发上限（ASGI 的 /stream_chat 共用同一控制器）
+admission = create_admission_controller(AppConfig)
+
+@app.before_request
+def admit_request():
+    if admission is None or request.url_rule is None:
+        return
+    session_id = request.cookies.get('session_id') or request.remote_addr
+    g.admission_permit = admission.admit(request.url_rule.rule, session_id)
+
+@app.after_request
+def release_on_close(response):
+    # 流式响应在发送完毕（或客户端断开）时才释放并发配额
+    permit = g.pop("admission_permit", None)
+    if permit is not None:
+        response.call_on_close(permit.release)
+    return response
+
+# 较大的 JSON 响应按 Accept-Encoding 压缩（流式回答不压缩，逐块直接发送）
+compressor = ResponseCompressor(
+    ResponseConfig.COMPRESSION_MIN_BYTES, ResponseConfig.GZIP_LEVEL, ResponseConfig.BROTLI_QUALITY
+) if ResponseConfig.COMPRESSION_ENABLED else None
+
+@app.after_request
+def compress_response(response):
+    if compressor is None:
+        return response
+    return compressor(response, request.accept_encodings)
+
+@app.teardown_request
+def release_on_error(exc):
+    permit = g.pop("admission_permit", None)
+    if permit is not None:
+        permit.release()
+
+@app.errorhandler(AdmissionRejected)
+def handle_admission_rejected(e):
+    return overload_response(str(e), e.status, e.retry_after)
+
+@app.errorhandler(UpstreamError)
+def handle_upstream_error(e):
+    console.print(f"[red]Upstream error: {e}[/red]")
+    return error_response(str(e), code=503)
+
 @app.route("/newchat", methods=["GET"])
 def new_chat():
     session_id = uuid.uuid4().hex
@@ -70,7 +252,7 @@ def new_chat():
 def new_question_id():
     session_id = request.cookies.get('session_id')
     if not session_id:
-        return error_response("Session ID not found")
+        return error_response("Session ID not found", code=HTTPStatus.BAD_REQUEST)
 
     data = request.json
     content = {
@@ -80,311 +262,866 @@ def new_question_id():
 
     success, msg = add_question_to_session(session_id, json.dumps(content))
     if not success:
-        return error_response(msg)
+        return error_response(msg, code=HTTPStatus.NOT_FOUND if msg == "Session not found" else HTTPStatus.INTERNAL_SERVER_ERROR)
+
+    if prefetch is not None and content["user_question"]:
+        # 推测预取：客户端调用检索接口前即开始检索
+        prefetch.submit(msg, {
+            "knowledge": (search_knowledge, (content["user_question"],)),
+            "web": (search_web, (content["user_question"],)),
+        })
 
     return success_response({"question_id": msg})
 
+def llm_classify_category(user_question, keywords_prompt):
+    """LLM 意图识别 + 类别判断，非数学问题返回 None"""
+    # 意图识别
+    with tracer.span("llm_intent"):
+        completion = routed_chat(
+            TASK_INTENT,
+            [
+                {'role': 'system', 'content': '你需要对用户的问题进行分类，判断是否属于数学相关的问题，若是，则返回1，否则返回0'},
+                {'role': 'user', 'content': user_question}
+            ],
+            user_question,
+        )
+    console.print(f"[yellow](func: knowledge_search)[yellow] [green]意图识别结果:{completion.choices[0].message.content}[/green] ")
+    if completion.choices[0].message.content != '1':
+        return None
+
+    # 知识检索
+    with tracer.span("llm_category"):
+        completion = routed_chat(
+            TASK_CATEGORY,
+            [
+                {'role': 'system', 'content': '根据用户问题判断和下列哪种类别最相关，给出且仅给出一个类别id，例如：17。类别如下：' + keywords_prompt},
+                {'role': 'user', 'content': user_question}
+            ],
+            user_question,
+        )
+    console.print(f"[yellow](func: knowledge_search)[yellow] [green]类别id:{completion.choices[0].message.content}[/green] ")
+    return completion.choices[0].message.content
+
+def search_knowledge(user_question):
+    """知识检索：返回 (是否数学相关, 命中的知识点)"""
+    # 同一次检索内使用同一份知识库快照
+    snapshot = knowledge_base.snapshot
+
+    # 本地分类器：置信度足够时跳过 LLM 调用
+    with tracer.span("local_classify"):
+        local_match = snapshot.classifier.best_match(user_question, KnowledgeConfig.CLASSIFIER_THRESHOLD)
+    if local_match:
+        category_id, score = local_match
+        console.print(f"[yellow](func: knowledge_search)[yellow] [green]本地分类 类别id:{category_id} score:{score}[/green] ")
+    else:
+        category_id = llm_classify_category(user_question, snapshot.keywords_prompt)
+        if category_id is None:
+            return False, None
+
+    return True, snapshot.items.get(str(category_id).strip())
+
+# 推测预取：/new_question_id 时启动知识检索与联网搜索，在途任务数有上限
+prefetch = PrefetchRegistry(PrefetchConfig.MAX_WORKERS, PrefetchConfig.MAX_INFLIGHT, PrefetchConfig.TTL) if PrefetchConfig.ENABLED else None
+
+def search_prefetched(name, question_id, search, user_question):
+    """
+    优先等待在途的预取结果；只在未预取或预取失败时直接检索
+    预取较慢时继续等待同一个请求，不再重复调用上游（/retrieve 的总耗时上限由 fan-out 控制）
+    """
+    if prefetch is not None:
+        result = prefetch.result(question_id, name)
+        if result is not None and result[0] in (STATUS_OK, STATUS_EMPTY):
+            return result[1]
+    return search(user_question)
+
+def fill_prefetched(question_id, retrieve_data):
+    """
+    stream_chat 时检索结果尚未入库：等待在途预取（共最多 STREAM_WAIT_TIMEOUT 秒），
+    已完成的结果补入检索数据并入库，未完成的保持为空
+    """
+    if prefetch is None:
+        return retrieve_data
+    deadline = time.monotonic() + PrefetchConfig.STREAM_WAIT_TIMEOUT
+    filled, category_id = {}, None
+    if not retrieve_data["knowledge_search_result"]:
+        result = prefetch.result(question_id, "knowledge", deadline - time.monotonic())
+        if result is not None and result[0] == STATUS_OK and result[1][0]:
+            item = result[1][1]
+            filled["knowledge_search_result"] = item.items_json if item else json.dumps([])
+            category_id = item.id if item else None
+    if not retrieve_data["web_search_result"]:
+        result = prefetch.result(question_id, "web", deadline - time.monotonic())
+        if result is not None and result[0] == STATUS_OK:
+            filled["web_search_result"] = dumps(result[1]).decode("utf-8")
+    if not filled:
+        return retrieve_data
+    add_retrieve_results(question_id, filled, category_id)
+    return {**retrieve_data, **filled}
+
 @app.route("/knowledge_search", methods=["POST"])
 def knowledge_search():
     session_id = request.cookies.get('session_id')
     if not session_id:
-        return error_response("Session ID not found")
+        return error_response("Session ID not found", code=HTTPStatus.BAD_REQUEST)
 
     data = request.json
     question_id = data.get("question_id")
     success, msg = get_question_by_id(question_id)
-    if not success:
-        return error_response(msg)
+    if not success or not msg:
+        return error_response("Question not found", code=HTTPStatus.NOT_FOUND)
     user_question = json.loads(msg.content)["user_question"]
 
-    # 意图识别
-    completion = qwen_client.chat.completions.create(
-        model="qwen-plus", 
-        messages=[
-            {'role': 'system', 'content': '你需要对用户的问题进行分类，判断是否属于数学相关的问题，若是，则返回1，否则返回0'},
-            {'role': 'user', 'content': user_question}
-            ]
-    )
-    console.print(f"[yellow](func: knowledge_search)[yellow] [green]意图识别结果:{completion.choices[0].message.content}[/green] ")
-    if completion.choices[0].message.content != '1':
-        return error_response("No need to search")
-    
-    # 知识检索
-    completion = qwen_client.chat.completions.create(
-        model="qwen-plus", 
-        messages=[
-            {'role': 'system', 'content': '根据用户问题判断和下列哪种类别最相关，给出且仅给出一个类别id，例如：17。类别如下：' + str(knowledge_keywords)},
-            {'role': 'user', 'content': user_question}
-            ]
+    related, item = search_prefetched("knowledge", msg.id, search_knowledge, user_question)
+    if not related:
+        return error_response("No need to search", code=HTTPStatus.UNPROCESSABLE_ENTITY)
+
+    if not item:
+        add_knowledge_search_result(question_id, json.dumps([]))
+        return success_response({"type": "knowledge_search_result", "knowledge_items": []})
+
+    # 数据入库，直接复用预序列化内容；命中类别用于兜底推荐
+    with transaction():
+        add_knowledge_search_result(question_id, item.items_json, commit=False)
+        set_question_category(question_id, item.id, commit=False)
+    return raw_json_response(item.response_body, etag=item.etag)
+
+@app.route("/knowledge_items/<category_id>", methods=["GET"])
+def knowledge_item(category_id):
+    """按类别id获取知识点（响应体与 /knowledge_search 相同），内容不变时客户端 / CDN 凭 ETag 重新验证得到 304"""
+    item = knowledge_base.get(category_id)
+    if item is None:
+        return error_response("Knowledge item not found", code=HTTPStatus.NOT_FOUND)
+    response = raw_json_response(item.response_body, etag=item.etag, max_age=ResponseConfig.KNOWLEDGE_MAX_AGE)
+    return response.make_conditional(request)
+
+# 相同问题的关键词提取、相同关键词集合的搜索，并发时只调用一次上游
+web_search_flight = SingleFlight()
+
+def search_web(user_question):
+    """
+    联网搜索：返回精简后的搜索结果列表，无需搜索时返回 None
+    两级缓存：规范化问题 -> 关键词（extract_search_keywords 内），关键词集合 -> 搜索结果
+    """
+    # 用户问题关键词提取
+    console.print(f'[blue]@web_search - extract keywords[/blue]')
+    keywords = web_search_flight.do(("keywords", normalize_text(user_question)), extract_search_keywords, user_question)
+    if not keywords:
+        return None
+
+    cache_text = keyword_cache_text(keywords)
+    cached = answer_cache.get(KIND_WEB_SEARCH, cache_text)
+    if cached is not None:
+        return json.loads(cached)
+    return web_search_flight.do(("search", cache_text), fetch_web_search, keywords, cache_text)
+
+def fetch_web_search(keywords, cache_text):
+    """调用智谱 web-search-pro，结果精简后写入缓存"""
+    console.print(f'[blue]@web_search - start search[/blue]')
+    with tracer.span("web_search"):
+        resp = zhipu_upstream.post(
+            ApiKeyConfig.ZHIPU_BASE_URL,
+            json = {
+                "request_id": str(uuid.uuid4()),
+                "tool": "web-search-pro",
+                "stream": False,
+                "messages": [
+                    {
+                        "role": "user",
+                        "content": ' '.join(keywords)
+                    }
+                ]
+            },
+            headers={'Authorization': ApiKeyConfig.ZHIPU_API_KEY}
+        )
+
+    results = compact_results(
+        json.loads(resp.content.decode())["choices"][0]["message"]["tool_calls"][1]["search_result"],
+        WebSearchConfig.MAX_RESULTS,
+        WebSearchConfig.CONTENT_MAX_CHARS,
     )
-    console.print(f"[yellow](func: knowledge_search)[yellow] [green]类别id:{completion.choices[0].message.content}[/green] ")
-    category_id = completion.choices[0].message.content
-    for item in knowledge_data:
-        if str(item['id']) == str(category_id):
-            res = []
-            res.append({
-                "title": item.get("title", ""),  # 如果没有找到 "title"，返回空字符串
-                "content": {
-                    "basic_concept": item.get("content", {}).get("basic_concept", ""),
-                    "basic_operation": item.get("content", {}).get("basic_operation", ""),
-                    "common_theorems": item.get("content", {}).get("common_theorems", ""),
-                    "example_problems": item.get("content", {}).get("example_problems", ""),
-                    "solving_tips": item.get("content", {}).get("solving_tips", "")
-                }
-            })
-
-    # TODO: 数据入库
-    add_knowledge_search_result(question_id, json.dumps(res))
-    return success_response({"type": "knowledge_search_result", "knowledge_items": res})
+    answer_cache.put(KIND_WEB_SEARCH, cache_text, json.dumps(results, ensure_ascii=False), ttl=WebSearchConfig.CACHE_TTL)
+    return results
 
 @app.route("/web_search", methods=["POST"])
 def web_search():
     session_id = request.cookies.get('session_id')
     if not session_id:
-        return error_response("Session ID not found")
+        return error_response("Session ID not found", code=HTTPStatus.BAD_REQUEST)
     
     data = request.json
     question_id = data.get("question_id")
     success, msg = get_question_by_id(question_id)
 
-    if not success:
-        return error_response(msg)
+    if not success or not msg:
+        return error_response("Question not found", code=HTTPStatus.NOT_FOUND)
     
     user_question = json.loads(msg.content)["user_question"]
 
-    # 用户问题关键词提取
-    console.print(f'[blue]@web_search - extract keywords[/blue]')
-    keywords = extract_search_keywords(user_question)
-    if not keywords:
-        return error_response("No need to search")
-    
+    search_res = search_prefetched("web", msg.id, search_web, user_question)
+    if search_res is None:
+        return error_response("No need to search", code=HTTPStatus.UNPROCESSABLE_ENTITY)
 
-    # 调用zhipu API 进行搜索
-    console.print(f'[blue]@web_search - start search[/blue]')
-    resp = requests.post(
-        ApiKeyConfig.ZHIPU_BASE_URL,
-        json = {
-            "request_id": str(uuid.uuid4()),
-            "tool": "web-search-pro",
-            "stream": False,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": ' '.join(keywords)
-                }
-            ]
-        },
-        headers={'Authorization': ApiKeyConfig.ZHIPU_API_KEY},
-        timeout=300
-    )
+    # 搜索结果入库（已精简为 title / content / link / media）
+    console.print(f'[blue]@web_search - save to db [/blue]')
+    search_json = dumps(search_res)
+    add_web_search_result(question_id, search_json.decode("utf-8"))
 
-    search_res = json.loads(resp.content.decode())["choices"][0]["message"]["tool_calls"][1]["search_result"]
+    return success_response({"type": "web_search_result", "web_search_items": RawJson(search_json)})
 
-    # 搜索结果入库
-    console.print(f'[blue]@web_search - save to db [/blue]')
-    # TODO: 整理搜索结果，保留关键信息
-    add_web_search_result(question_id, json.dumps(search_res))
 
-    return success_response({"type": "web_search_result", "web_search_items": search_res})
+def knowledge_documents(snapshot):
+    """知识库按知识点字段拆分为 RAG 文档"""
+    return [
+        {"key": f"knowledge:{item.id}:{field}", "title": item.title, "text": item.content[field], "source": "knowledge"}
+        for item in snapshot.items.values()
+        for field in RESPONSE_FIELDS
+        if item.content[field]
+    ]
+
+
+def answer_documents(question_id, content, answer, summary=None):
+    """已回答的问题（回答与总结）转换为 RAG 文档"""
+    title = json.loads(content).get("user_question") or ""
+    documents = [{"key": f"answer:{question_id}", "title": title, "text": answer, "source": "answer"}]
+    if summary:
+        documents.append({"key": f"summary:{question_id}", "title": title, "text": summary, "source": "summary"})
+    return documents
+
 
+def add_rag_documents(documents):
+    return rag_index.add(documents, RagConfig.CHUNK_CHARS, RagConfig.CHUNK_OVERLAP)
+
+
+# 本地向量索引：多进程共享同一份 memmap 文件，索引为空时由 create_app 导入知识库
+rag_index = RagIndex(RagConfig.INDEX_DIR, HashingEmbedder(RagConfig.DIM), nprobe=RagConfig.IVF_NPROBE)
+
+
+def search_rag(user_question):
+    """RAG 检索：返回相似片段列表，无相关片段时返回 None"""
+    with tracer.span("rag_search"):
+        results = rag_index.search(user_question, RagConfig.TOP_K, RagConfig.MIN_SCORE)
+    if not results:
+        return None
+    return [
+        {"title": result["title"], "content": result["content"], "source": result["source"], "score": result["score"]}
+        for result in results
+    ]
 
 @app.route("/rag_search", methods=["POST"])
 def rag_search():
     session_id = request.cookies.get('session_id')
     if not session_id:
-        return error_response("Session ID not found")
+        return error_response("Session ID not found", code=HTTPStatus.BAD_REQUEST)
 
     data = request.json
     question_id = data.get("question_id")
     success, msg = get_question_by_id(question_id)
+    if not success or not msg:
+        return error_response("Question not found", code=HTTPStatus.NOT_FOUND)
+
+    user_question = json.loads(msg.content)["user_question"]
 
     # rag 搜索
-    # TODO: rag 搜索，基于rag-agent
+    console.print(f'[blue]@rag_search - search local index[/blue]')
+    rag_items = search_rag(user_question) or []
 
-    # TODO: 搜索结果入库
-    pass
+    # 搜索结果入库
+    rag_json = dumps(rag_items)
+    add_rag_result(question_id, rag_json.decode("utf-8"))
 
+    return success_response({"type": "rag_search_result", "rag_items": RawJson(rag_json)})
 
-# 后台进程：对话总结
-def background_summary(question_id, full_response):
-    response = qwen_client.chat.completions.create(
-        model="qwen-plus", 
-        messages=[
-            {'role': 'system', 'content': 'summarize the following text into a concise summary, without repeating the text'},
-            {'role': 'user', 'content': full_response}],
-    )
-        
-    summary = response.choices[0].message.content if response.choices else "No response"
-    console.print(f'[purple](back func: background_summary)[/purple] [italic green]summary_result: {summary}[/italic green]')
 
-    try:
-        with app.app_context():
-            add_question_summary(question_id, summary)
-        console.print(f"[purple](back func: background_summary)Summary saved successfully[/purple]")
-    except Exception as e:
-        console.print(f"[red]Error submitting background task: {e}[/red]")
+# 对话总结：由 worker.py 从任务队列中批量处理
+SUMMARY_PROMPT = 'summarize the following text into a concise summary, without repeating the text'
+BATCH_SUMMARY_PROMPT = (
+    'summarize each of the following texts into a concise summary, without repeating the text. '
+    'The texts are given as a JSON array; return only a JSON array of summaries in the same order.'
+)
+
+def summarize_answers(texts):
+    """
+    批量总结回答，多段文本合并为一次 LLM 调用
+    :param texts: 回答列表
+    :return: 与输入等长的总结列表
+    """
+    summaries = [answer_cache.get(KIND_SUMMARY, normalize_text(text)) for text in texts]
+    pending = [index for index, summary in enumerate(summaries) if summary is None]
+
+    if len(pending) > 1:
+        batch_input = json.dumps([texts[index] for index in pending], ensure_ascii=False)
+        response = routed_chat(
+            TASK_SUMMARY,
+            [
+                {'role': 'system', 'content': BATCH_SUMMARY_PROMPT},
+                {'role': 'user', 'content': batch_input}],
+            batch_input,
+        )
+        try:
+            batch = json.loads(response.choices[0].message.content)
+        except (ValueError, IndexError, TypeError):
+            batch = None
+        # 数量不一致时回退到逐条总结
+        if isinstance(batch, list) and len(batch) == len(pending):
+            for index, summary in zip(pending, batch):
+                summaries[index] = str(summary)
+            pending = []
+
+    for index in pending:
+        response = routed_chat(
+            TASK_SUMMARY,
+            [
+                {'role': 'system', 'content': SUMMARY_PROMPT},
+                {'role': 'user', 'content': texts[index]}],
+            texts[index],
+        )
+        summaries[index] = response.choices[0].message.content if response.choices else "No response"
+
+    for text, summary in zip(texts, summaries):
+        answer_cache.put(KIND_SUMMARY, normalize_text(text), summary)
+    console.print(f'[purple](func: summarize_answers)[/purple] [italic green]{len(texts)} summaries[/italic green]')
+    return summaries
 
 
 @app.route("/stream_chat", methods=["POST"])
 def stream_chat():
     session_id = request.cookies.get('session_id')
     if not session_id:
-        return error_response("Session ID not found")
+        return error_response("Session ID not found", code=HTTPStatus.BAD_REQUEST)
 
     data = request.json
     question_id = data.get("question_id")
-    success, msg = get_question_by_id(question_id)
+
+    # 问题与检索数据单次查询获取
+    console.print(f'[blue]@stream_chat - get retrieve data[/blue]')
+    with tracer.span("db_lookup"):
+        success, msg = get_question_with_results(question_id)
     if not success:
-        return error_response(msg)
+        return error_response(msg, code=HTTPStatus.NOT_FOUND)
 
-    user_input = json.loads(msg.content)
+    question, retrieve_data = msg
+    user_input = json.loads(question.content)
+    retrieve_data = fill_prefetched(question.id, retrieve_data)
+    console.print(f"[green]retrieve data:[/green]")
+    console.print(f"[green]web_search_result: {retrieve_data['web_search_result'][:25]}...[/green]")
+    console.print(f"[green]rag_result: {retrieve_data['rag_result'][:25]}...[/green]")
+    console.print(f"[green]knowledge_search_result: {retrieve_data['knowledge_search_result'][:25]}...[/green]")
 
-    # 获取retrieve 数据
-    console.print(f'[blue]@stream_chat - get retrieve data[/blue]')
-    success, retrieve_data = get_retrieve_data(question_id)
-    if success:
-        console.print(f"[green]retrieve data:[/green]")
-        console.print(f"[green]web_search_result: {retrieve_data['web_search_result'][:25]}...[/green]")
-        console.print(f"[green]rag_result: {retrieve_data['rag_result'][:25]}...[/green]")
-        console.print(f"[green]knowledge_search_result: {retrieve_data['knowledge_search_result'][:25]}...[/green]")
-    else:
-        console.print(f"[red]Failed to retrieve data for question_id: {question_id}[/red]")
+    return stream_answer(session_id, question_id, user_input, retrieve_data, stream_formatter(data))
 
-    # 构建消息列表
-    messages = []
 
-    messages.append({
-        "role": "system",
-        "content": """
-        你是一个智能助手，你需要参考引用内容首先进行引用内容的思考（需要给出参考的具体引用），然后对用户的问题进行回答。
-        """
-    })
+def stream_formatter(data):
+    """根据请求体 format 字段或 Accept 头选择 text/plain 或 SSE 输出"""
+    return StreamFormatter(wants_sse(request.headers.get("Accept"), data.get("format")))
+
+
+@app.route("/stream_chat/resume", methods=["POST"])
+def stream_chat_resume():
+    """按字节偏移续传回答；回答仍在生成时持续跟进检查点直到结束"""
+    session_id = request.cookies.get('session_id')
+    if not session_id:
+        return error_response("Session ID not found", code=HTTPStatus.BAD_REQUEST)
+
+    data = request.json
+    question_id = data.get("question_id")
+    # SSE 重连时浏览器自动携带 Last-Event-ID，即已收到的字节偏移
+    try:
+        offset = int(request.headers.get("Last-Event-ID") or data.get("offset") or 0)
+    except (TypeError, ValueError):
+        offset = -1
+    if offset < 0:
+        return error_response("Invalid offset", code=HTTPStatus.BAD_REQUEST)
+    success, question = get_question_by_id(question_id)
+    if not success or not question or question.session_id != session_id:
+        return error_response("Question not found", code=HTTPStatus.NOT_FOUND)
+    if question.answer_status is None:
+        return error_response("Answer not started", code=HTTPStatus.CONFLICT)
+
+    formatter = stream_formatter(data)
+    answer, status = question.answer or "", question.answer_status
+
+    def generate():
+        nonlocal answer, status
+        position = offset
+        deadline = time.monotonic() + StreamConfig.RESUME_TIMEOUT
+        while True:
+            text, end = slice_from_offset(answer, position)
+            if text:
+                yield formatter.chunk(text, end)
+            position = max(position, end)
+            if status != ANSWER_STREAMING or time.monotonic() > deadline:
+                break
+            time.sleep(StreamConfig.RESUME_POLL_INTERVAL)
+            with app.app_context():
+                success, state = get_answer_state(question_id)
+            if not success:
+                break
+            answer, status = state
+        yield formatter.end(status, position)
+
+    return Response(generate(), content_type=formatter.content_type)
+
+
+def build_agent_prompt(user_input, references='', history=''):
+    """构建智能体输入，引用内容非空时置于问题之前，本地多轮上下文置于最前"""
+    prompt = '{user_question} {ocr_msg}'.format(user_question=user_input.get("user_question"), ocr_msg=user_input.get("ocr_msg"))
+    if references and PromptConfig.AGENT_INCLUDE_REFERENCES:
+        prompt = '引用内容：\n{references}\n\n问题：{prompt}'.format(references=references, prompt=prompt)
+    if history:
+        prompt = '历史对话：\n{history}\n\n{prompt}'.format(history=history, prompt=prompt)
+    return prompt
+
+
+def prepare_agent_prompt(question_id, user_input, retrieve_data, history=''):
+    """在 token 预算内整理检索结果并构建智能体输入，返回 (prompt, references, prompt_tokens)"""
+    references, stats = build_references(
+        retrieve_data,
+        user_input.get("user_question"),
+        PromptConfig.CONTEXT_TOKEN_BUDGET,
+        PromptConfig.SNIPPET_MAX_TOKENS,
+    )
+    prompt = build_agent_prompt(user_input, references, history)
+    prompt_tokens = estimate_tokens(prompt)
+    console.print(f'[blue]@stream_chat - prompt size[/blue] question_id={question_id} prompt_tokens={prompt_tokens} references={stats.as_dict()}')
+    return prompt, references, prompt_tokens
+
+
+def conversation_context(session_id, question_id):
+    """
+    多轮上下文，返回 (api_session_id, history)
+    - 默认沿用智能体远端会话：api_session_id 取自会话历史缓存
+    - LOCAL_CONTEXT 开启时由缓存的历史总结构建本地上下文，不传远端会话，每轮输入长度受 token 预算限制
+    """
+    if not ConversationConfig.LOCAL_CONTEXT:
+        return conversation_cache.api_session_id(session_id), ''
+    turns = conversation_cache.history(session_id, question_id)
+    return None, build_history_prompt(turns, ConversationConfig.CONTEXT_TOKEN_BUDGET, estimate_tokens)
+
+
+def save_answer(session_id, question_id, full_response, api_session_id=None, prompt_tokens=None, status=ANSWER_DONE, question=None):
+    """回答、API 会话与总结任务在同一事务中入库，提交后同步更新会话历史缓存"""
+    with tracer.span("db_commit"), transaction():
+        add_question_answer(question_id, full_response, commit=False, prompt_tokens=prompt_tokens, status=status)
+        if api_session_id:
+            create_apisession(session_id, api_session_id, commit=False)
+        # 后台进程：对话总结与推荐问题（仅入队，由 worker 处理）；未完整结束的回答不处理
+        if full_response and status == ANSWER_DONE and JobConfig.SUMMARY_ENABLED:
+            enqueue_job(JOB_SUMMARY, {"question_id": int(question_id)}, max_attempts=JobConfig.MAX_ATTEMPTS, commit=False)
+        if full_response and status == ANSWER_DONE and RecommendConfig.ASYNC_ENABLED:
+            enqueue_job(JOB_RECOMMEND, {"question_id": int(question_id)}, max_attempts=JobConfig.MAX_ATTEMPTS, commit=False)
+    if full_response and question is not None:
+        conversation_cache.record_answer(session_id, int(question_id), question, full_response, api_session_id)
+
+
+def open_answer_recorder(session_id, question_id):
+    """标记回答开始生成，返回带检查点的回答缓冲；检查点经 write-behind 队列写入"""
+    begin_answer(question_id)
+
+    def checkpoint(text, api_session_id):
+        with app.app_context():
+            enqueue_write(checkpoint_answer, question_id, text)
+            if api_session_id:
+                # api_session_id 尽早入库，断开后下一轮对话仍可延续上下文
+                enqueue_write(create_apisession, session_id, api_session_id)
+
+    return AnswerRecorder(checkpoint, StreamConfig.CHECKPOINT_CHUNKS, StreamConfig.CHECKPOINT_INTERVAL)
+
+
+def finish_answer(session_id, question_id, recorder, status, prompt_tokens, cache_text=None, question=None):
+    """流结束：完整回答写入缓存，回答与状态入库"""
+    full_response = recorder.text()
+    if cache_text is not None and status == ANSWER_DONE and full_response:
+        answer_cache.put(KIND_STREAM_CHAT, cache_text, full_response)
+    with app.app_context():
+        save_answer(session_id, question_id, full_response, recorder.api_session_id, prompt_tokens, status, question)
+
+
+def drain_detached_stream(responses, recorder, finish):
+    """客户端断开后在后台线程中接收剩余上游片段"""
+    status = ANSWER_INTERRUPTED
+    try:
+        for response in responses:
+            if response.status_code != HTTPStatus.OK:
+                break
+            recorder.append(response.output.text, response.output.session_id)
+        else:
+            status = ANSWER_DONE
+    except Exception as e:
+        console.print(f'[red]@stream_chat - detached stream failed: {e}[/red]')
+    responses.close()
+    finish(status)
 
-    messages.append({
-        "role": "user",
-        "content": """
-        引用内容：{json_retrieve_data}
-        1. 问题：{user_question}
-        2. 图片ocr 识别结果：{ocr_msg}
-        """.format(user_question=user_input.get("user_question"), ocr_msg=user_input.get("ocr_msg"), json_retrieve_data=str(retrieve_data))
-    })
 
+def stream_answer(session_id, question_id, user_input, retrieve_data, formatter=None):
+    """调用智能体流式回答，结束后回答入库"""
+    # 多轮上下文：远端会话ID或本地历史总结（会话历史缓存命中时不查库）
+    api_session_id, history = conversation_context(session_id, question_id)
+    question = question_text(user_input)
+
+    # 整理检索结果：去重、排序、按 token 预算截断
+    agent_prompt, _, prompt_tokens = prepare_agent_prompt(question_id, user_input, retrieve_data, history)
 
     console.print(f'[blue]@stream_chat - start stream chat[/blue]')
-    # response = qwen_client.chat.completions.create(
-    #     model="qwen-plus",
-    #     messages=messages,
-    #     stream=True
-    # )
-    # def generate():
-    #     full_response = ""
-    #     for chunk in response:
-    #         if chunk.choices:
-    #             content = chunk.choices[0].delta.content
-    #             full_response += content
-    #             print(content, end='')
-    #             yield content
-
-    #     with app.app_context():
-    #         # 回答入库
-    #         console.print(f'\n[blue]@stream_chat - save to db(add_question_answer)[/blue]')
-    #         add_question_answer(question_id, full_response)
-
-    #         # 后台进程：对话总结
-    #         console.print(f'\n[blue]@stream_chat - start background summary[/blue]')
-    #         executor.submit(background_summary, question_id, full_response)
-
-    # 获取api_session_id
-    success, api_session_id = get_apisession(session_id)
+
+    # 回答缓存：命中时按片段回放，客户端无感知
+    cacheable = not ((api_session_id or history) and CacheConfig.STREAM_FIRST_TURN_ONLY)
+    cache_text = question_cache_text(user_input)
+    cached_answer = answer_cache.get(KIND_STREAM_CHAT, cache_text) if cacheable else None
+    formatter = formatter or StreamFormatter()
+    if cached_answer is not None:
+        console.print(f'[blue]@stream_chat - answer cache hit[/blue]')
+
+        def generate_cached():
+            recorder = AnswerRecorder()
+            for chunk in replay_chunks(cached_answer):
+                yield formatter.chunk(chunk, recorder.append(chunk))
+            with app.app_context():
+                save_answer(session_id, question_id, cached_answer, prompt_tokens=0, question=question)
+            yield formatter.end(ANSWER_DONE, recorder.offset)
+
+        return Response(generate_cached(), content_type=formatter.content_type)
+
     if not api_session_id:
         # 第一次对话
-        responses = Application.call(
+        responses = dashscope_upstream.stream(
+                dashscope_application.get().call,
                 api_key=ApiKeyConfig.DASHSCOPE_API_KEY, 
                 app_id=ApiKeyConfig.LONG_SESSION_AGENT_ID,
-                prompt='{user_question} {ocr_msg}'.format(user_question=user_input.get("user_question"), ocr_msg=user_input.get("ocr_msg")),
+                prompt=agent_prompt,
                 stream=True,  # 流式输出
                 incremental_output=True)  # 增量输出
     else:
         # 后续对话，需传入api_session_id
-        responses = Application.call(
+        responses = dashscope_upstream.stream(
+                dashscope_application.get().call,
                 api_key=ApiKeyConfig.DASHSCOPE_API_KEY, 
                 app_id=ApiKeyConfig.LONG_SESSION_AGENT_ID,
-                prompt='{user_question} {ocr_msg}'.format(user_question=user_input.get("user_question"), ocr_msg=user_input.get("ocr_msg")),
+                prompt=agent_prompt,
                 session_id = api_session_id,
                 stream=True,  # 流式输出
                 incremental_output=True)  # 增量输出
 
+    recorder = open_answer_recorder(session_id, question_id)
+    # 追踪延后到流结束：首 token 耗时、流总耗时与入库耗时计入同一条追踪
+    trace = tracer.current()
+    if trace is not None:
+        trace.deferred = True
+    stream_start = time.perf_counter()
+
+    def finish(status):
+        # 完整结束的回答写入缓存，回答入库
+        console.print(f'\n[blue]@stream_chat - save to db(add_question_answer)[/blue] status={status}')
+        with tracer.activate(trace):
+            tracer.record("stream_total", time.perf_counter() - stream_start, status=status)
+            finish_answer(session_id, question_id, recorder, status, prompt_tokens, cache_text if cacheable else None, question)
+        if trace is not None:
+            tracer.finish(trace, answer_status=status, answer_bytes=recorder.offset)
+
+    def detach():
+        # 客户端断开：继续在后台接收，或按已接收部分入库
+        if StreamConfig.CONTINUE_ON_DISCONNECT:
+            console.print(f'[yellow]@stream_chat - client disconnected, continue in background[/yellow]')
+            stream_executor.submit(drain_detached_stream, responses, recorder, finish)
+        else:
+            responses.close()
+            finish(ANSWER_INTERRUPTED)
+
+    started = False
+
     def generate():
-        full_response = ""
-        for response in responses:
-            if response.status_code != HTTPStatus.OK:
-                break
-            else:
+        nonlocal started
+        started = True
+        status = ANSWER_INTERRUPTED
+        try:
+            for response in responses:
+                if response.status_code != HTTPStatus.OK:
+                    break
                 content = response.output.text
-                full_response += content
-                # print(content, end='')
-                yield content
+                if not recorder.offset and content:
+                    tracer.record("first_token", time.perf_counter() - stream_start, trace)
+                # 片段追加到缓冲并按需写入检查点
+                yield formatter.chunk(content, recorder.append(content, response.output.session_id))
+            else:
+                status = ANSWER_DONE
+        except GeneratorExit:
+            detach()
+            return
+        except Exception:
+            responses.close()
+            finish(ANSWER_INTERRUPTED)
+            raise
+
+        # 释放上游并发配额
+        responses.close()
+        finish(status)
+        yield formatter.end(status, recorder.offset)
+
+    response = Response(generate(), content_type=formatter.content_type)
+    # 首个片段前断开时生成器从未执行（不会收到 GeneratorExit），关闭响应时兜底，避免回答停留在 streaming
+    response.call_on_close(lambda: started or detach())
+    return response
+
+@app.route("/retrieve", methods=["POST"])
+def retrieve():
+    """并发执行知识检索、联网搜索与 RAG 检索，可选直接进入流式回答"""
+    session_id = request.cookies.get('session_id')
+    if not session_id:
+        return error_response("Session ID not found", code=HTTPStatus.BAD_REQUEST)
 
-        # 保持上下文
-        with app.app_context():
-            # TODO: 结果入库
-            console.print(f'\n[blue]@stream_chat - save to db(add_question_answer)[/blue]')
-            add_question_answer(question_id, full_response)
-            api_session_id = response.output.session_id
-            create_apisession(session_id, api_session_id)
+    data = request.json
+    question_id = data.get("question_id")
+    success, msg = get_question_by_id(question_id)
+    if not success or not msg:
+        return error_response("Question not found", code=HTTPStatus.NOT_FOUND)
+
+    user_input = json.loads(msg.content)
+    user_question = user_input["user_question"]
+
+    # 并发检索，总耗时取决于最慢且未超时的数据源
+    console.print(f'[blue]@retrieve - fan out[/blue]')
+    results = fan_out(retrieve_executor, {
+        "knowledge": (search_prefetched, ("knowledge", msg.id, search_knowledge, user_question), RetrieveConfig.KNOWLEDGE_TIMEOUT),
+        "web": (search_prefetched, ("web", msg.id, search_web, user_question), RetrieveConfig.WEB_TIMEOUT),
+        "rag": (search_rag, (user_question,), RetrieveConfig.RAG_TIMEOUT),
+    })
+    status = {name: result[0] for name, result in results.items()}
+    console.print(f'[blue]@retrieve - status: {status}[/blue]')
+
+    # 整理已完成的结果
+    knowledge_items, web_search_items, rag_items, category_id = None, None, None, None
+    retrieve_data = {"web_search_result": '', "rag_result": '', "knowledge_search_result": ''}
+
+    knowledge_status, knowledge_value = results["knowledge"]
+    if knowledge_status == STATUS_OK:
+        related, item = knowledge_value
+        if related:
+            retrieve_data["knowledge_search_result"] = item.items_json if item else "[]"
+            knowledge_items = RawJson(retrieve_data["knowledge_search_result"])
+            category_id = item.id if item else None
+        else:
+            status["knowledge"] = STATUS_EMPTY
+
+    web_status, web_value = results["web"]
+    if web_status == STATUS_OK:
+        retrieve_data["web_search_result"] = dumps(web_value).decode("utf-8")
+        web_search_items = RawJson(retrieve_data["web_search_result"])
+
+    rag_status, rag_value = results["rag"]
+    if rag_status == STATUS_OK:
+        retrieve_data["rag_result"] = dumps(rag_value).decode("utf-8")
+        rag_items = RawJson(retrieve_data["rag_result"])
+
+    # 已完成的结果在同一事务中入库
+    success, msg = add_retrieve_results(question_id, retrieve_data, category_id)
+    if not success:
+        return error_response(msg)
+
+    if data.get("stream"):
+        return stream_answer(session_id, question_id, user_input, retrieve_data, stream_formatter(data))
+
+    return success_response({
+        "type": "retrieve_result",
+        "status": status,
+        "knowledge_items": knowledge_items,
+        "web_search_items": web_search_items,
+        "rag_items": rag_items,
+    })
+
+RECOMMEND_PROMPT = '根据文本推荐3个与中学数学相关的问题，每个问题不超过15个字，只返回JSON数组。示例：["如何解一元二次方程？","一元二次方程的判别式是什么？","如何求二次函数的顶点？"]'
+BATCH_RECOMMEND_PROMPT = (
+    '对下列每段文本分别推荐3个与中学数学相关的问题，每个问题不超过15个字。'
+    '文本以JSON数组给出，只返回与输入顺序一致的JSON数组，每个元素为3个问题组成的数组。'
+)
+
+
+def parse_recommendations(content):
+    """解析推荐结果，格式不正确时返回 None"""
+    try:
+        items = json.loads(content)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(items, list) or not all(isinstance(item, str) for item in items):
+        return None
+    return items
+
+
+def recommend_questions(texts):
+    """
+    批量生成推荐问题，多段文本合并为一次 LLM 调用
+    :param texts: 回答列表
+    :return: 与输入等长的推荐列表（JSON 数组字符串），生成失败的为 None
+    """
+    results = [answer_cache.get(KIND_RECOMMEND, normalize_text(text)) for text in texts]
+    pending = [index for index, result in enumerate(results) if result is None]
+
+    if len(pending) > 1:
+        batch_input = json.dumps([texts[index] for index in pending], ensure_ascii=False)
+        response = routed_chat(
+            TASK_RECOMMEND,
+            [
+                {'role': 'system', 'content': BATCH_RECOMMEND_PROMPT},
+                {'role': 'user', 'content': batch_input}],
+            batch_input,
+        )
+        try:
+            batch = json.loads(response.choices[0].message.content)
+        except (ValueError, IndexError, TypeError):
+            batch = None
+        # 数量不一致时回退到逐条生成
+        if isinstance(batch, list) and len(batch) == len(pending):
+            for index, items in zip(pending, batch):
+                if isinstance(items, list):
+                    results[index] = json.dumps([str(item) for item in items], ensure_ascii=False)
+            pending = [index for index in pending if results[index] is None]
+
+    for index in pending:
+        response = routed_chat(
+            TASK_RECOMMEND,
+            [
+                {'role': 'system', 'content': RECOMMEND_PROMPT},
+                {'role': 'user', 'content': f"text: {texts[index]}"}],
+            texts[index],
+        )
+        content = response.choices[0].message.content if response.choices else None
+        items = parse_recommendations(content)
+        results[index] = json.dumps(items, ensure_ascii=False) if items is not None else None
+
+    for text, result in zip(texts, results):
+        if result is not None:
+            answer_cache.put(KIND_RECOMMEND, normalize_text(text), result)
+    console.print(f'[purple](func: recommend_questions)[/purple] [italic green]{len(texts)} recommendations[/italic green]')
+    return results
+
+
+def load_category_history():
+    success, rows = get_category_history(RecommendConfig.HISTORY_LIMIT)
+    return [(session_id, category_id, json.loads(content).get("user_question")) for session_id, category_id, content in rows]
+
+
+_fallback_recommender = None
+
+def fallback_recommender():
+    """兜底推荐器，知识库热加载后随快照重建"""
+    global _fallback_recommender
+    snapshot = knowledge_base.snapshot
+    recommender = _fallback_recommender
+    if recommender is None or recommender.snapshot is not snapshot:
+        recommender = _fallback_recommender = CooccurrenceRecommender(
+            snapshot, load_category_history, RecommendConfig.HISTORY_REFRESH_INTERVAL
+        )
+    return recommender
 
-    return Response(generate(), content_type="text/plain")
 
 @app.route("/recommend", methods=["POST"])
 def recommend():
+    """读取 worker 预先生成的推荐问题，尚未生成时使用类别共现兜底推荐（不调用 LLM）"""
     session_id = request.cookies.get('session_id')
     if not session_id:
-        return error_response("Session ID not found")
+        return error_response("Session ID not found", code=HTTPStatus.BAD_REQUEST)
 
     data = request.json
     question_id = data.get("question_id")
-    success, msg = get_question_by_id(question_id)
-    if not success:
-        return error_response(msg)
+    success, question = get_question_by_id(question_id)
+    if not success or not question:
+        return error_response("Question not found", code=HTTPStatus.NOT_FOUND)
 
-    success, text = get_answer_by_question_id(question_id)
+    items = parse_recommendations(question.recommendations) if question.recommendations else None
+    source = "llm"
+    if items is None:
+        source = "fallback"
+        user_question = json.loads(question.content).get("user_question") or ""
+        with tracer.span("recommend_fallback"):
+            items = fallback_recommender().recommend(user_question, question.category_id)
 
+    console.print(f'[blue]@recommend - recommend result ({source}): [/blue]{items}')
+    return success_response({"recommend_items": items, "source": source})
 
-    console.print(f'[blue]@recommend - start recommend[/blue] base_text: {text[:20]}...')
 
+@app.route("/job_stats", methods=["GET"])
+def job_stats():
+    success, stats = get_job_stats()
+    return success_response(stats)
 
-    response = qwen_client.chat.completions.create(
-        model="qwen-max",
-        messages=[
-            {
-            "role": "system",
-            "content": '根据文本推荐3个与中学数学相关的问题，每个问题不超过15个字，只返回JSON数组。示例：["如何解一元二次方程？","一元二次方程的判别式是什么？","如何求二次函数的顶点？"]'
-            },
-            {"role": "user", "content": f"text: {text}"}
-        ],
-    )
-    # 提取响应内容
-    content = response.choices[0].message.content if response.choices else "No response"
-    
-    console.print(f'[blue]@recommend - recommend result: [/blue]{json.loads(content)}')
 
-    return success_response({"recommend_items": json.loads(content)})
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus 文本格式的延迟直方图"""
+    return Response(tracer.registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
 
-def read_json_file(file_path):
-    with open(file_path, 'r', encoding='utf-8') as file:
-        data = json.load(file)  # 加载 JSON 数据
-    return data
+@app.route("/cache_stats", methods=["GET"])
+def cache_stats():
+    return success_response({**answer_cache.stats(), "web_search_flight": web_search_flight.stats()})
 
-if __name__ == "__main__":
-    # 缓存加载关键词
-    knowledge_data = read_json_file('instance/knowledge.json')
-    knowledge_keywords = []
-    for item in knowledge_data:
-        knowledge_keywords.append({
-            'id': item['id'],
-            'keyword': item['title']
-        })
 
-    init_db(app)
-    app.run(debug=True)
\ No newline at end of file
+@app.route("/rag_stats", methods=["GET"])
+def rag_stats():
+    return success_response(rag_index.stats())
+
+
+@app.route("/admission_stats", methods=["GET"])
+def admission_stats():
+    return success_response(admission.stats() if admission is not None else None)
+
+
+@app.route("/model_stats", methods=["GET"])
+def model_stats():
+    """各模型 / 任务的调用次数、延迟、错误率与 token 用量，以及路由选择分布"""
+    return success_response(model_router.stats())
+
+
+@app.route("/prefetch_stats", methods=["GET"])
+def prefetch_stats():
+    return success_response(prefetch.stats() if prefetch is not None else None)
+
+
+@app.route("/conversation_stats", methods=["GET"])
+def conversation_stats():
+    return success_response(conversation_cache.stats())
+
+
+@app.route("/response_stats", methods=["GET"])
+def response_stats():
+    return success_response(compressor.stats() if compressor is not None else None)
+
+
+def preload():
+    """预加载只读数据：知识库索引、兜底推荐器，RAG 索引为空时导入知识库"""
+    snapshot = knowledge_base.snapshot
+    if not rag_index.available:
+        console.print('[yellow]@rag - numpy not installed, RAG search disabled[/yellow]')
+    elif RagConfig.AUTO_BUILD and not len(rag_index):
+        console.print(f'[blue]@rag - indexed {add_rag_documents(knowledge_documents(snapshot))} knowledge chunks[/blue]')
+    fallback_recommender()
+
+
+def preload_sdks():
+    """预先导入上游 SDK（只导入模块，不创建客户端与连接池）"""
+    import openai  # noqa: F401
+    dashscope_application.get()
+
+
+def create_app(preload_data=True, import_sdks=False):
+    """
+    应用工厂（可重复调用）：初始化数据库与非关键写入队列，预加载只读数据
+    gunicorn preload_app 时在 master 中执行一次，worker fork 后写时复制共享预加载的数据与已导入的模块
+    :param import_sdks: 同时预先导入上游 SDK；单进程部署保持默认，由首次调用时导入
+    """
+    if "sqlalchemy" not in app.extensions:
+        init_db(app)
+    init_write_behind(app, log=lambda message: console.print(f"[red]{message}[/red]"))
+    if ArchiveConfig.DIR:
+        init_archive(ArchiveReader(ArchiveConfig.DIR, reload_interval=ArchiveConfig.RELOAD_INTERVAL))
+    if preload_data:
+        preload()
+    if import_sdks:
+        preload_sdks()
+    if preload_data or import_sdks:
+        # 预加载对象移出 GC 跟踪，避免 worker 中的垃圾回收改写共享页
+        gc.freeze()
+    return app
+
+
+if __name__ == "__main__":
+    create_app()
+    app.run(debug=True)
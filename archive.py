@@ -0,0 +1,100 @@
+# archive.py
+"""
+分层保留：将长期不活跃的会话移入压缩冷存储
+
+archive（默认）：选出最后一次提问早于 --idle-days 天的会话，每批 --batch-size 个会话：
+读取问题与全部检索结果 -> 写入归档段（zstd / gzip 压缩的 JSONL，按块压缩，边车索引记录
+session_id / 问题id -> 块位置）并落盘 -> 在一个事务中从 questions 与各检索结果表删除。
+sessions 与 api_sessions 保留（体积很小，老会话仍可继续提问）。
+已归档的会话仍可通过 db.py 的 getter 按需读取（Web 进程由 create_app 启用归档读取）。
+写入段文件后、删除前中断时，下次运行会重复归档同一会话，读取时按问题id去重。
+--vacuum：归档后回收数据库空间（SQLite 缩小文件，期间会锁库，宜在低峰执行）。
+
+stats：归档段、块、会话与问题数。
+show：按 session_id 打印已归档的问题。
+
+用法：
+    python archive.py [--idle-days 90] [--batch-size 200] [--vacuum]
+    python archive.py stats
+    python archive.py show <session_id>
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+from config import ArchiveConfig
+from utils.archive import ArchiveReader, SegmentWriter, resolve_codec
+
+
+def archive_sessions(directory, idle_days, batch_size, codec, block_bytes, segment_max_bytes, log=print):
+    """归档不活跃的会话，返回 SegmentWriter（含归档的会话数、问题数与压缩前后字节数）"""
+    from db import delete_questions, get_idle_sessions, get_sessions_for_archive
+
+    # created_at 以不带时区的 UTC 时间存储
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=idle_days)
+    writer = SegmentWriter(directory, codec, block_bytes=block_bytes, segment_max_bytes=segment_max_bytes)
+    after_session_id = ""
+    try:
+        while True:
+            success, session_ids = get_idle_sessions(cutoff, after_session_id, batch_size)
+            if not session_ids:
+                break
+            success, sessions = get_sessions_for_archive(session_ids)
+            for session_id in session_ids:
+                writer.write(session_id, sessions[session_id])
+            # 先落盘归档，再删除线上数据
+            writer.flush()
+            question_ids = [question["id"] for questions in sessions.values() for question in questions]
+            delete_questions(question_ids)
+            after_session_id = session_ids[-1]
+            log(f"archived {writer.sessions} session(s), {writer.questions} question(s)")
+    finally:
+        writer.close()
+    return writer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", nargs="?", choices=("archive", "stats", "show"), default="archive")
+    parser.add_argument("session_id", nargs="?", help="show 的会话ID")
+    parser.add_argument("--dir", default=ArchiveConfig.DIR, help="归档目录")
+    parser.add_argument("--idle-days", type=float, default=ArchiveConfig.IDLE_DAYS)
+    parser.add_argument("--batch-size", type=int, default=ArchiveConfig.BATCH_SIZE)
+    parser.add_argument("--codec", default=ArchiveConfig.CODEC, help="auto / zstd / gzip")
+    parser.add_argument("--vacuum", action="store_true", help="归档后回收数据库空间")
+    args = parser.parse_args()
+
+    reader = ArchiveReader(args.dir)
+    if args.command == "stats":
+        print(json.dumps(reader.stats(), indent=2))
+        return
+    if args.command == "show":
+        if not args.session_id:
+            parser.error("show requires a session_id")
+        print(json.dumps(reader.session_questions(args.session_id), ensure_ascii=False, indent=2))
+        return
+
+    from app import app
+    from db import init_db, vacuum_database
+
+    init_db(app)
+    with app.app_context():
+        codec = resolve_codec(args.codec)
+        if codec != args.codec and args.codec != "auto":
+            print(f"zstandard not installed, falling back to {codec}")
+        start = time.perf_counter()
+        writer = archive_sessions(
+            args.dir, args.idle_days, args.batch_size, codec, ArchiveConfig.BLOCK_BYTES, ArchiveConfig.SEGMENT_MAX_BYTES
+        )
+        ratio = writer.raw_bytes / writer.compressed_bytes if writer.compressed_bytes else 0
+        print(f"{writer.sessions} session(s), {writer.questions} question(s) archived as {codec} in "
+              f"{time.perf_counter() - start:.2f} s: {writer.raw_bytes} -> {writer.compressed_bytes} bytes ({ratio:.1f}x)")
+        if args.vacuum and writer.sessions:
+            start = time.perf_counter()
+            success, dialect = vacuum_database()
+            print(f"vacuum ({dialect}) in {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+ASGI 入口：/stream_chat 由异步处理器直接代理上游流，其余路由（含 /stream_chat/resume）交给 Flask
+
+启动：uvicorn asgi:application --workers 1
+"""
+import asyncio
+import json
+import time
+from contextlib import aclosing
+from http import HTTPStatus
+from http.cookies import SimpleCookie
+
+import httpx
+from asgiref.wsgi import WsgiToAsgi
+
+from app import app, create_app, admission, console, tracer, dashscope_upstream, upstream_policy, prepare_agent_prompt, conversation_context, fill_prefetched, answer_cache, save_answer, open_answer_recorder, finish_answer
+from db import get_question_with_results, ANSWER_DONE, ANSWER_INTERRUPTED
+from utils.dashscope_stream import stream_application
+from utils.answer_cache import question_cache_text, replay_chunks, KIND_STREAM_CHAT
+from utils.stream_pipeline import AnswerRecorder, StreamFormatter, wants_sse
+from utils.conversation_cache import question_text
+from utils.admission import AdmissionRejected
+from utils.upstream import UpstreamClient, UpstreamError
+from utils.result import dumps
+from config import ApiKeyConfig, AsgiConfig, CacheConfig, StreamConfig
+
+flask_app = WsgiToAsgi(app)
+http_client = None
+# 异步流的并发上限与连接池一致，熔断器与同步路由共享
+dashscope_async_upstream = UpstreamClient(
+    "dashscope", upstream_policy(AsgiConfig.UPSTREAM_READ_TIMEOUT, AsgiConfig.MAX_UPSTREAM_CONNECTIONS),
+    observe=tracer.observe_upstream, breaker=dashscope_upstream.breaker,
+)
+
+
+def get_http_client():
+    """进程内共享的上游连接池"""
+    global http_client
+    if http_client is None:
+        http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(AsgiConfig.UPSTREAM_READ_TIMEOUT, connect=AsgiConfig.UPSTREAM_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=AsgiConfig.MAX_UPSTREAM_CONNECTIONS),
+        )
+    return http_client
+
+
+def _call_in_app_context(func, *args):
+    with app.app_context():
+        return func(*args)
+
+
+async def run_db(func, *args):
+    """数据库操作放到线程中执行，不阻塞事件循环"""
+    return await asyncio.to_thread(_call_in_app_context, func, *args)
+
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def wait_disconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def send_json(send, payload, status=200, headers=()):
+    body = dumps(payload)
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"access-control-allow-origin", b"*"), *headers],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def get_cookie(scope, name):
+    for key, value in scope.get("headers", []):
+        if key == b"cookie":
+            cookie = SimpleCookie()
+            cookie.load(value.decode("latin-1"))
+            if name in cookie:
+                return cookie[name].value
+    return None
+
+
+def get_header(scope, name):
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+async def stream_chat(scope, receive, send):
+    """异步流式回答（带请求级追踪），响应头发出时记录路由延迟"""
+    trace = tracer.start("stream_chat", method="POST", transport="asgi")
+
+    async def traced_send(message):
+        if message["type"] == "http.response.start":
+            tracer.observe_request("/stream_chat", "POST", message["status"], trace.elapsed())
+        await send(message)
+
+    permit = None
+    try:
+        try:
+            permit = await admit(scope, "/stream_chat")
+        except AdmissionRejected as e:
+            return await send_json(
+                traced_send, {"code": e.status, "msg": str(e)}, e.status, [(b"retry-after", str(e.retry_after).encode("latin-1"))]
+            )
+        await _stream_chat(scope, receive, traced_send)
+    finally:
+        if permit is not None:
+            permit.release()
+        tracer.detach(trace)
+
+
+async def admit(scope, route):
+    """准入控制：有空闲配额时直接通过，需要排队时在线程中等待，不阻塞事件循环"""
+    if admission is None:
+        return None
+    admission.check_rate(route, get_cookie(scope, "session_id") or (scope.get("client") or ("",))[0])
+    permit, queued = admission.try_acquire(route)
+    if not queued:
+        return permit
+
+    def release_late(future):
+        # 排队期间客户端断开：等待线程仍会拿到配额，拿到后立即释放
+        if not future.cancelled() and future.exception() is None and future.result() is not None:
+            future.result().release()
+
+    waiter = asyncio.ensure_future(asyncio.to_thread(admission.acquire, route))
+    try:
+        return await asyncio.shield(waiter)
+    except asyncio.CancelledError:
+        waiter.add_done_callback(release_late)
+        raise
+
+
+async def _stream_chat(scope, receive, send):
+    """异步流式回答，客户端断开时取消上游调用"""
+    session_id = get_cookie(scope, "session_id")
+    if not session_id:
+        return await send_json(send, {"code": HTTPStatus.BAD_REQUEST, "msg": "Session ID not found"}, HTTPStatus.BAD_REQUEST)
+
+    body = await read_body(receive)
+    if body is None:
+        return
+    data = json.loads(body or b"{}")
+    question_id = data.get("question_id")
+    with tracer.span("db_lookup"):
+        success, msg = await run_db(get_question_with_results, question_id)
+    if not success:
+        return await send_json(send, {"code": HTTPStatus.NOT_FOUND, "msg": msg}, HTTPStatus.NOT_FOUND)
+
+    question, retrieve_data = msg
+    user_input = json.loads(question.content)
+    retrieve_data = await run_db(fill_prefetched, question.id, retrieve_data)
+    api_session_id, history = await run_db(conversation_context, session_id, question_id)
+    question = question_text(user_input)
+    agent_prompt, _, prompt_tokens = prepare_agent_prompt(question_id, user_input, retrieve_data, history)
+
+    cacheable = not ((api_session_id or history) and CacheConfig.STREAM_FIRST_TURN_ONLY)
+    cache_text = question_cache_text(user_input)
+    cached_answer = None
+    if cacheable:
+        cached_answer = await asyncio.to_thread(answer_cache.get, KIND_STREAM_CHAT, cache_text)
+
+    formatter = StreamFormatter(wants_sse(get_header(scope, b"accept"), data.get("format")))
+    console.print(f'[blue]@asgi stream_chat - start stream chat[/blue]')
+    start_message = {
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", formatter.content_type.encode("latin-1")), (b"access-control-allow-origin", b"*")],
+    }
+
+    if cached_answer is not None:
+        # 回答缓存命中：按片段回放
+        await send(start_message)
+        recorder = AnswerRecorder()
+        for chunk in replay_chunks(cached_answer):
+            body = formatter.chunk(chunk, recorder.append(chunk))
+            await send({"type": "http.response.body", "body": body.encode("utf-8"), "more_body": True})
+        await run_db(save_answer, session_id, question_id, cached_answer, None, 0, ANSWER_DONE, question)
+        await send({"type": "http.response.body", "body": formatter.end(ANSWER_DONE, recorder.offset).encode("utf-8"), "more_body": False})
+        return
+
+    # 并发已满、熔断与上游错误在开始响应前返回
+    stream_start = time.perf_counter()
+    try:
+        upstream = await dashscope_async_upstream.astream(
+            stream_application,
+            get_http_client(),
+            ApiKeyConfig.DASHSCOPE_API_KEY,
+            ApiKeyConfig.LONG_SESSION_AGENT_ID,
+            agent_prompt,
+            session_id=api_session_id,
+            base_url=ApiKeyConfig.DASHSCOPE_BASE_URL,
+        )
+    except UpstreamError as e:
+        console.print(f"[red]@asgi stream_chat - upstream error: {e}[/red]")
+        return await send_json(send, {"code": HTTPStatus.SERVICE_UNAVAILABLE, "msg": str(e)}, HTTPStatus.SERVICE_UNAVAILABLE)
+
+    try:
+        await send(start_message)
+        # 检查点经 write-behind 队列写入，不阻塞事件循环
+        recorder = await run_db(open_answer_recorder, session_id, question_id)
+    except BaseException:
+        await upstream.aclose()
+        raise
+    connected = True
+
+    async def pump():
+        async with aclosing(upstream):
+            async for text, new_session_id in upstream:
+                if text and not recorder.offset:
+                    tracer.record("first_token", time.perf_counter() - stream_start)
+                offset = recorder.append(text, new_session_id)
+                if not text or not connected:
+                    continue
+                # send 会在传输缓冲区满时挂起，上游读取随之暂停（背压）
+                await send({"type": "http.response.body", "body": formatter.chunk(text, offset).encode("utf-8"), "more_body": True})
+
+    async def finish(status):
+        tracer.record("stream_total", time.perf_counter() - stream_start, status=status)
+        await asyncio.to_thread(
+            finish_answer, session_id, question_id, recorder, status, prompt_tokens, cache_text if cacheable else None, question
+        )
+
+    pump_task = asyncio.create_task(pump())
+    disconnect_task = asyncio.create_task(wait_disconnect(receive))
+    done, _ = await asyncio.wait({pump_task, disconnect_task}, return_when=asyncio.FIRST_COMPLETED)
+
+    if disconnect_task in done:
+        connected = False
+        if StreamConfig.CONTINUE_ON_DISCONNECT:
+            # 客户端已断开：继续接收上游直到结束，完整回答入库后可续传
+            console.print(f'[yellow]@asgi stream_chat - client disconnected, continue in background[/yellow]')
+            results = await asyncio.gather(pump_task, return_exceptions=True)
+            await finish(ANSWER_INTERRUPTED if isinstance(results[0], BaseException) else ANSWER_DONE)
+        else:
+            # 取消任务即关闭上游连接，已接收部分入库
+            pump_task.cancel()
+            await asyncio.gather(pump_task, return_exceptions=True)
+            console.print(f'[yellow]@asgi stream_chat - client disconnected, upstream cancelled[/yellow]')
+            await finish(ANSWER_INTERRUPTED)
+        return
+
+    disconnect_task.cancel()
+    status = ANSWER_DONE
+    try:
+        pump_task.result()
+    except Exception as e:
+        console.print(f"[red]@asgi stream_chat - upstream error: {e}[/red]")
+        status = ANSWER_INTERRUPTED
+
+    # 回答入库后再发送结束事件，客户端收到结束即可读取
+    await finish(status)
+    await send({"type": "http.response.body", "body": formatter.end(status, recorder.offset).encode("utf-8"), "more_body": False})
+
+
+async def lifespan(receive, send):
+    global http_client
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await asyncio.to_thread(create_app)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if http_client is not None:
+                await http_client.aclose()
+                http_client = None
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+ASYNC_ROUTES = {
+    ("POST", "/stream_chat"): stream_chat,
+}
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+
+    handler = ASYNC_ROUTES.get((scope.get("method"), scope.get("path")))
+    if handler is not None:
+        return await handler(scope, receive, send)
+
+    await flask_app(scope, receive, send)
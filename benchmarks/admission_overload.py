@@ -0,0 +1,153 @@
+# benchmarks/admission_overload.py
+"""
+准入控制过载测试：并发流数远超上游容量时，对比开启 / 关闭准入控制的 /stream_chat 尾延迟
+
+模拟的智能体上游同时服务的流数超过 --agent-capacity 后所有流按比例变慢（配额耗尽）。
+- 关闭准入控制：所有请求都进入上游，每个流都变慢，p99 随并发数无界增长
+- 开启准入控制：超出 --limit 的请求在等待队列中最多等待 --queue-timeout 秒，其余立即返回 503 + Retry-After，
+  被接受的流保持正常速度
+
+每种模式在独立子进程中运行（配置在导入 app 时读取）。
+
+用法：
+    python benchmarks/admission_overload.py --concurrency 200 --duration 20 --limit 32 --agent-capacity 32
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import requests
+
+from mock_upstreams import MockProfile, add_profile_arguments, start_in_thread, upstream_env
+from suite import percentile
+
+
+def start_server(args, tmp, admission):
+    port = start_in_thread(MockProfile.from_args(args))
+    os.environ.update(upstream_env(port))
+    os.environ.update({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(tmp, 'overload.db')}",
+        "RAG_INDEX_DIR": os.path.join(tmp, "rag_index"),
+        "ANSWER_CACHE_BACKEND": "none",
+        "CONSOLE_LOG": "false",
+        "TRACE_SAMPLE_RATE": "0",
+        "JOB_SUMMARY_ENABLED": "false",
+        # 只测准入控制：放开上游客户端自身的并发配额
+        "UPSTREAM_DASHSCOPE_MAX_CONCURRENCY": "100000",
+        "ADMISSION_ENABLED": "true" if admission else "false",
+        "ADMISSION_CONCURRENCY_LIMITS": f"/stream_chat={args.limit}",
+        "ADMISSION_QUEUE_SIZE": str(args.queue_size),
+        "ADMISSION_QUEUE_TIMEOUT": str(args.queue_timeout),
+        "RATE_LIMIT_PER_SESSION": "0",
+    })
+
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    app = create_app()
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    server.socket.listen(4096)
+    threading.Thread(target=server.serve_forever, name="overload-server", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def user_loop(url, deadline, samples, timeout):
+    """单个虚拟用户：同一会话内不断提问并读取完整流；被拒绝时按 Retry-After 退避"""
+    http = requests.Session()
+    session_id = http.get(f"{url}/newchat", timeout=timeout).json()["res_data"]["session_id"]
+    http.cookies.set("session_id", session_id)
+    while time.monotonic() < deadline:
+        question_id = http.post(
+            f"{url}/new_question_id", json={"user_question": "如何解一元二次方程？", "ocr_msg": ""}, timeout=timeout
+        ).json()["res_data"]["question_id"]
+        start = time.perf_counter()
+        try:
+            with http.post(f"{url}/stream_chat", json={"question_id": question_id}, stream=True, timeout=timeout) as resp:
+                for _ in resp.iter_content(chunk_size=None):
+                    pass
+            status = resp.status_code
+            retry_after = float(resp.headers.get("Retry-After", 0))
+        except requests.RequestException:
+            status, retry_after = "error", 0
+        samples.append((status, time.perf_counter() - start))
+        if retry_after:
+            time.sleep(min(retry_after, max(0.0, deadline - time.monotonic())))
+
+
+def run_child(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        url = start_server(args, tmp, args.child == "on")
+        samples = []
+        deadline = time.monotonic() + args.duration
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            for future in [executor.submit(user_loop, url, deadline, samples, args.timeout) for _ in range(args.concurrency)]:
+                future.result()
+        wall = time.perf_counter() - start
+
+    def stats(latencies):
+        if not latencies:
+            return None
+        return {key: round(percentile(latencies, p) * 1000, 1) for key, p in (("p50_ms", 50), ("p95_ms", 95), ("p99_ms", 99))} | {
+            "max_ms": round(max(latencies) * 1000, 1)
+        }
+
+    ok = [latency for status, latency in samples if status == 200]
+    rejected = [latency for status, latency in samples if status in (429, 503)]
+    print(json.dumps({
+        "statuses": {str(key): value for key, value in Counter(status for status, _ in samples).items()},
+        "completed_per_s": round(len(ok) / wall, 2),
+        "ok": stats(ok),
+        "rejected": stats(rejected),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=200, help="并发虚拟用户数")
+    parser.add_argument("--duration", type=float, default=20, help="压测时长（秒）")
+    parser.add_argument("--limit", type=int, default=32, help="开启准入控制时 /stream_chat 的并发上限")
+    parser.add_argument("--queue-size", type=int, default=32)
+    parser.add_argument("--queue-timeout", type=float, default=2)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--modes", default="off,on", help="依次运行的模式")
+    parser.add_argument("--child", choices=("on", "off"), help=argparse.SUPPRESS)
+    add_profile_arguments(parser)
+    parser.set_defaults(agent_capacity=32, agent_tokens=50, agent_interval=0.02, agent_first_token=0.2, llm_latency=0.05)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_child(args)
+
+    forwarded = sys.argv[1:]
+    results = {}
+    for mode in args.modes.split(","):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), *forwarded, "--child", mode],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+
+    print(f"concurrency {args.concurrency}, upstream capacity {args.agent_capacity}, limit {args.limit}, "
+          f"queue {args.queue_size} x {args.queue_timeout}s, {args.duration}s per mode")
+    print(f"{'admission':<10} {'done/s':>7} {'ok p50':>9} {'ok p95':>9} {'ok p99':>9} {'ok max':>9} {'rej p99':>8}  statuses")
+    for mode, result in results.items():
+        ok, rejected = result["ok"] or {}, result["rejected"] or {}
+        print(f"{mode:<10} {result['completed_per_s']:>7} {ok.get('p50_ms', ''):>9} {ok.get('p95_ms', ''):>9} "
+              f"{ok.get('p99_ms', ''):>9} {ok.get('max_ms', ''):>9} {rejected.get('p99_ms', ''):>8}  {result['statuses']}")
+
+
+if __name__ == "__main__":
+    main()
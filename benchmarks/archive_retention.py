@@ -0,0 +1,182 @@
+# benchmarks/archive_retention.py
+"""
+分层保留基准：归档不活跃会话前后的数据库大小与热点查询延迟
+
+生成 --sessions 个会话（每个 --questions 个问题，各带联网 / 知识 / RAG 检索结果 JSON），
+其中 --idle-ratio 比例的会话最后一次提问在 --idle-days 天之前。
+依次测量：归档前 -> archive.py 归档并 VACUUM -> 归档后；
+报告数据库文件大小、归档段大小，以及活跃会话的 get_conversation / get_question_with_results
+与已归档问题按需读取（归档段）的 p50 / p99 延迟。
+
+用法：
+    python benchmarks/archive_retention.py --sessions 5000 --questions 6
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from archive import archive_sessions
+from config import AppConfig
+from models import db, Session, Question, WebSearchResult, RAGResult, KnowledgeSearchResult
+from db import init_db, init_archive, get_conversation, get_question_with_results, vacuum_database
+from utils.archive import ArchiveReader, resolve_codec
+
+WORDS = ["一元二次方程", "判别式", "因式分解", "配方法", "求根公式", "函数", "图像", "顶点", "对称轴", "不等式",
+         "三角形", "全等", "相似", "勾股定理", "圆", "切线", "概率", "统计", "例题", "解析", "步骤", "答案"]
+
+
+def text(rng, words):
+    return "，".join(rng.choice(WORDS) for _ in range(words))
+
+
+def search_results(rng, count, words):
+    return json.dumps([
+        {"title": text(rng, 4), "url": f"https://example.com/{rng.randrange(10 ** 9)}", "content": text(rng, words)}
+        for _ in range(count)
+    ], ensure_ascii=False)
+
+
+def populate(args, rng):
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    sessions = {"idle": [], "active": []}
+    question_id = 0
+    for index in range(args.sessions):
+        session_id = f"{index:032x}"
+        idle = rng.random() < args.idle_ratio
+        sessions["idle" if idle else "active"].append(session_id)
+        base = now - timedelta(days=args.idle_days * 2 if idle else 1)
+        questions, results = [], []
+        for turn in range(args.questions):
+            question_id += 1
+            questions.append({
+                "id": question_id, "session_id": session_id, "created_at": base + timedelta(minutes=turn),
+                "content": json.dumps({"user_question": text(rng, 6), "ocr_msg": ""}, ensure_ascii=False),
+                "answer": text(rng, 150), "summary": text(rng, 10), "answer_status": "done",
+            })
+            results.append(question_id)
+        db.session.add(Session(session_id=session_id, created_at=base))
+        db.session.execute(db.insert(Question), questions)
+        db.session.execute(db.insert(WebSearchResult), [
+            {"question_id": qid, "content": search_results(rng, 8, 40)} for qid in results
+        ])
+        db.session.execute(db.insert(KnowledgeSearchResult), [
+            {"question_id": qid, "content": search_results(rng, 3, 60)} for qid in results
+        ])
+        db.session.execute(db.insert(RAGResult), [
+            {"question_id": qid, "content": search_results(rng, 5, 30)} for qid in results
+        ])
+        if index % 500 == 499:
+            db.session.commit()
+    db.session.commit()
+    return sessions
+
+
+def database_bytes(path):
+    db.session.commit()
+    with db.engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+    return sum(os.path.getsize(path + suffix) for suffix in ("", "-wal") if os.path.exists(path + suffix))
+
+
+def directory_bytes(path):
+    if not os.path.isdir(path):
+        return 0
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def timed(func, args_list):
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+        db.session.remove()
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def session_question_ids(session_ids, questions):
+    # populate 按会话顺序连续分配问题id
+    return [int(session_id, 16) * questions + turn + 1 for session_id in session_ids for turn in range(questions)]
+
+
+def measure(label, args, rng, db_path, archive_dir, sessions):
+    active = rng.sample(sessions["active"], min(args.samples, len(sessions["active"])))
+    active_questions = rng.sample(session_question_ids(active, args.questions), len(active))
+    result = {
+        "label": label,
+        "db_mb": database_bytes(db_path) / 1024 / 1024,
+        "archive_mb": directory_bytes(archive_dir) / 1024 / 1024,
+        "get_conversation": timed(get_conversation, [(session_id,) for session_id in active]),
+        "get_question_with_results": timed(get_question_with_results, [(question_id,) for question_id in active_questions]),
+    }
+    idle = rng.sample(sessions["idle"], min(args.samples, len(sessions["idle"])))
+    idle_questions = rng.sample(session_question_ids(idle, args.questions), len(idle))
+    result["archived get_question_with_results"] = timed(get_question_with_results, [(qid,) for qid in idle_questions])
+    result["archived get_conversation"] = timed(get_conversation, [(session_id,) for session_id in idle])
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=5000)
+    parser.add_argument("--questions", type=int, default=6, help="每个会话的问题数")
+    parser.add_argument("--idle-ratio", type=float, default=0.8)
+    parser.add_argument("--idle-days", type=float, default=90)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--codec", default="auto")
+    parser.add_argument("--samples", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        archive_dir = os.path.join(tmp, "archive")
+        app = Flask(__name__)
+        app.config.from_object(AppConfig)
+        app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
+        init_db(app)
+
+        with app.app_context():
+            start = time.perf_counter()
+            sessions = populate(args, rng)
+            print(f"populated {args.sessions} sessions x {args.questions} questions in {time.perf_counter() - start:.1f} s")
+            init_archive(ArchiveReader(archive_dir, reload_interval=0))
+            results = [measure("before", args, rng, db_path, archive_dir, sessions)]
+
+            codec = resolve_codec(args.codec)
+            start = time.perf_counter()
+            writer = archive_sessions(archive_dir, args.idle_days, args.batch_size, codec,
+                                      256 * 1024, 256 * 1024 * 1024, log=lambda message: None)
+            archived = time.perf_counter() - start
+            start = time.perf_counter()
+            vacuum_database()
+            vacuumed = time.perf_counter() - start
+            print(f"archived {writer.sessions} sessions / {writer.questions} questions as {codec} in {archived:.1f} s "
+                  f"({writer.raw_bytes / 1024 / 1024:.1f} MB -> {writer.compressed_bytes / 1024 / 1024:.1f} MB), "
+                  f"vacuum {vacuumed:.1f} s")
+            results.append(measure("after", args, rng, db_path, archive_dir, sessions))
+
+    print()
+    print(f"{'':<48}" + "".join(f"{result['label']:>20}" for result in results))
+    for key, unit in (("db_mb", "MB"), ("archive_mb", "MB")):
+        print(f"{key + ' (' + unit + ')':<48}" + "".join(f"{result[key]:>20.1f}" for result in results))
+    for key in ("get_conversation", "get_question_with_results", "archived get_conversation", "archived get_question_with_results"):
+        print(f"{key + ' p50/p99 (ms)':<48}" + "".join(
+            f"{result[key][0]:>12.3f} /{result[key][1]:>6.2f}" for result in results
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# benchmarks/db_queries.py
+"""
+/stream_chat 数据库访问微基准：对比逐条查询/提交与合并查询/单事务的 SQL 次数、提交次数与耗时
+
+用法：
+    python benchmarks/db_queries.py [--requests 500]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import event
+
+from config import AppConfig
+from models import db, Question, WebSearchResult, RAGResult, KnowledgeSearchResult, ApiSession
+from db import (
+    init_db, create_session, add_question_to_session, add_web_search_result, add_knowledge_search_result,
+    get_apisession, get_question_with_results, add_question_answer, create_apisession, transaction,
+)
+
+
+class Counter:
+    def __init__(self, engine):
+        self.queries = 0
+        self.commits = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+        event.listen(engine, "commit", self._on_commit)
+
+    def _on_execute(self, *args):
+        self.queries += 1
+
+    def _on_commit(self, *args):
+        self.commits += 1
+
+    def reset(self):
+        self.queries = self.commits = 0
+
+
+def legacy_request(session_id, question_id, answer):
+    """基线：get_question_by_id + 3 次检索查询 + get_apisession + 两次查询后提交"""
+    Question.query.filter_by(id=question_id).first()
+    WebSearchResult.query.filter_by(question_id=question_id).first()
+    RAGResult.query.filter_by(question_id=question_id).first()
+    KnowledgeSearchResult.query.filter_by(question_id=question_id).first()
+    ApiSession.query.filter_by(session_id=session_id).first()
+
+    question = Question.query.filter_by(id=question_id).first()
+    question.answer = answer
+    db.session.commit()
+    api_session = ApiSession.query.filter_by(session_id=session_id).first()
+    if not api_session:
+        db.session.add(ApiSession(session_id=session_id, api_session_id=f"api{question_id}"))
+        db.session.commit()
+
+
+def batched_request(session_id, question_id, answer):
+    """当前实现：单次联合查询 + 单事务写入"""
+    get_question_with_results(question_id)
+    get_apisession(session_id)
+    with transaction():
+        add_question_answer(question_id, answer, commit=False)
+        create_apisession(session_id, f"api{question_id}", commit=False)
+
+
+def run(scenario, fixtures, counter):
+    db.session.remove()
+    counter.reset()
+    start = time.perf_counter()
+    for session_id, question_id in fixtures:
+        scenario(session_id, question_id, "answer " * 200)
+        db.session.remove()
+    elapsed = time.perf_counter() - start
+    total = len(fixtures)
+    return counter.queries / total, counter.commits / total, elapsed / total * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config.from_object(AppConfig)
+        app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        init_db(app)
+
+        with app.app_context():
+            fixtures = {"legacy": [], "batched": []}
+            for name in fixtures:
+                for index in range(args.requests):
+                    session_id = f"{name}{index:028d}"
+                    create_session(session_id)
+                    _, question_id = add_question_to_session(session_id, '{"user_question": "q", "ocr_msg": ""}')
+                    add_web_search_result(question_id, "[]")
+                    add_knowledge_search_result(question_id, "[]")
+                    fixtures[name].append((session_id, question_id))
+
+            counter = Counter(db.engine)
+            print(f"{'scenario':<10} {'queries/req':>12} {'commits/req':>12} {'ms/req':>8}")
+            for name, scenario in (("legacy", legacy_request), ("batched", batched_request)):
+                queries, commits, ms = run(scenario, fixtures[name], counter)
+                print(f"{name:<10} {queries:>12.1f} {commits:>12.1f} {ms:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
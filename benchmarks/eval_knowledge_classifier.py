@@ -0,0 +1,117 @@
+# benchmarks/eval_knowledge_classifier.py
+"""
+离线评估本地知识点分类器：准确率与 p50/p99 延迟
+
+用法：
+    python benchmarks/eval_knowledge_classifier.py [--labels labels.jsonl] [--threshold 0.35 | --sweep]
+
+labels.jsonl 每行格式：{"question": "...", "category_id": 17}
+未提供时，从 knowledge.json 的 example_problems 中抽取例题作为标注集。
+默认构建索引时排除例题字段（留出评估），--include-examples 仅用于对比训练集上的表现。
+--sweep 输出一组阈值下的本地命中率与准确率，用于选取 KnowledgeConfig.CLASSIFIER_THRESHOLD。
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.knowledge_classifier import KnowledgeClassifier
+
+EXAMPLE_RE = re.compile(r"\*\*例题\d*\*\*[:：](.*?)(?:\*\*解答\*\*|$)", re.S)
+
+
+def load_labels(path):
+    with open(path, "r", encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def labels_from_examples(knowledge_data):
+    """从例题中构建标注集"""
+    labels = []
+    for item in knowledge_data:
+        problems = (item.get("content") or {}).get("example_problems", "")
+        for match in EXAMPLE_RE.finditer(problems):
+            question = match.group(1).strip()
+            if question:
+                labels.append({"question": question, "category_id": item["id"]})
+    return labels
+
+
+def strip_examples(knowledge_data):
+    """去掉例题字段，避免评估集泄漏到索引中"""
+    items = []
+    for item in knowledge_data:
+        content = dict(item.get("content") or {})
+        content.pop("example_problems", None)
+        items.append({**item, "content": content})
+    return items
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--knowledge", default="instance/knowledge.json")
+    parser.add_argument("--labels", help="标注集 JSONL 路径")
+    parser.add_argument("--include-examples", action="store_true", help="构建索引时保留例题字段（评估集会泄漏到索引中）")
+    parser.add_argument("--threshold", type=float, default=None, help="置信度阈值，统计本地命中率")
+    parser.add_argument("--sweep", action="store_true", help="按一组阈值统计本地命中率与准确率")
+    args = parser.parse_args()
+
+    with open(args.knowledge, "r", encoding="utf-8") as file:
+        knowledge_data = json.load(file)
+
+    labels = load_labels(args.labels) if args.labels else labels_from_examples(knowledge_data)
+    index_items = knowledge_data if args.include_examples else strip_examples(knowledge_data)
+
+    start = time.perf_counter()
+    classifier = KnowledgeClassifier(index_items)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    latencies = []
+    top1 = []
+    correct_top1 = correct_top3 = confident = confident_correct = 0
+    for sample in labels:
+        expected = str(sample["category_id"])
+        start = time.perf_counter()
+        ranked = classifier.classify(sample["question"], top_k=3)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        ids = [category_id for category_id, _ in ranked]
+        correct_top1 += bool(ids) and ids[0] == expected
+        if ranked:
+            top1.append((ranked[0][1], ids[0] == expected))
+        correct_top3 += expected in ids
+        if args.threshold is not None and ranked and ranked[0][1] >= args.threshold:
+            confident += 1
+            confident_correct += ids[0] == expected
+
+    total = len(labels) or 1
+    print(f"samples:        {len(labels)}")
+    print(f"index build:    {build_ms:.1f} ms")
+    print(f"top-1 accuracy: {correct_top1 / total:.3f}")
+    print(f"top-3 accuracy: {correct_top3 / total:.3f}")
+    if latencies:
+        print(f"latency p50:    {percentile(latencies, 50):.3f} ms")
+        print(f"latency p99:    {percentile(latencies, 99):.3f} ms")
+    if args.threshold is not None:
+        print(f"local coverage: {confident / total:.3f} (threshold={args.threshold})")
+        print(f"local accuracy: {confident_correct / (confident or 1):.3f}")
+    if args.sweep:
+        print("threshold  coverage  accuracy")
+        for step in range(5, 100, 5):
+            threshold = step / 100
+            hits = [correct for score, correct in top1 if score >= threshold]
+            print(f"{threshold:9.2f}  {len(hits) / total:8.3f}  {sum(hits) / (len(hits) or 1):8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# benchmarks/load_stream_chat.py
+"""
+/stream_chat 并发流压测：对比 WSGI 线程模式与 ASGI 异步模式的单进程并发流数
+
+1. 启动模拟的 DashScope 智能体上游（SSE，可配置 token 数与间隔）：
+    python benchmarks/load_stream_chat.py mock-upstream --port 9100 --tokens 100 --interval 0.05
+
+2. 分别以两种模式启动服务（均指向模拟上游，单进程）：
+    DASHSCOPE_BASE_URL=http://127.0.0.1:9100 gunicorn -w 1 --threads 16 -b :8000 wsgi:app
+    DASHSCOPE_BASE_URL=http://127.0.0.1:9100 uvicorn asgi:application --workers 1 --port 8001
+
+3. 压测并对比：
+    python benchmarks/load_stream_chat.py run --url http://127.0.0.1:8000 --concurrency 200
+    python benchmarks/load_stream_chat.py run --url http://127.0.0.1:8001 --concurrency 200
+
+输出中的 effective concurrency = 所有流的持续时间之和 / 总耗时，即进程实际同时服务的流数。
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_upstreams import MockProfile, serve
+
+
+async def mock_upstream(args):
+    profile = MockProfile(agent_tokens=args.tokens, agent_interval=args.interval, agent_first_token=0, jitter=0)
+    print(f"mock DashScope upstream on http://{args.host}:{args.port} ({args.tokens} tokens x {args.interval}s)")
+    await serve(args.host, args.port, profile)
+
+
+async def one_stream(client, url):
+    resp = await client.get(f"{url}/newchat")
+    session_id = resp.json()["res_data"]["session_id"]
+    cookies = {"session_id": session_id}
+    resp = await client.post(f"{url}/new_question_id", json={"user_question": "如何解一元二次方程？", "ocr_msg": ""}, cookies=cookies)
+    question_id = resp.json()["res_data"]["question_id"]
+
+    start = time.perf_counter()
+    ttfb = None
+    size = 0
+    async with client.stream("POST", f"{url}/stream_chat", json={"question_id": question_id}, cookies=cookies) as resp:
+        async for chunk in resp.aiter_bytes():
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+            size += len(chunk)
+    return ttfb or 0.0, time.perf_counter() - start, size
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def run(args):
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one_stream(client, args.url) for _ in range(args.concurrency)), return_exceptions=True)
+        wall = time.perf_counter() - start
+
+    ok = [r for r in results if not isinstance(r, BaseException)]
+    errors = len(results) - len(ok)
+    print(f"streams:               {len(ok)} ok / {errors} failed")
+    print(f"wall time:             {wall:.2f} s")
+    if ok:
+        ttfbs = [r[0] for r in ok]
+        durations = [r[1] for r in ok]
+        print(f"ttfb p50 / p99:        {percentile(ttfbs, 50) * 1000:.0f} / {percentile(ttfbs, 99) * 1000:.0f} ms")
+        print(f"stream p50 / p99:      {percentile(durations, 50):.2f} / {percentile(durations, 99):.2f} s")
+        print(f"effective concurrency: {sum(durations) / wall:.1f} streams")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    upstream = sub.add_parser("mock-upstream")
+    upstream.add_argument("--host", default="127.0.0.1")
+    upstream.add_argument("--port", type=int, default=9100)
+    upstream.add_argument("--tokens", type=int, default=100)
+    upstream.add_argument("--interval", type=float, default=0.05)
+
+    load = sub.add_parser("run")
+    load.add_argument("--url", default="http://127.0.0.1:8000")
+    load.add_argument("--concurrency", type=int, default=200)
+    load.add_argument("--timeout", type=float, default=300)
+
+    args = parser.parse_args()
+    asyncio.run(mock_upstream(args) if args.command == "mock-upstream" else run(args))
+
+
+if __name__ == "__main__":
+    main()
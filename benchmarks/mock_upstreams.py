@@ -0,0 +1,238 @@
+# benchmarks/mock_upstreams.py
+"""
+本地模拟上游：OpenAI 兼容对话补全（Qwen）、智谱 web-search-pro、DashScope 智能体应用（SSE 流式）
+
+三类接口共用一个端口，按路径区分：
+    POST {base}/v1/chat/completions        -> QWEN_BASE_URL=http://host:port/v1
+    POST {base}/api/paas/v4/tools          -> ZHIPU_BASE_URL=http://host:port/api/paas/v4/tools
+    POST {base}/api/v1/apps/{id}/completion -> DASHSCOPE_BASE_URL=http://host:port/api/v1
+
+用法：
+    python benchmarks/mock_upstreams.py --port 9100 --llm-latency 0.3 --llm-tps 60 --agent-tokens 100 --agent-interval 0.02
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+import uuid
+
+
+class MockProfile:
+    """模拟上游的延迟与 token 速率"""
+
+    def __init__(self, llm_latency=0.3, llm_tps=60.0, search_latency=0.5, search_results=5,
+                 agent_tokens=100, agent_interval=0.02, agent_first_token=0.3, jitter=0.1, agent_capacity=0):
+        self.llm_latency = llm_latency
+        self.llm_tps = llm_tps
+        self.search_latency = search_latency
+        self.search_results = search_results
+        self.agent_tokens = agent_tokens
+        self.agent_interval = agent_interval
+        self.agent_first_token = agent_first_token
+        # 延迟随机抖动比例
+        self.jitter = jitter
+        # 智能体同时服务的流数上限（0 为不限）：超出后所有流按比例变慢，模拟上游配额耗尽
+        self.agent_capacity = agent_capacity
+        self.active_streams = 0
+
+    def delay(self, seconds):
+        return max(0.0, seconds * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def agent_slowdown(self):
+        if not self.agent_capacity:
+            return 1.0
+        return max(1.0, self.active_streams / self.agent_capacity)
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(args.llm_latency, args.llm_tps, args.search_latency, args.search_results,
+                   args.agent_tokens, args.agent_interval, args.agent_first_token, args.jitter, args.agent_capacity)
+
+
+def add_profile_arguments(parser):
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="对话补全首 token 延迟（秒）")
+    parser.add_argument("--llm-tps", type=float, default=60.0, help="对话补全输出速率（token/秒）")
+    parser.add_argument("--search-latency", type=float, default=0.5, help="联网搜索延迟（秒）")
+    parser.add_argument("--search-results", type=int, default=5)
+    parser.add_argument("--agent-tokens", type=int, default=100, help="智能体回答片段数")
+    parser.add_argument("--agent-interval", type=float, default=0.02, help="智能体片段间隔（秒）")
+    parser.add_argument("--agent-first-token", type=float, default=0.3, help="智能体首片段延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.1, help="延迟随机抖动比例")
+    parser.add_argument("--agent-capacity", type=int, default=0, help="智能体并发流容量，超出后按比例变慢（0 为不限）")
+
+
+# 各模型相对于 --llm-latency / --llm-tps 的耗时倍数
+MODEL_LATENCY_FACTORS = {"qwen-turbo": 0.4, "qwen-max": 2.0}
+
+
+def chat_completion_content(messages):
+    """按 app.py 中各提示词返回格式正确的内容"""
+    system = next((m["content"] for m in messages if m["role"] == "system"), "")
+    user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+    if "返回1，否则返回0" in system:
+        return "1"
+    if "给出且仅给出一个类别id" in system:
+        return str(random.randint(0, 95))
+    if "联网搜索关键词" in user:
+        return json.dumps({"related": True, "keywords": ["一元二次方程", "求根公式"]}, ensure_ascii=False)
+    if "每个元素为3个问题组成的数组" in system:
+        try:
+            count = len(json.loads(user))
+        except ValueError:
+            count = 1
+        return json.dumps([["如何解一元二次方程？", "判别式有什么用？", "如何求二次函数的顶点？"]] * count, ensure_ascii=False)
+    if "推荐3个" in system:
+        return json.dumps(["如何解一元二次方程？", "判别式有什么用？", "如何求二次函数的顶点？"], ensure_ascii=False)
+    if "JSON array of summaries" in system:
+        try:
+            count = len(json.loads(user))
+        except ValueError:
+            count = 1
+        return json.dumps([f"summary {index}" for index in range(count)])
+    return "这是一段模拟的总结内容。" * 3
+
+
+def web_search_response(count):
+    results = [
+        {"title": f"模拟搜索结果 {index}", "content": "一元二次方程 ax²+bx+c=0 的判别式为 b²-4ac。" * 3,
+         "link": f"https://example.com/{index}", "media": "example", "refer": f"ref_{index}"}
+        for index in range(count)
+    ]
+    return {
+        "id": "mock", "created": int(time.time()),
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "tool", "tool_calls": [
+            {"id": "call_0", "type": "search_intent", "search_intent": [{"category": "", "query": "", "intent": "SEARCH_ALL", "keywords": ""}]},
+            {"id": "call_1", "type": "search_result", "search_result": results},
+        ]}}],
+    }
+
+
+async def read_request(reader):
+    header = await reader.readuntil(b"\r\n\r\n")
+    lines = header.decode("latin-1").split("\r\n")
+    method, path, _ = lines[0].split(" ", 2)
+    length = 0
+    for line in lines[1:]:
+        if line.lower().startswith("content-length:"):
+            length = int(line.split(":", 1)[1])
+    body = await reader.readexactly(length) if length else b""
+    return method, path, body
+
+
+async def send_json(writer, payload, status="200 OK"):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    writer.write(
+        f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+    )
+    await writer.drain()
+
+
+async def send_agent_stream(writer, profile, session_id):
+    """DashScope 应用 SSE：增量输出，每个事件携带 session_id（首轮对话时新建）"""
+    writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+    profile.active_streams += 1
+    try:
+        await asyncio.sleep(profile.delay(profile.agent_first_token) * profile.agent_slowdown())
+        for index in range(profile.agent_tokens):
+            finish = "stop" if index == profile.agent_tokens - 1 else "null"
+            event = {
+                "output": {"text": f"片段{index} ", "session_id": session_id, "finish_reason": finish},
+                "usage": {"models": []}, "request_id": "mock",
+            }
+            data = f"id:{index}\nevent:result\n:HTTP_STATUS/200\ndata:{json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8")
+            writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+            await writer.drain()
+            await asyncio.sleep(profile.delay(profile.agent_interval) * profile.agent_slowdown())
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+    finally:
+        profile.active_streams -= 1
+
+
+async def handle(reader, writer, profile):
+    try:
+        while True:
+            try:
+                method, path, body = await read_request(reader)
+            except asyncio.IncompleteReadError:
+                break
+            if "/apps/" in path:
+                request = json.loads(body or b"{}")
+                session_id = (request.get("input") or {}).get("session_id") or uuid.uuid4().hex
+                await send_agent_stream(writer, profile, session_id)
+                break
+            if path.endswith("/chat/completions"):
+                request = json.loads(body or b"{}")
+                content = chat_completion_content(request.get("messages", []))
+                # 首 token 延迟 + 按输出长度计算的生成时间，按模型缩放
+                factor = MODEL_LATENCY_FACTORS.get(request.get("model"), 1.0)
+                await asyncio.sleep(profile.delay((profile.llm_latency + len(content) / 2 / profile.llm_tps) * factor))
+                # token 数按约 2 字符 / token 估算
+                prompt_tokens = sum(len(m.get("content") or "") for m in request.get("messages", [])) // 2
+                completion_tokens = len(content) // 2
+                await send_json(writer, {
+                    "id": "mock", "object": "chat.completion", "created": int(time.time()), "model": request.get("model"),
+                    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                              "total_tokens": prompt_tokens + completion_tokens},
+                })
+            else:
+                await asyncio.sleep(profile.delay(profile.search_latency))
+                await send_json(writer, web_search_response(profile.search_results))
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host, port, profile, started=None):
+    server = await asyncio.start_server(lambda r, w: handle(r, w, profile), host, port, backlog=4096)
+    if started is not None:
+        started(server.sockets[0].getsockname()[1])
+    async with server:
+        await server.serve_forever()
+
+
+def start_in_thread(profile, host="127.0.0.1", port=0):
+    """在后台线程启动模拟上游，返回实际端口"""
+    ready = threading.Event()
+    result = {}
+
+    def started(actual_port):
+        result["port"] = actual_port
+        ready.set()
+
+    thread = threading.Thread(target=lambda: asyncio.run(serve(host, port, profile, started)), name="mock-upstreams", daemon=True)
+    thread.start()
+    ready.wait(10)
+    return result["port"]
+
+
+def upstream_env(port, host="127.0.0.1"):
+    """指向模拟上游的环境变量（需在导入 app 之前设置）"""
+    base = f"http://{host}:{port}"
+    return {
+        "QWEN_API_KEY": "mock", "QWEN_BASE_URL": f"{base}/v1",
+        "ZHIPU_API_KEY": "mock", "ZHIPU_BASE_URL": f"{base}/api/paas/v4/tools",
+        "DASHSCOPE_API_KEY": "mock", "DASHSCOPE_BASE_URL": f"{base}/api/v1",
+        "LONG_SESSION_AGENT_ID": "mock-agent",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    profile = MockProfile.from_args(args)
+    for key, value in upstream_env(args.port, args.host).items():
+        print(f"{key}={value}")
+    asyncio.run(serve(args.host, args.port, profile))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# benchmarks/rag_latency.py
+"""
+RAG 本地向量索引查询延迟：不同语料规模下暴力检索与 IVF 的 p50/p99 延迟及 IVF 召回率
+
+语料由知识库片段随机拼接生成（不足时循环），向量化使用与线上相同的 HashingEmbedder。
+
+用法：
+    python benchmarks/rag_latency.py [--sizes 1000,10000,100000] [--queries 200] [--nprobe 8]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import KnowledgeConfig, RagConfig
+from utils.rag_index import RagIndex, HashingEmbedder, chunk_text
+
+
+def load_corpus(path):
+    with open(path, "r", encoding="utf-8") as file:
+        items = json.load(file)
+    chunks = []
+    for item in items:
+        for text in (item.get("content") or {}).values():
+            chunks += [(item["title"], chunk) for chunk in chunk_text(text, RagConfig.CHUNK_CHARS, RagConfig.CHUNK_OVERLAP)]
+    return chunks
+
+
+def synthetic_documents(chunks, size, rng):
+    """拼接两个随机片段的前后半部分，得到与真实语料分布相近的新片段"""
+    documents = []
+    for index in range(size):
+        (title, first), (_, second) = rng.choice(chunks), rng.choice(chunks)
+        text = first[:len(first) // 2] + second[len(second) // 2:]
+        documents.append({"key": f"doc:{index}", "title": title, "text": text, "source": "bench"})
+    return documents
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    return latencies[len(latencies) // 2], latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+
+
+def measure(index, queries, top_k, exact):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(index.search(query, top_k, exact=exact))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return percentiles(latencies), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000", help="语料规模（片段数），逗号分隔")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=RagConfig.TOP_K)
+    parser.add_argument("--nprobe", type=int, default=RagConfig.IVF_NPROBE)
+    parser.add_argument("--knowledge", default=KnowledgeConfig.KNOWLEDGE_FILE)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    chunks = load_corpus(args.knowledge)
+    queries = [rng.choice(chunks)[1][:30] for _ in range(args.queries)]
+
+    print(f"{'chunks':>8} {'build s':>8} {'add 1k s':>8} {'brute p50/p99 ms':>18} {'ivf p50/p99 ms':>16} {'lists':>6} {'recall@k':>9}")
+    for size in (int(size) for size in args.sizes.split(",")):
+        with tempfile.TemporaryDirectory() as tmp:
+            index = RagIndex(tmp, HashingEmbedder(RagConfig.DIM), nprobe=args.nprobe)
+            documents = synthetic_documents(chunks, size, rng)
+            start = time.perf_counter()
+            # 文档较短，max_chars 足够大时一个文档对应一个片段
+            index.add(documents[:-1000] or documents, max_chars=10 ** 6)
+            build_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            index.add(documents[-1000:], max_chars=10 ** 6)
+            add_seconds = time.perf_counter() - start
+
+            (brute_p50, brute_p99), exact_results = measure(index, queries, args.top_k, exact=True)
+            lists = index.build_ivf()
+            (ivf_p50, ivf_p99), ivf_results = measure(index, queries, args.top_k, exact=False)
+
+            hits = total = 0
+            for exact, approx in zip(exact_results, ivf_results):
+                expected = {(result["key"], result["content"]) for result in exact}
+                hits += len(expected & {(result["key"], result["content"]) for result in approx})
+                total += len(expected)
+
+            print(f"{len(index):>8} {build_seconds:>8.2f} {add_seconds:>8.2f} "
+                  f"{brute_p50:>8.2f}/{brute_p99:<9.2f} {ivf_p50:>7.2f}/{ivf_p99:<8.2f} {lists:>6} {hits / (total or 1):>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# benchmarks/schema_benchmark.py
+"""
+大数据量下热点查询的执行计划与延迟：迁移前（旧结构）vs 迁移后（migrate.py）
+
+用法：
+    python benchmarks/schema_benchmark.py --questions 10000000 --db /tmp/mathecho_bench.db
+
+先按旧结构（无索引、question_id 为字符串）批量生成数据并测量，
+然后对同一个库执行 migrate.migrate()，再测量一次。
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+LEGACY_DDL = """
+CREATE TABLE sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, session_id VARCHAR(32) NOT NULL UNIQUE, created_at DATETIME NOT NULL);
+CREATE TABLE questions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, session_id VARCHAR(32) NOT NULL REFERENCES sessions (session_id),
+    content TEXT NOT NULL, answer TEXT, summary TEXT, created_at DATETIME NOT NULL);
+CREATE TABLE web_search_results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, question_id VARCHAR(32) NOT NULL REFERENCES questions (id), content TEXT NOT NULL);
+CREATE TABLE rag_results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, question_id VARCHAR(32) NOT NULL REFERENCES questions (id), content TEXT NOT NULL);
+CREATE TABLE knowledge_search_results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, question_id VARCHAR(32) NOT NULL REFERENCES questions (id), content TEXT NOT NULL);
+CREATE TABLE api_sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, api_session_id VARCHAR(32) NOT NULL UNIQUE,
+    session_id VARCHAR(32) NOT NULL REFERENCES sessions (session_id));
+"""
+
+HOT_QUERIES = {
+    "get_previous_questions": (
+        "SELECT id, content FROM questions WHERE session_id = ? AND id < ? ORDER BY id DESC LIMIT 5",
+        lambda q: (q["session_id"], q["question_id"]),
+    ),
+    "get_apisession": (
+        "SELECT api_session_id FROM api_sessions WHERE session_id = ? LIMIT 1",
+        lambda q: (q["session_id"],),
+    ),
+    "get_retrieve_data": (
+        "SELECT (SELECT content FROM web_search_results WHERE question_id = ? ORDER BY id LIMIT 1), "
+        "(SELECT content FROM knowledge_search_results WHERE question_id = ? ORDER BY id LIMIT 1)",
+        lambda q: (q["question_id"], q["question_id"]),
+    ),
+}
+
+BATCH = 100000
+
+
+def session_key(index):
+    return f"{index:032x}"
+
+
+def populate(conn, questions, per_session):
+    conn.executescript(LEGACY_DDL)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    sessions = (questions + per_session - 1) // per_session
+    now = "2025-01-01 00:00:00"
+
+    for start in range(0, sessions, BATCH):
+        rows = [(session_key(i), now) for i in range(start, min(sessions, start + BATCH))]
+        conn.executemany("INSERT INTO sessions (session_id, created_at) VALUES (?, ?)", rows)
+        conn.executemany(
+            "INSERT INTO api_sessions (api_session_id, session_id) VALUES (?, ?)",
+            [("api" + key[3:], key) for key, _ in rows],
+        )
+
+    for start in range(1, questions + 1, BATCH):
+        ids = range(start, min(questions + 1, start + BATCH))
+        conn.executemany(
+            "INSERT INTO questions (id, session_id, content, answer, created_at) VALUES (?, ?, ?, ?, ?)",
+            [(i, session_key((i - 1) // per_session), '{"user_question": "q"}', "answer", now) for i in ids],
+        )
+        conn.executemany("INSERT INTO knowledge_search_results (question_id, content) VALUES (?, ?)", [(str(i), "[]") for i in ids])
+        conn.executemany("INSERT INTO web_search_results (question_id, content) VALUES (?, ?)", [(str(i), "[]") for i in ids])
+        conn.commit()
+        print(f"  populated {min(questions, start + BATCH - 1)} questions", end="\r")
+    print()
+
+
+def measure(conn, samples, label):
+    print(f"\n== {label} ==")
+    for name, (sql, params) in HOT_QUERIES.items():
+        plan = conn.execute("EXPLAIN QUERY PLAN " + sql, params(samples[0])).fetchall()
+        latencies = []
+        for sample in samples:
+            start = time.perf_counter()
+            conn.execute(sql, params(sample)).fetchall()
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"{name:<24} p50 {p50:9.3f} ms   p99 {p99:9.3f} ms")
+        for row in plan:
+            print(f"    plan: {row[-1]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=1000000)
+    parser.add_argument("--per-session", type=int, default=10)
+    parser.add_argument("--lookups", type=int, default=50)
+    parser.add_argument("--db", default="/tmp/mathecho_schema_bench.db")
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+
+    conn = sqlite3.connect(args.db)
+    start = time.perf_counter()
+    populate(conn, args.questions, args.per_session)
+    print(f"populate: {time.perf_counter() - start:.1f} s, size {os.path.getsize(args.db) / 1e6:.0f} MB")
+
+    rng = random.Random(0)
+    samples = []
+    for _ in range(args.lookups):
+        question_id = rng.randint(1, args.questions)
+        samples.append({"question_id": question_id, "session_id": session_key((question_id - 1) // args.per_session)})
+
+    measure(conn, samples, "legacy schema")
+    conn.close()
+
+    from sqlalchemy import create_engine
+    from migrate import migrate
+
+    start = time.perf_counter()
+    steps = migrate(create_engine(f"sqlite:///{args.db}"))
+    print(f"\nmigrate: {time.perf_counter() - start:.1f} s ({', '.join(steps)})")
+
+    conn = sqlite3.connect(args.db)
+    measure(conn, samples, "migrated schema")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
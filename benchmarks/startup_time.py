@@ -0,0 +1,196 @@
+# benchmarks/startup_time.py
+"""
+启动耗时基准：扩容冷启动时新进程多快能开始服务
+
+每次运行都启动全新的 Python 子进程，报告中位数：
+- import：`import app` 耗时，以及导入后已加载的重量级模块（应不含 openai / dashscope / requests）
+- create_app：应用工厂耗时（初始化数据库、预加载知识库与兜底推荐器）
+- ready：从启动服务进程到首个 /newchat 返回 200 的耗时
+- first LLM request：服务就绪后首个 /knowledge_search（经模拟上游调用 Qwen）的耗时，
+  单进程模式下包含首次导入 openai 的开销
+
+--server gunicorn 时以 gunicorn.conf.py（preload_app）启动多个 worker，并报告各 worker 的
+私有 / 共享内存（/proc/<pid>/smaps_rollup），共享部分即写时复制共享的预加载数据与模块。
+
+用法：
+    python benchmarks/startup_time.py --runs 5
+    python benchmarks/startup_time.py --server gunicorn --workers 4
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import requests
+
+from mock_upstreams import MockProfile, start_in_thread, upstream_env
+
+HEAVY_MODULES = ("openai", "dashscope", "requests", "httpx", "rich")
+
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+created = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "create_app_ms": (created - imported) * 1000,
+    "heavy_modules": [name for name in %r if name in sys.modules],
+}))
+"""
+
+WERKZEUG_SERVER = """
+import logging, sys
+from werkzeug.serving import make_server
+from app import create_app
+logging.getLogger("werkzeug").setLevel(logging.ERROR)
+make_server("127.0.0.1", int(sys.argv[1]), create_app(), threaded=True).serve_forever()
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def bench_env(tmp, upstream_port):
+    env = dict(os.environ)
+    env.update(upstream_env(upstream_port))
+    env.update({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(tmp, 'startup.db')}",
+        "RAG_INDEX_DIR": os.path.join(tmp, "rag_index"),
+        "ANSWER_CACHE_BACKEND": "none",
+        "CONSOLE_LOG": "false",
+        "TRACE_SAMPLE_RATE": "0",
+        "ADMISSION_ENABLED": "false",
+    })
+    return env
+
+
+def probe_import(env):
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE % (HEAVY_MODULES,)], cwd=ROOT, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def start_server(args, env, port):
+    if args.server == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-b", f"127.0.0.1:{port}",
+                   "-w", str(args.workers), "--log-level", "warning", "wsgi:app"]
+    else:
+        command = [sys.executable, "-c", WERKZEUG_SERVER, str(port)]
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, start_new_session=True)
+
+
+def wait_ready(url, process, timeout):
+    """轮询 /newchat 直到返回 200，返回会话ID"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited: {process.stderr.read().decode(errors='replace')[-2000:]}")
+        try:
+            resp = requests.get(f"{url}/newchat", timeout=timeout)
+            if resp.status_code == 200:
+                return resp.json()["res_data"]["session_id"]
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.005)
+    raise RuntimeError("server not ready")
+
+
+def worker_memory(process):
+    """gunicorn 各 worker 的私有 / 共享内存（MB）"""
+    children = subprocess.run(["pgrep", "-P", str(process.pid)], capture_output=True, text=True).stdout.split()
+    memory = []
+    for pid in children:
+        fields = {}
+        try:
+            with open(f"/proc/{pid}/smaps_rollup") as file:
+                for line in file:
+                    parts = line.split()
+                    if len(parts) >= 2 and parts[1].isdigit():
+                        fields[parts[0].rstrip(":")] = int(parts[1])
+        except OSError:
+            continue
+        memory.append({
+            "private_mb": round((fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)) / 1024, 1),
+            "shared_mb": round((fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)) / 1024, 1),
+        })
+    return memory
+
+
+def probe_server(args, env):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    process = start_server(args, env, port)
+    try:
+        session_id = wait_ready(url, process, args.timeout)
+        ready = time.perf_counter() - start
+
+        http = requests.Session()
+        http.cookies.set("session_id", session_id)
+        question_id = http.post(
+            f"{url}/new_question_id", json={"user_question": "如何解一元二次方程？", "ocr_msg": ""}, timeout=args.timeout
+        ).json()["res_data"]["question_id"]
+        request_start = time.perf_counter()
+        resp = http.post(f"{url}/knowledge_search", json={"question_id": question_id}, timeout=args.timeout)
+        first_llm = time.perf_counter() - request_start
+        resp.raise_for_status()
+
+        result = {"ready_ms": ready * 1000, "first_llm_request_ms": first_llm * 1000}
+        if args.server == "gunicorn":
+            result["workers"] = worker_memory(process)
+        return result
+    finally:
+        # SIGINT：gunicorn 快速退出，不等待 keep-alive 连接
+        os.killpg(process.pid, signal.SIGINT)
+        process.wait(10)
+
+
+def median(results, key):
+    return round(statistics.median(result[key] for result in results), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--server", choices=("werkzeug", "gunicorn"), default="werkzeug")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker 数")
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    port = start_in_thread(MockProfile(llm_latency=0.01, search_latency=0.01, jitter=0))
+    with tempfile.TemporaryDirectory() as tmp:
+        env = bench_env(tmp, port)
+        # 预热：建表并构建 RAG 索引，之后每次运行都是已有数据的冷启动
+        probe_import(env)
+        imports = [probe_import(env) for _ in range(args.runs)]
+        servers = [probe_server(args, env) for _ in range(args.runs)]
+
+    print(f"{args.runs} runs, median")
+    print(f"import app          {median(imports, 'import_ms'):>9} ms   heavy modules loaded: {imports[-1]['heavy_modules'] or 'none'}")
+    print(f"create_app          {median(imports, 'create_app_ms'):>9} ms")
+    print(f"ready ({args.server:<8})   {median(servers, 'ready_ms'):>9} ms")
+    print(f"first LLM request   {median(servers, 'first_llm_request_ms'):>9} ms")
+    if args.server == "gunicorn":
+        for index, memory in enumerate(servers[-1]["workers"]):
+            print(f"worker {index}: private {memory['private_mb']} MB, shared {memory['shared_mb']} MB")
+
+
+if __name__ == "__main__":
+    main()
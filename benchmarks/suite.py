@@ -0,0 +1,289 @@
+# benchmarks/suite.py
+"""
+全链路离线基准：本地模拟上游 + 进程内服务，按用户流程压测全部路由
+
+流程（每个虚拟用户重复 --iterations 次）：
+    /newchat -> /new_question_id -> /knowledge_search -> /web_search -> /rag_search -> /stream_chat -> /recommend
+
+报告整体 RPS、各路由 p50/p95/p99 延迟、/stream_chat 首字节时间（TTFB）与每请求 SQL 次数，
+可保存为基线并与历史基线对比（回归时退出码为 1）。
+
+用法：
+    python benchmarks/suite.py --users 20 --iterations 5
+    python benchmarks/suite.py --save benchmarks/baselines/local.json
+    python benchmarks/suite.py --compare benchmarks/baselines/local.json --tolerance 0.2
+    python benchmarks/suite.py --url http://127.0.0.1:8000     # 压测已启动的服务（需指向模拟上游），不统计 SQL 次数
+"""
+import argparse
+import contextvars
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import requests
+
+from mock_upstreams import MockProfile, add_profile_arguments, start_in_thread, upstream_env
+
+QUESTIONS = [
+    "如何解一元二次方程？",
+    "一元二次方程的判别式是什么？",
+    "三角形内角和为什么是180度？",
+    "什么是等差数列的通项公式？",
+    "如何求二次函数的顶点坐标？",
+    "勾股定理怎么证明？",
+    "分式方程为什么要验根？",
+    "什么是函数的单调性？",
+]
+
+FLOW = ("/newchat", "/new_question_id", "/knowledge_search", "/web_search", "/rag_search", "/stream_chat", "/recommend")
+
+
+class QueryCounter:
+    """按路由统计 SQL 次数：请求开始时记录路由，同线程（含流式生成器）与检索线程中的查询计入该路由"""
+
+    def __init__(self, app, engine):
+        from flask import request
+        from sqlalchemy import event
+
+        self._request = request
+        self._route = contextvars.ContextVar("benchmark_route", default=None)
+        self._lock = threading.Lock()
+        self.queries = defaultdict(int)
+        self.requests = defaultdict(int)
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+        app.before_request(self._on_request)
+
+    def _on_request(self):
+        rule = self._request.url_rule
+        route = rule.rule if rule else "unmatched"
+        self._route.set(route)
+        with self._lock:
+            self.requests[route] += 1
+
+    def _on_execute(self, *args):
+        # 无路由上下文的查询来自后台线程（write-behind 队列等）
+        route = self._route.get() or "(background)"
+        with self._lock:
+            self.queries[route] += 1
+
+    def per_request(self):
+        return {route: round(count / self.requests[route], 2) for route, count in self.queries.items() if self.requests.get(route)}
+
+
+def start_server(args, tmp):
+    """设置环境变量后导入 app，在后台线程中以多线程 WSGI 服务启动"""
+    port = start_in_thread(MockProfile.from_args(args))
+    os.environ.update(upstream_env(port))
+    os.environ.update({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(tmp, 'suite.db')}",
+        "RAG_INDEX_DIR": os.path.join(tmp, "rag_index"),
+        "ANSWER_CACHE_BACKEND": args.cache,
+        "CONSOLE_LOG": "false",
+        "TRACE_SAMPLE_RATE": "0",
+    })
+
+    from werkzeug.serving import make_server
+    from app import create_app
+    from models import db
+
+    app = create_app()
+    with app.app_context():
+        counter = QueryCounter(app, db.engine)
+    # 关闭逐请求访问日志
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="suite-server", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", counter, server
+
+
+def timed(samples, route, func):
+    start = time.perf_counter()
+    try:
+        ok, ttfb = func()
+    except requests.RequestException:
+        ok, ttfb = False, None
+    samples.append((route, time.perf_counter() - start, ok, ttfb))
+    return ok
+
+
+def json_ok(resp):
+    return resp.status_code == 200 and resp.json().get("code") == 200
+
+
+def run_flow(url, samples, timeout):
+    """单次用户流程，任一步失败即结束本次流程"""
+    http = requests.Session()
+    state = {}
+
+    def new_chat():
+        resp = http.get(f"{url}/newchat", timeout=timeout)
+        state["session_id"] = resp.json()["res_data"]["session_id"]
+        http.cookies.set("session_id", state["session_id"])
+        return json_ok(resp), None
+
+    def new_question():
+        resp = http.post(f"{url}/new_question_id", json={"user_question": random.choice(QUESTIONS), "ocr_msg": ""}, timeout=timeout)
+        state["question_id"] = resp.json()["res_data"]["question_id"]
+        return json_ok(resp), None
+
+    def post(route):
+        def call():
+            return json_ok(http.post(f"{url}{route}", json={"question_id": state["question_id"]}, timeout=timeout)), None
+        return call
+
+    def stream_chat():
+        start = time.perf_counter()
+        ttfb = None
+        with http.post(f"{url}/stream_chat", json={"question_id": state["question_id"]}, stream=True, timeout=timeout) as resp:
+            for chunk in resp.iter_content(chunk_size=None):
+                if ttfb is None and chunk:
+                    ttfb = time.perf_counter() - start
+        return resp.status_code == 200 and ttfb is not None, ttfb
+
+    steps = {
+        "/newchat": new_chat,
+        "/new_question_id": new_question,
+        "/stream_chat": stream_chat,
+    }
+    for route in FLOW:
+        if not timed(samples, route, steps.get(route) or post(route)):
+            return False
+    return True
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+
+
+def summarize(samples, flows, wall, queries=None, background_queries=None):
+    routes = {}
+    for route in FLOW:
+        latencies = [latency for name, latency, _, _ in samples if name == route]
+        if not latencies:
+            continue
+        errors = sum(1 for name, _, ok, _ in samples if name == route and not ok)
+        stats = {
+            "count": len(latencies),
+            "errors": errors,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        }
+        ttfbs = [ttfb for name, _, ok, ttfb in samples if name == route and ttfb is not None]
+        if ttfbs:
+            stats["ttfb_p50_ms"] = round(percentile(ttfbs, 50) * 1000, 2)
+            stats["ttfb_p95_ms"] = round(percentile(ttfbs, 95) * 1000, 2)
+        if queries is not None and route in queries:
+            stats["queries_per_request"] = queries[route]
+        routes[route] = stats
+    return {
+        "requests": len(samples),
+        "flows": flows,
+        "wall_s": round(wall, 3),
+        "rps": round(len(samples) / wall, 2),
+        "flows_per_s": round(flows / wall, 2),
+        "routes": routes,
+        "background_queries": background_queries,
+    }
+
+
+def print_report(report):
+    print(f"requests: {report['requests']}  flows ok: {report['flows']}  wall: {report['wall_s']} s  "
+          f"rps: {report['rps']}  flows/s: {report['flows_per_s']}")
+    print(f"{'route':<18} {'count':>6} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ttfb p50':>9} {'sql/req':>8}")
+    for route, stats in report["routes"].items():
+        print(f"{route:<18} {stats['count']:>6} {stats['errors']:>4} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} "
+              f"{stats['p99_ms']:>9.1f} {stats.get('ttfb_p50_ms', ''):>9} {stats.get('queries_per_request', ''):>8}")
+
+
+def compare(report, baseline, tolerance):
+    """与基线对比：p95 延迟超出容差或每请求 SQL 次数增加视为回归"""
+    regressions = []
+    print(f"\ncompare with baseline ({baseline.get('created', '?')}), tolerance {tolerance:.0%}")
+    print(f"{'route':<18} {'p95 base':>9} {'p95 now':>9} {'delta':>8} {'sql base':>9} {'sql now':>8}")
+    for route, base in baseline["routes"].items():
+        now = report["routes"].get(route)
+        if not now:
+            continue
+        delta = now["p95_ms"] / base["p95_ms"] - 1 if base["p95_ms"] else 0.0
+        flag = ""
+        if delta > tolerance:
+            flag = " <- slower"
+            regressions.append(route)
+        base_sql, now_sql = base.get("queries_per_request"), now.get("queries_per_request")
+        if base_sql is not None and now_sql is not None and now_sql > base_sql:
+            flag += " <- more sql"
+            regressions.append(route)
+        print(f"{route:<18} {base['p95_ms']:>9.1f} {now['p95_ms']:>9.1f} {delta:>+8.1%} {base_sql if base_sql is not None else '':>9} "
+              f"{now_sql if now_sql is not None else '':>8}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="已启动服务的地址；为空时在进程内启动服务与模拟上游")
+    parser.add_argument("--users", type=int, default=10, help="并发虚拟用户数")
+    parser.add_argument("--iterations", type=int, default=5, help="每个用户执行的流程次数")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--cache", default="none", help="回答缓存后端（进程内模式），默认关闭以测量完整链路")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="保存结果为基线 JSON")
+    parser.add_argument("--compare", help="与基线 JSON 对比")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="p95 延迟允许的相对增幅")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        counter = server = None
+        url = args.url
+        if not url:
+            url, counter, server = start_server(args, tmp)
+
+        samples = []
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.users) as executor:
+            futures = [executor.submit(run_flow, url, samples, args.timeout) for _ in range(args.users * args.iterations)]
+            flows = sum(1 for future in futures if future.result())
+        wall = time.perf_counter() - start
+
+        if server is not None:
+            server.shutdown()
+        if counter is not None:
+            report = summarize(samples, flows, wall, counter.per_request(), counter.queries.get("(background)", 0))
+        else:
+            report = summarize(samples, flows, wall)
+
+    report["created"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    report["config"] = {key: value for key, value in vars(args).items() if key not in ("save", "compare")}
+    report["platform"] = {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()}
+    print_report(report)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        print(f"\nbaseline saved to {args.save}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+        if regressions:
+            print(f"\nregressions: {sorted(set(regressions))}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
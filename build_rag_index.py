@@ -0,0 +1,62 @@
+# build_rag_index.py
+"""
+构建 / 补全本地 RAG 向量索引：知识库 + 已回答问题的回答与总结
+
+默认增量补全（已入索引的文档跳过）；--rebuild 清空后全量重建。
+
+用法：python build_rag_index.py [--rebuild] [--ivf]
+"""
+import argparse
+import os
+import shutil
+import time
+
+from config import RagConfig
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rebuild", action="store_true", help="删除现有索引后全量重建")
+    parser.add_argument("--ivf", action="store_true", help="无论语料规模，构建 IVF 近似索引")
+    parser.add_argument("--batch-size", type=int, default=500, help="每批读取的问题数")
+    args = parser.parse_args()
+
+    if args.rebuild and os.path.isdir(RagConfig.INDEX_DIR):
+        shutil.rmtree(RagConfig.INDEX_DIR)
+
+    # app 导入时会自动导入知识库
+    from app import app, rag_index, add_rag_documents, answer_documents, knowledge_documents, knowledge_base
+    from db import init_db
+    from models import Question
+
+    if not rag_index.available:
+        raise SystemExit("numpy not installed, cannot build the RAG index")
+
+    start = time.perf_counter()
+    added = add_rag_documents(knowledge_documents(knowledge_base.snapshot))
+    init_db(app)
+    with app.app_context():
+        last_id = 0
+        while True:
+            rows = (
+                Question.query.with_entities(Question.id, Question.content, Question.answer, Question.summary)
+                .filter(Question.id > last_id, Question.answer.isnot(None), Question.answer != "")
+                .order_by(Question.id)
+                .limit(args.batch_size)
+                .all()
+            )
+            if not rows:
+                break
+            documents = []
+            for question_id, content, answer, summary in rows:
+                documents += answer_documents(question_id, content, answer, summary)
+            added += add_rag_documents(documents)
+            last_id = rows[-1][0]
+
+    if args.ivf or rag_index.needs_ivf(RagConfig.IVF_THRESHOLD, RagConfig.IVF_TAIL_RATIO):
+        print(f"ivf lists: {rag_index.build_ivf()}")
+    print(f"added {added} chunk(s) in {time.perf_counter() - start:.2f} s, index: {rag_index.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,45 @@
 import os
 from dotenv import load_dotenv
 
-load_dotenv()
+# 只读取项目目录下的 .env，不再逐级向上查找
+load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env"))
 
 class AppConfig:
     # 数据库配置
     SQLALCHEMY_DATABASE_URI = os.getenv("SQLALCHEMY_DATABASE_URI", "sqlite:///database.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # 数据库配置档：sqlite / postgresql，为空时根据连接串推断
+    DB_PROFILE = os.getenv("DB_PROFILE")
+    # SQLite：WAL + busy timeout + 连接池
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+    SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "10"))
+    SQLITE_MAX_OVERFLOW = int(os.getenv("SQLITE_MAX_OVERFLOW", "10"))
+    # PostgreSQL：连接池
+    PG_POOL_SIZE = int(os.getenv("PG_POOL_SIZE", "10"))
+    PG_MAX_OVERFLOW = int(os.getenv("PG_MAX_OVERFLOW", "20"))
+    PG_POOL_TIMEOUT = float(os.getenv("PG_POOL_TIMEOUT", "10"))
+    PG_POOL_RECYCLE = int(os.getenv("PG_POOL_RECYCLE", "1800"))
+    PG_POOL_PRE_PING = os.getenv("PG_POOL_PRE_PING", "true").lower() == "true"
+    # 准入控制：会话令牌桶限流（超限返回 429）+ 路由并发上限与有界等待队列（过载返回 503）
+    ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+    # 每个 session_id 每秒补充的令牌数（0 为不限流）与桶容量
+    RATE_LIMIT_PER_SESSION = float(os.getenv("RATE_LIMIT_PER_SESSION", "1"))
+    RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "10"))
+    RATE_LIMIT_MAX_SESSIONS = int(os.getenv("RATE_LIMIT_MAX_SESSIONS", "100000"))
+    RATE_LIMITED_ROUTES = os.getenv(
+        "RATE_LIMITED_ROUTES", "/stream_chat,/stream_chat/resume,/retrieve,/recommend,/knowledge_search,/web_search"
+    )
+    # 单进程各路由最大并发，格式 "/route=N,..."
+    ADMISSION_CONCURRENCY_LIMITS = os.getenv(
+        "ADMISSION_CONCURRENCY_LIMITS",
+        "/stream_chat=64,/stream_chat/resume=64,/retrieve=32,/recommend=16,/knowledge_search=32,/web_search=16",
+    )
+    # 每个路由的等待队列长度与最长等待（秒）
+    ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "32"))
+    ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "2"))
 
 
 class ApiKeyConfig:
@@ -19,6 +52,7 @@ class ApiKeyConfig:
     QWEN_BASE_URL = os.getenv("QWEN_BASE_URL")
     # 智能体 API 配置
     DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY")
+    DASHSCOPE_BASE_URL = os.getenv("DASHSCOPE_BASE_URL")
     # 长对话智能体
     LONG_SESSION_AGENT_ID = os.getenv("LONG_SESSION_AGENT_ID")
 
@@ -28,4 +62,220 @@ class PromptConfig:
     请判断用户问题与中学数学知识点是否相关。如果是，请提取与问题相关的联网搜索关键词。
     如果问题与数学无关，请返回空关键词列表。
     严格按照输出格式：{"related": true/false, "keywords": ["关键词1", "关键词2"]}。"""
+    # 引用内容的 token 预算与单个片段上限
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("PROMPT_CONTEXT_TOKEN_BUDGET", "1500"))
+    SNIPPET_MAX_TOKENS = int(os.getenv("PROMPT_SNIPPET_MAX_TOKENS", "300"))
+    # 智能体输入是否附带整理后的引用内容
+    AGENT_INCLUDE_REFERENCES = os.getenv("PROMPT_AGENT_INCLUDE_REFERENCES", "true").lower() == "true"
 
+
+class KnowledgeConfig:
+    # 知识库文件
+    KNOWLEDGE_FILE = os.getenv("KNOWLEDGE_FILE", "instance/knowledge.json")
+    # 本地分类器置信度阈值，低于该值时回退到 LLM 意图识别与类别判断
+    # 留出例题评估（benchmarks/eval_knowledge_classifier.py --sweep，265 条）：
+    # 0.35 时本地命中约 4%、准确率约 0.80；0.25 时命中约 16%、准确率仅约 0.77
+    CLASSIFIER_THRESHOLD = float(os.getenv("CLASSIFIER_THRESHOLD", "0.35"))
+    # 知识库文件 mtime 检查间隔（秒）
+    RELOAD_INTERVAL = float(os.getenv("KNOWLEDGE_RELOAD_INTERVAL", "2"))
+
+class RetrieveConfig:
+    # 并发检索线程数
+    MAX_WORKERS = int(os.getenv("RETRIEVE_MAX_WORKERS", "15"))
+    # 各数据源超时时间（秒），超时的数据源不返回结果
+    KNOWLEDGE_TIMEOUT = float(os.getenv("RETRIEVE_KNOWLEDGE_TIMEOUT", "10"))
+    WEB_TIMEOUT = float(os.getenv("RETRIEVE_WEB_TIMEOUT", "15"))
+    RAG_TIMEOUT = float(os.getenv("RETRIEVE_RAG_TIMEOUT", "5"))
+
+class PrefetchConfig:
+    # 创建问题时即在后台启动知识检索与联网搜索（推测执行），检索接口与 stream_chat 等待在途结果
+    ENABLED = os.getenv("PREFETCH_ENABLED", "false").lower() == "true"
+    # 预取线程数与同时在途的预取任务上限（超出时不预取，按原流程检索）
+    MAX_WORKERS = int(os.getenv("PREFETCH_MAX_WORKERS", "8"))
+    MAX_INFLIGHT = int(os.getenv("PREFETCH_MAX_INFLIGHT", "16"))
+    # 预取结果保留时间（秒）
+    TTL = float(os.getenv("PREFETCH_TTL", "300"))
+    # stream_chat 时检索结果尚未入库，等待在途预取的最长时间（秒）
+    STREAM_WAIT_TIMEOUT = float(os.getenv("PREFETCH_STREAM_WAIT_TIMEOUT", "5"))
+
+class WebSearchConfig:
+    # 搜索结果缓存（按关键词集合）过期时间（秒）
+    CACHE_TTL = int(os.getenv("WEB_SEARCH_CACHE_TTL", "21600"))
+    # 入库与返回的结果数上限、单条正文最大字符数
+    MAX_RESULTS = int(os.getenv("WEB_SEARCH_MAX_RESULTS", "8"))
+    CONTENT_MAX_CHARS = int(os.getenv("WEB_SEARCH_CONTENT_MAX_CHARS", "600"))
+
+class AsgiConfig:
+    # 上游流式请求超时（秒）：连接超时 / 两次读取之间的最大间隔
+    UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("ASGI_UPSTREAM_CONNECT_TIMEOUT", "5"))
+    UPSTREAM_READ_TIMEOUT = float(os.getenv("ASGI_UPSTREAM_READ_TIMEOUT", "60"))
+    # 上游连接池上限，即单进程最大并发流数
+    MAX_UPSTREAM_CONNECTIONS = int(os.getenv("ASGI_MAX_UPSTREAM_CONNECTIONS", "1000"))
+
+class StreamConfig:
+    # 部分回答检查点：每累计 N 个片段或间隔 N 秒写入一次
+    CHECKPOINT_CHUNKS = int(os.getenv("STREAM_CHECKPOINT_CHUNKS", "32"))
+    CHECKPOINT_INTERVAL = float(os.getenv("STREAM_CHECKPOINT_INTERVAL", "1"))
+    # 客户端断开后继续接收上游直到结束，回答完整入库，可通过续传接口获取
+    CONTINUE_ON_DISCONNECT = os.getenv("STREAM_CONTINUE_ON_DISCONNECT", "true").lower() == "true"
+    # 客户端断开后继续接收的最大流数（WSGI 后台线程数）
+    MAX_DETACHED_STREAMS = int(os.getenv("STREAM_MAX_DETACHED_STREAMS", "8"))
+    # 续传：回答仍在生成时的轮询间隔与最长等待（秒）
+    RESUME_POLL_INTERVAL = float(os.getenv("STREAM_RESUME_POLL_INTERVAL", "0.5"))
+    RESUME_TIMEOUT = float(os.getenv("STREAM_RESUME_TIMEOUT", "120"))
+
+class ResponseConfig:
+    # 响应体不小于该字节数时按 Accept-Encoding 压缩（已安装 brotli 时优先 br，否则 gzip）
+    COMPRESSION_ENABLED = os.getenv("RESPONSE_COMPRESSION_ENABLED", "true").lower() == "true"
+    COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+    GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
+    BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "5"))
+    # GET /knowledge_items/<id> 允许客户端与 CDN 缓存的秒数（过期后凭 ETag 重新验证）
+    KNOWLEDGE_MAX_AGE = int(os.getenv("RESPONSE_KNOWLEDGE_MAX_AGE", "300"))
+
+class ConversationConfig:
+    # 会话历史缓存：最多缓存的会话数（0 为每轮都从数据库读取）、每个会话保留的轮数
+    MAX_SESSIONS = int(os.getenv("CONVERSATION_MAX_SESSIONS", "10000"))
+    MAX_TURNS = int(os.getenv("CONVERSATION_MAX_TURNS", "5"))
+    # 每轮问题与总结保留的最大字符数
+    TURN_MAX_CHARS = int(os.getenv("CONVERSATION_TURN_MAX_CHARS", "300"))
+    # 缓存条目重新从数据库加载的间隔、空闲会话淘汰时间（秒）
+    TTL = float(os.getenv("CONVERSATION_TTL", "300"))
+    IDLE_TIMEOUT = float(os.getenv("CONVERSATION_IDLE_TIMEOUT", "1800"))
+    # 由缓存的历史总结在本地构建多轮上下文，不再向智能体传远端 session_id
+    LOCAL_CONTEXT = os.getenv("CONVERSATION_LOCAL_CONTEXT", "false").lower() == "true"
+    # 本地多轮上下文的 token 预算
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONVERSATION_CONTEXT_TOKEN_BUDGET", "600"))
+
+class CacheConfig:
+    # 回答缓存后端：memory / sqlite / none
+    BACKEND = os.getenv("ANSWER_CACHE_BACKEND", "memory")
+    TTL = int(os.getenv("ANSWER_CACHE_TTL", "86400"))
+    MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "10000"))
+    MAX_BYTES = int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    # 近似重复匹配（MinHash），相似度不低于阈值即视为命中；仅用于关键词提取，
+    # 回答与推荐只按精确键命中（改动一个系数的数学题相似度也很高，答案却不同）
+    NEAR_DUPLICATE = os.getenv("ANSWER_CACHE_NEAR_DUPLICATE", "true").lower() == "true"
+    NEAR_DUPLICATE_THRESHOLD = float(os.getenv("ANSWER_CACHE_NEAR_DUPLICATE_THRESHOLD", "0.9"))
+    # 仅缓存会话首轮问题的回答（后续轮次依赖上下文）
+    STREAM_FIRST_TURN_ONLY = os.getenv("ANSWER_CACHE_STREAM_FIRST_TURN_ONLY", "true").lower() == "true"
+
+class UpstreamConfig:
+    # 共享 HTTP 连接池大小
+    POOL_MAXSIZE = int(os.getenv("UPSTREAM_POOL_MAXSIZE", "20"))
+    # 连接超时（秒），读取超时按上游分别配置
+    CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "3"))
+    # 并发配额已满时的最长等待（秒）
+    ACQUIRE_TIMEOUT = float(os.getenv("UPSTREAM_ACQUIRE_TIMEOUT", "1"))
+    # 指数退避重试
+    MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))
+    BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", "0.2"))
+    BACKOFF_MAX = float(os.getenv("UPSTREAM_BACKOFF_MAX", "5"))
+    # 熔断：连续失败次数阈值 / 冷却时间（秒）
+    BREAKER_FAILURE_THRESHOLD = int(os.getenv("UPSTREAM_BREAKER_FAILURE_THRESHOLD", "5"))
+    BREAKER_RESET_TIMEOUT = float(os.getenv("UPSTREAM_BREAKER_RESET_TIMEOUT", "30"))
+    # 各上游读取超时（秒）与最大并发
+    QWEN_READ_TIMEOUT = float(os.getenv("UPSTREAM_QWEN_READ_TIMEOUT", "60"))
+    QWEN_MAX_CONCURRENCY = int(os.getenv("UPSTREAM_QWEN_MAX_CONCURRENCY", "10"))
+    ZHIPU_READ_TIMEOUT = float(os.getenv("UPSTREAM_ZHIPU_READ_TIMEOUT", "30"))
+    ZHIPU_MAX_CONCURRENCY = int(os.getenv("UPSTREAM_ZHIPU_MAX_CONCURRENCY", "5"))
+    DASHSCOPE_READ_TIMEOUT = float(os.getenv("UPSTREAM_DASHSCOPE_READ_TIMEOUT", "120"))
+    DASHSCOPE_MAX_CONCURRENCY = int(os.getenv("UPSTREAM_DASHSCOPE_MAX_CONCURRENCY", "20"))
+
+class JobConfig:
+    # 每次回答后入队对话总结任务
+    SUMMARY_ENABLED = os.getenv("JOB_SUMMARY_ENABLED", "true").lower() == "true"
+    # 单次领取的任务数，总结任务会合并为一次 LLM 调用
+    BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", "5"))
+    # 空闲时轮询间隔（秒）
+    POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+    # 重试：最大次数 / 退避基数（秒）/ 退避上限（秒）
+    MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+    BACKOFF_BASE = float(os.getenv("JOB_BACKOFF_BASE", "5"))
+    BACKOFF_MAX = float(os.getenv("JOB_BACKOFF_MAX", "600"))
+    # running 状态超过该时间视为 worker 异常退出，任务重新入队（秒）
+    VISIBILITY_TIMEOUT = float(os.getenv("JOB_VISIBILITY_TIMEOUT", "300"))
+
+class RecommendConfig:
+    # 回答入库后入队推荐任务，由 worker 批量生成并写入问题记录
+    ASYNC_ENABLED = os.getenv("RECOMMEND_ASYNC_ENABLED", "true").lower() == "true"
+    MODEL = os.getenv("RECOMMEND_MODEL", "qwen-max")
+    # 兜底推荐：参与类别共现统计的最近问题数与重新统计的间隔（秒）
+    HISTORY_LIMIT = int(os.getenv("RECOMMEND_HISTORY_LIMIT", "5000"))
+    HISTORY_REFRESH_INTERVAL = float(os.getenv("RECOMMEND_HISTORY_REFRESH_INTERVAL", "600"))
+
+class ModelRouterConfig:
+    # 关闭时各任务固定使用策略中的第一个模型（仍在失败时回退并统计）
+    ENABLED = os.getenv("MODEL_ROUTING_ENABLED", "true").lower() == "true"
+    # 各任务的候选模型，按质量从高到低排列，降级时改用最后一个
+    POLICY = os.getenv(
+        "MODEL_ROUTING_POLICY",
+        "intent=qwen-plus,qwen-turbo;category=qwen-plus,qwen-turbo;keywords=qwen-plus,qwen-turbo;"
+        f"summary=qwen-plus,qwen-turbo;recommend={RecommendConfig.MODEL},qwen-plus",
+    )
+    # 输入（用户问题）不超过该字符数的分类类任务直接降级
+    SHORT_INPUT_CHARS = int(os.getenv("MODEL_ROUTING_SHORT_INPUT_CHARS", "200"))
+    SHORT_INPUT_TASKS = os.getenv("MODEL_ROUTING_SHORT_INPUT_TASKS", "intent,category,keywords")
+    # Qwen 上游并发占用率超过该值时降级请求内任务；任务队列积压超过该值时降级后台任务
+    DEGRADE_LOAD = float(os.getenv("MODEL_ROUTING_DEGRADE_LOAD", "0.75"))
+    DEGRADE_BACKLOG = int(os.getenv("MODEL_ROUTING_DEGRADE_BACKLOG", "100"))
+    # 各任务的延迟预算（秒）：近期平均延迟超过预算或错误率超过上限的模型排到最后
+    LATENCY_BUDGETS = os.getenv("MODEL_ROUTING_LATENCY_BUDGETS", "intent=2,category=3,keywords=3,summary=20,recommend=20")
+    MAX_ERROR_RATE = float(os.getenv("MODEL_ROUTING_MAX_ERROR_RATE", "0.3"))
+    # 被排到最后的模型超过该时间（秒）没有新统计时重新参与选择
+    RECOVERY_TIME = float(os.getenv("MODEL_ROUTING_RECOVERY_TIME", "60"))
+
+class RagConfig:
+    # 本地向量索引目录（memmap 向量矩阵 + 片段原文）
+    INDEX_DIR = os.getenv("RAG_INDEX_DIR", "instance/rag_index")
+    # 哈希向量维度，修改后需重建索引
+    DIM = int(os.getenv("RAG_DIM", "512"))
+    # 切分：单个片段最大字符数 / 相邻窗口重叠字符数
+    CHUNK_CHARS = int(os.getenv("RAG_CHUNK_CHARS", "300"))
+    CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "50"))
+    # 检索返回的片段数与最低相似度
+    TOP_K = int(os.getenv("RAG_TOP_K", "5"))
+    MIN_SCORE = float(os.getenv("RAG_MIN_SCORE", "0.2"))
+    # 片段数超过该值时构建 IVF 近似索引，IVF 之后新增的行超过比例时重建
+    IVF_THRESHOLD = int(os.getenv("RAG_IVF_THRESHOLD", "50000"))
+    IVF_TAIL_RATIO = float(os.getenv("RAG_IVF_TAIL_RATIO", "0.2"))
+    IVF_NPROBE = int(os.getenv("RAG_IVF_NPROBE", "8"))
+    # 索引为空时启动阶段自动导入知识库
+    AUTO_BUILD = os.getenv("RAG_AUTO_BUILD", "true").lower() == "true"
+
+class ExportConfig:
+    # 导出目录（各表分片文件 + 水位线文件）
+    DIR = os.getenv("EXPORT_DIR", "instance/exports")
+    # auto：已安装 pyarrow 时为 Parquet，否则回退为 JSONL；可选 parquet / arrow / csv / jsonl
+    FORMAT = os.getenv("EXPORT_FORMAT", "auto")
+    # 每批读取的行数（键集分页），即导出时的内存上界
+    BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+    # 单个分片文件的最大行数，每写完一个分片推进一次水位线
+    ROWS_PER_FILE = int(os.getenv("EXPORT_ROWS_PER_FILE", "1000000"))
+    # 增量导出只按 id 推进，问题行插入后仍会更新（回答、总结）：每次重新导出该小时数内创建的行所在的分片，0 表示不重新导出
+    REEXPORT_HOURS = float(os.getenv("EXPORT_REEXPORT_HOURS", "24"))
+
+class ArchiveConfig:
+    # 归档目录（压缩段文件 + 边车索引）；为空时不读取归档
+    DIR = os.getenv("ARCHIVE_DIR", "instance/archive")
+    # 最后一次提问早于该天数的会话归档到冷存储
+    IDLE_DAYS = float(os.getenv("ARCHIVE_IDLE_DAYS", "90"))
+    # auto：已安装 zstandard 时为 zstd，否则回退为 gzip；可选 zstd / gzip
+    CODEC = os.getenv("ARCHIVE_CODEC", "auto")
+    # 每批归档的会话数（每批写入段文件后在一个事务中删除）
+    BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "200"))
+    # 压缩块大小（按需读取一个会话时最多解压一个块）与单个段文件的大小上限
+    BLOCK_BYTES = int(os.getenv("ARCHIVE_BLOCK_BYTES", str(256 * 1024)))
+    SEGMENT_MAX_BYTES = int(os.getenv("ARCHIVE_SEGMENT_MAX_BYTES", str(256 * 1024 * 1024)))
+    # Web 进程检查新归档段的间隔（秒）
+    RELOAD_INTERVAL = float(os.getenv("ARCHIVE_RELOAD_INTERVAL", "10"))
+
+class ObservabilityConfig:
+    # 延迟直方图与 /metrics
+    ENABLED = os.getenv("OBSERVABILITY_ENABLED", "true").lower() == "true"
+    # 阶段明细（span）写日志的请求采样率，0 表示只汇总直方图
+    TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+    # 追踪日志文件，为空时写 stderr
+    TRACE_LOG_FILE = os.getenv("TRACE_LOG_FILE")
+    # 终端调试输出（rich，同步写在请求路径上），默认关闭，本地调试时设为 true
+    CONSOLE_LOG = os.getenv("CONSOLE_LOG", "false").lower() == "true"
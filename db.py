@@ -1,14 +1,47 @@
 # db.py
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects import postgresql, sqlite
 
 from models import ApiSession, db
-from models import Session, Question, WebSearchResult, RAGResult, KnowledgeSearchResult
+from models import Session, Question, WebSearchResult, RAGResult, KnowledgeSearchResult, Job
+from utils.db_profile import engine_options, configure_engine
+from migrate import migrate
 
 def init_db(app):
     """初始化数据库"""
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config)
     db.init_app(app)
     with app.app_context():
+        engine = db.engine
+        configure_engine(engine, app.config)
         db.create_all()
+        # 结构迁移含表重建，只由 python migrate.py 执行；这里仅检查，避免多个进程启动时并发重建
+        pending = migrate(engine, dry_run=True)
+        if pending:
+            logging.getLogger(__name__).warning("数据库有 %d 个待执行的迁移（%s），请先执行 python migrate.py", len(pending), ", ".join(pending))
+    # master 中建立的连接不能跨 fork 共享：子进程丢弃继承的连接池（不关闭父进程的连接）
+    os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+
+@contextmanager
+def transaction():
+    """将多次写入合并为一次提交，异常时整体回滚"""
+    try:
+        yield db.session
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
 
 def create_session(session_id):
     """创建一个新的会话"""
@@ -37,104 +70,439 @@ def add_question_to_session(session_id, content):
         return False, str(e)
 
 
-def add_question_answer(question_id, answer):
-    question = Question.query.filter_by(id=question_id).first()
-    if not question:
+# 回答状态
+ANSWER_STREAMING = "streaming"
+ANSWER_DONE = "done"
+ANSWER_INTERRUPTED = "interrupted"
+
+def begin_answer(question_id, commit=True):
+    """开始流式回答：清空旧回答并标记为生成中"""
+    updated = Question.query.filter_by(id=question_id).update(
+        {"answer": "", "answer_status": ANSWER_STREAMING}, synchronize_session=False
+    )
+    if not updated:
         return False, "Question not found"
 
-    question.answer = answer
-    db.session.commit()
-    return True, question.id
+    if commit:
+        db.session.commit()
+    return True, question_id
 
-def add_question_summary(question_id, summary):
-    question = Question.query.filter_by(id=question_id).first()
-    if not question:
+def checkpoint_answer(question_id, answer, commit=True):
+    """写入部分回答检查点；回答已结束时不覆盖（检查点可能经 write-behind 队列延后写入）"""
+    updated = Question.query.filter(
+        Question.id == question_id, Question.answer_status == ANSWER_STREAMING
+    ).update({"answer": answer}, synchronize_session=False)
+
+    if commit:
+        db.session.commit()
+    return bool(updated), question_id
+
+def get_answer_state(question_id):
+    """获取回答及其状态（续传轮询用）"""
+    row = db.session.query(Question.answer, Question.answer_status).filter(Question.id == question_id).first()
+    if not row:
+        archived = _archived_question(question_id)
+        if archived is None:
+            return False, "Question not found"
+        return True, (archived["answer"] or "", archived["answer_status"])
+
+    return True, (row.answer or "", row.answer_status)
+
+def add_question_answer(question_id, answer, commit=True, prompt_tokens=None, status=ANSWER_DONE):
+    """写入回答（单条 UPDATE，无需先查询）"""
+    values = {"answer": answer, "answer_status": status}
+    if prompt_tokens is not None:
+        values["prompt_tokens"] = prompt_tokens
+    updated = Question.query.filter_by(id=question_id).update(values, synchronize_session=False)
+    if not updated:
+        return False, "Question not found"
+
+    if commit:
+        db.session.commit()
+    return True, question_id
+
+def add_question_summary(question_id, summary, commit=True):
+    """写入总结（单条 UPDATE，无需先查询）"""
+    updated = Question.query.filter_by(id=question_id).update({"summary": summary}, synchronize_session=False)
+    if not updated:
+        return False, "Question not found"
+
+    if commit:
+        db.session.commit()
+    return True, question_id
+
+def add_question_recommendations(question_id, recommendations, commit=True):
+    """写入推荐问题（JSON 数组字符串）"""
+    updated = Question.query.filter_by(id=question_id).update({"recommendations": recommendations}, synchronize_session=False)
+    if not updated:
         return False, "Question not found"
 
-    question.summary = summary
+    if commit:
+        db.session.commit()
+    return True, question_id
+
+def set_question_category(question_id, category_id, commit=True):
+    """记录知识检索命中的类别"""
+    Question.query.filter_by(id=question_id).update({"category_id": str(category_id)}, synchronize_session=False)
+    if commit:
+        db.session.commit()
+    return True, question_id
+
+def get_category_history(limit=5000):
+    """最近 limit 个已分类问题 (session_id, category_id, content)，按时间顺序"""
+    rows = db.session.query(Question.session_id, Question.category_id, Question.content).filter(
+        Question.category_id.isnot(None)
+    ).order_by(Question.id.desc()).limit(limit).all()
+    return True, [tuple(row) for row in reversed(rows)]
+
+def get_max_id(model):
+    """表当前最大 id（导出时固定上界，导出期间新增的行留给下一次增量导出）"""
+    return True, db.session.query(db.func.max(model.id)).scalar() or 0
+
+def get_last_id_before(created_at_column, before):
+    """
+    最后一个早于 before 创建的行的 id（没有时为 0）
+    按 id 倒序扫描，id 与创建时间同序递增，扫描的行数与 before 之后创建的行数相当，无需 created_at 索引
+    """
+    id_column = created_at_column.class_.id
+    row = (
+        db.session.query(id_column)
+        .filter(created_at_column < before)
+        .order_by(id_column.desc())
+        .limit(1)
+        .first()
+    )
+    return True, row[0] if row else 0
+
+def get_rows_after(columns, after_id, until_id, limit):
+    """
+    键集分页：按 id 顺序读取 after_id < id <= until_id 的一批行，只取列，不构造 ORM 对象
+    :param columns: 查询的列，第一列须为主键 id
+    """
+    id_column = columns[0]
+    rows = (
+        db.session.query(*columns)
+        .filter(id_column > after_id, id_column <= until_id)
+        .order_by(id_column)
+        .limit(limit)
+        .all()
+    )
+    # 每批结束读事务，长时间导出不占住快照（SQLite WAL 检查点 / PostgreSQL vacuum）
+    db.session.commit()
+    return True, rows
+
+def get_category_counts():
+    """按类别统计问题数、已回答数与回答平均长度，聚合在数据库端完成"""
+    answered = db.and_(Question.answer.isnot(None), Question.answer != "")
+    rows = db.session.query(
+        Question.category_id,
+        db.func.count(Question.id),
+        db.func.sum(db.case((answered, 1), else_=0)),
+        db.func.avg(db.case((answered, db.func.length(Question.answer)), else_=None)),
+    ).group_by(Question.category_id).all()
+    return True, [(category_id, count, int(answered or 0), avg) for category_id, count, answered, avg in rows]
+
+
+# 冷存储：已归档会话的问题与检索结果从线上表删除，getter 查不到时按需从归档段读取
+archive_reader = None
+
+ARCHIVED_COLUMNS = ("content", "answer", "summary", "prompt_tokens", "answer_status", "category_id", "recommendations")
+ARCHIVED_RESULT_MODELS = (
+    ("web_search_results", WebSearchResult),
+    ("rag_results", RAGResult),
+    ("knowledge_search_results", KnowledgeSearchResult),
+)
+
+def init_archive(reader):
+    """启用归档读取（utils.archive.ArchiveReader）"""
+    global archive_reader
+    archive_reader = reader
+    return archive_reader
+
+def _archived_question(question_id):
+    if archive_reader is None:
+        return None
+    return archive_reader.get_question(question_id)
+
+def _archived_session(session_id):
+    if archive_reader is None or not archive_reader.has_session(session_id):
+        return []
+    return archive_reader.session_questions(session_id)
+
+def _question_from_archive(archived):
+    """已归档的问题转为 Question 对象（不加入数据库会话，只读）"""
+    return Question(
+        id=archived["id"], session_id=archived["session_id"], created_at=datetime.fromisoformat(archived["created_at"]),
+        **{column: archived[column] for column in ARCHIVED_COLUMNS}
+    )
+
+def get_idle_sessions(cutoff, after_session_id, limit):
+    """
+    最后一次提问早于 cutoff 的会话（按 session_id 键集分页）
+    沿 (session_id, id) 索引顺序分组，多批合计只扫描一遍问题表
+    """
+    rows = (
+        db.session.query(Question.session_id)
+        .filter(Question.session_id > after_session_id)
+        .group_by(Question.session_id)
+        .having(db.func.max(Question.created_at) < cutoff)
+        .order_by(Question.session_id)
+        .limit(limit)
+        .all()
+    )
+    return True, [row.session_id for row in rows]
+
+def get_sessions_for_archive(session_ids):
+    """读取会话的全部问题及检索结果，返回 {session_id: [问题 dict]}"""
+    questions = (
+        db.session.query(Question.id, Question.session_id, Question.created_at,
+                         *(getattr(Question, column) for column in ARCHIVED_COLUMNS))
+        .filter(Question.session_id.in_(session_ids))
+        .order_by(Question.id)
+        .all()
+    )
+    question_ids = [row.id for row in questions]
+    results = {}
+    for key, model in ARCHIVED_RESULT_MODELS:
+        for question_id, content in (
+            db.session.query(model.question_id, model.content)
+            .filter(model.question_id.in_(question_ids))
+            .order_by(model.id)
+        ):
+            results.setdefault((key, question_id), []).append(content)
+
+    sessions = {session_id: [] for session_id in session_ids}
+    for row in questions:
+        archived = {"id": row.id, "created_at": row.created_at.isoformat()}
+        archived.update((column, getattr(row, column)) for column in ARCHIVED_COLUMNS)
+        for key, _ in ARCHIVED_RESULT_MODELS:
+            archived[key] = results.get((key, row.id), [])
+        sessions[row.session_id].append(archived)
+    return True, sessions
+
+def delete_questions(question_ids, chunk_size=500, commit=True):
+    """删除问题及其检索结果（归档后从线上表移除），返回删除的问题数"""
+    deleted = 0
+    for start in range(0, len(question_ids), chunk_size):
+        chunk = question_ids[start:start + chunk_size]
+        for _, model in ARCHIVED_RESULT_MODELS:
+            model.query.filter(model.question_id.in_(chunk)).delete(synchronize_session=False)
+        deleted += Question.query.filter(Question.id.in_(chunk)).delete(synchronize_session=False)
+    if commit:
+        db.session.commit()
+    return True, deleted
+
+def vacuum_database():
+    """回收已删除行占用的空间（SQLite 缩小数据库文件；PostgreSQL 标记可复用空间并更新统计）"""
     db.session.commit()
-    return True, question.id
+    dialect = db.engine.dialect.name
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("VACUUM ANALYZE" if dialect == "postgresql" else "VACUUM")
+    return True, dialect
 
 def get_question_by_id(question_id):
-    """根据问题ID获取问题"""
+    """根据问题ID获取问题（已归档的问题返回只读对象）"""
     current_question = Question.query.filter_by(id=question_id).first()
-    
+    if current_question is None:
+        archived = _archived_question(question_id)
+        if archived is not None:
+            current_question = _question_from_archive(archived)
+
     return True, current_question
 
 def get_answer_by_question_id(question_id):
     """根据问题ID获取回答"""
     question = Question.query.filter_by(id=question_id).first()
     if not question:
-        return False, "Question not found"
+        archived = _archived_question(question_id)
+        if archived is None:
+            return False, "Question not found"
+        return True, archived["answer"]
 
     return True, question.answer
 
 def get_previous_questions(session_id, question_id):
-    """获取先前的问题"""
+    """获取先前的问题（线上不足 5 个时由归档补齐）"""
     previous_questions = Question.query.filter(
         Question.session_id == session_id, Question.id < question_id
     ).order_by(Question.id.desc()).limit(5).all()
+    if len(previous_questions) < 5:
+        live_ids = {question.id for question in previous_questions}
+        archived = [
+            _question_from_archive(dict(data, session_id=session_id))
+            for data in reversed(_archived_session(session_id))
+            if data["id"] < question_id and data["id"] not in live_ids
+        ]
+        previous_questions = sorted(previous_questions + archived, key=lambda question: -question.id)[:5]
     return True, previous_questions
 
-def add_web_search_result(question_id, web_search_result):
+def get_conversation(session_id, limit=5, answer_chars=300):
+    """获取会话的 API 会话ID与最近 limit 轮已回答的问答（按时间顺序），只查询所需列，回答只取开头"""
+    rows = db.session.query(
+        Question.id, Question.content, Question.summary, db.func.substr(Question.answer, 1, answer_chars)
+    ).filter(
+        Question.session_id == session_id, Question.answer.isnot(None)
+    ).order_by(Question.id.desc()).limit(limit).all()
+    rows = [tuple(row) for row in rows]
+    if len(rows) < limit:
+        live_ids = {row[0] for row in rows}
+        rows += [
+            (data["id"], data["content"], data["summary"], data["answer"][:answer_chars])
+            for data in reversed(_archived_session(session_id))
+            if data["answer"] is not None and data["id"] not in live_ids
+        ]
+        rows = sorted(rows, key=lambda row: -row[0])[:limit]
+    if not rows:
+        # API 会话与回答（或其检查点）一同写入，尚无回答的会话不会有 API 会话
+        return True, (None, [])
+    api_session = db.session.query(ApiSession.api_session_id).filter_by(session_id=session_id).first()
+    return True, (api_session[0] if api_session else None, list(reversed(rows)))
+
+def get_question_summaries(question_ids):
+    """批量获取问题总结，返回 {question_id: summary}（尚未生成的不包含）"""
+    if not question_ids:
+        return True, {}
+    rows = db.session.query(Question.id, Question.summary).filter(
+        Question.id.in_(question_ids), Question.summary.isnot(None)
+    ).all()
+    summaries = dict(rows)
+    for question_id in question_ids:
+        if question_id not in summaries:
+            archived = _archived_question(question_id)
+            if archived is not None and archived["summary"] is not None:
+                summaries[question_id] = archived["summary"]
+    return True, summaries
+
+def add_web_search_result(question_id, web_search_result, commit=True):
     """添加网络搜索结果"""
-    question = Question.query.filter_by(id=question_id).first()
-    if not question:
+    if not db.session.get(Question, question_id):
         return False, "Question_Id not found"
 
     web_search_result = WebSearchResult(question_id=question_id, content=web_search_result)
     db.session.add(web_search_result)
-    db.session.commit()
+    if commit:
+        db.session.commit()
+    else:
+        db.session.flush()
     return True, web_search_result.id
 
-def add_rag_result(question_id, rag_result):
+def add_rag_result(question_id, rag_result, commit=True):
     """添加RAG结果"""
-    question = Question.query.filter_by(id=question_id).first()
-    if not question:
+    if not db.session.get(Question, question_id):
         return False, "Question_Id not found"
 
     rag_result = RAGResult(question_id=question_id, content=rag_result)
     db.session.add(rag_result)
-    db.session.commit()
-
+    if commit:
+        db.session.commit()
+    else:
+        db.session.flush()
     return True, rag_result.id
 
-def add_knowledge_search_result(question_id, knowledge_search_result):
+def add_knowledge_search_result(question_id, knowledge_search_result, commit=True):
     """添加知识搜索结果"""
-    question = Question.query.filter_by(id=question_id).first()
-    if not question:
+    if not db.session.get(Question, question_id):
         return False, "Question_Id not found"
 
     knowledge_search_result = KnowledgeSearchResult(question_id=question_id, content=knowledge_search_result)
     db.session.add(knowledge_search_result)
-    db.session.commit()
-
+    if commit:
+        db.session.commit()
+    else:
+        db.session.flush()
     return True, knowledge_search_result.id
 
 
-def get_retrieve_data(question_id):
-    """获取检索数据"""
-    web_search_result = WebSearchResult.query.filter_by(question_id=question_id).first()
-    rag_result = RAGResult.query.filter_by(question_id=question_id).first()
-    knowledge_search_result = KnowledgeSearchResult.query.filter_by(question_id=question_id).first()
-
-    retrieve_data = {
-        "web_search_result": web_search_result.content if web_search_result else '',
-        "rag_result": rag_result.content if rag_result else '', 
-        "knowledge_search_result": knowledge_search_result.content if knowledge_search_result else ''
+def _first_content(model, question_id_column):
+    """相关子查询：取问题的第一条检索结果"""
+    return (
+        db.session.query(model.content)
+        .filter(model.question_id == question_id_column)
+        .order_by(model.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+
+def _retrieve_columns(question_id_column):
+    return (
+        _first_content(WebSearchResult, question_id_column),
+        _first_content(RAGResult, question_id_column),
+        _first_content(KnowledgeSearchResult, question_id_column),
+    )
+
+def _to_retrieve_data(web_search_result, rag_result, knowledge_search_result):
+    return {
+        "web_search_result": web_search_result or '',
+        "rag_result": rag_result or '',
+        "knowledge_search_result": knowledge_search_result or ''
     }
 
-    return True, retrieve_data
+def _archived_retrieve_data(archived):
+    return _to_retrieve_data(*(
+        (archived[table] or [None])[0] for table in ("web_search_results", "rag_results", "knowledge_search_results")
+    ))
 
-def create_apisession(session_id, api_session_id=None):
-    """获取或创建API会话"""
-    api_session = ApiSession.query.filter_by(session_id=session_id).first()
-    if not api_session:
-        api_session = ApiSession(session_id=session_id, api_session_id=api_session_id)
-        db.session.add(api_session)
+def get_retrieve_data(question_id):
+    """获取检索数据（单次查询）"""
+    row = db.session.query(*_retrieve_columns(question_id)).one()
+    if not any(row):
+        archived = _archived_question(question_id)
+        if archived is not None:
+            return True, _archived_retrieve_data(archived)
+    return True, _to_retrieve_data(*row)
+
+def get_question_with_results(question_id):
+    """单次查询获取问题及其全部检索结果"""
+    row = db.session.query(Question, *_retrieve_columns(Question.id)).filter(Question.id == question_id).first()
+    if not row:
+        archived = _archived_question(question_id)
+        if archived is None:
+            return False, "Question not found"
+        return True, (_question_from_archive(archived), _archived_retrieve_data(archived))
+
+    question, *contents = row
+    return True, (question, _to_retrieve_data(*contents))
+
+def add_retrieve_results(question_id, retrieve_data, category_id=None):
+    """在同一事务中写入多个检索结果（及命中的知识类别），空结果跳过"""
+    try:
+        question = db.session.get(Question, question_id)
+        if not question:
+            return False, "Question_Id not found"
+        if category_id is not None:
+            question.category_id = str(category_id)
+
+        rows = []
+        if retrieve_data.get("web_search_result"):
+            rows.append(WebSearchResult(question_id=question_id, content=retrieve_data["web_search_result"]))
+        if retrieve_data.get("rag_result"):
+            rows.append(RAGResult(question_id=question_id, content=retrieve_data["rag_result"]))
+        if retrieve_data.get("knowledge_search_result"):
+            rows.append(KnowledgeSearchResult(question_id=question_id, content=retrieve_data["knowledge_search_result"]))
+
+        db.session.add_all(rows)
         db.session.commit()
+        return True, len(rows)
+    except Exception as e:
+        db.session.rollback()
+        return False, str(e)
 
-    return True, api_session.api_session_id
+def create_apisession(session_id, api_session_id=None, commit=True):
+    """
+    获取或创建API会话
+    流式检查点（write-behind 队列）与回答入库可能同时插入同一 api_session_id：冲突时忽略，不回滚所在事务
+    """
+    api_session = ApiSession.query.filter_by(session_id=session_id).first()
+    if api_session:
+        return True, api_session.api_session_id
+
+    dialect_insert = postgresql.insert if db.engine.dialect.name == "postgresql" else sqlite.insert
+    db.session.execute(
+        dialect_insert(ApiSession).values(session_id=session_id, api_session_id=api_session_id).on_conflict_do_nothing()
+    )
+    if commit:
+        db.session.commit()
+    return True, api_session_id
 
 def get_apisession(session_id):
     """获取API会话"""
@@ -142,4 +510,191 @@ def get_apisession(session_id):
     if not api_session:
         return False, None
 
-    return True, api_session.api_session_id
\ No newline at end of file
+    return True, api_session.api_session_id
+
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+def enqueue_job(kind, payload, max_attempts=5, delay=0, commit=True):
+    """后台任务入队（可与业务写入同一事务提交）"""
+    now = time.time()
+    job = Job(kind=kind, payload=json.dumps(payload), status=JOB_PENDING, attempts=0,
+              max_attempts=max_attempts, run_at=now + delay, created_at=now)
+    db.session.add(job)
+    if commit:
+        db.session.commit()
+    return True, job
+
+def claim_jobs(kind, worker_id, limit):
+    """原子领取一批到期任务"""
+    now = time.time()
+    ready = (
+        db.session.query(Job.id)
+        .filter(Job.kind == kind, Job.status == JOB_PENDING, Job.run_at <= now)
+        .order_by(Job.id)
+        .limit(limit)
+    )
+    if db.engine.dialect.name == "postgresql":
+        ready = ready.with_for_update(skip_locked=True)
+    ids = [row.id for row in ready]
+    if not ids:
+        db.session.commit()
+        return True, []
+
+    # status 条件保证多个 worker 并发领取时同一任务只会被一个 worker 拿到
+    Job.query.filter(Job.id.in_(ids), Job.status == JOB_PENDING).update(
+        {"status": JOB_RUNNING, "locked_by": worker_id, "locked_at": now, "attempts": Job.attempts + 1},
+        synchronize_session=False,
+    )
+    db.session.commit()
+    jobs = Job.query.filter(Job.id.in_(ids), Job.status == JOB_RUNNING, Job.locked_by == worker_id).all()
+    return True, jobs
+
+def complete_job(job, commit=True):
+    """标记任务完成"""
+    job.status = JOB_DONE
+    job.finished_at = time.time()
+    job.last_error = None
+    if commit:
+        db.session.commit()
+    return True, job.id
+
+def fail_job(job, error, backoff_base=5, backoff_max=600, commit=True):
+    """任务失败：未超过最大次数时按指数退避（带抖动）重新入队"""
+    job.last_error = str(error)[:2000]
+    job.locked_by = None
+    if job.attempts >= job.max_attempts:
+        job.status = JOB_FAILED
+        job.finished_at = time.time()
+    else:
+        delay = min(backoff_max, backoff_base * (2 ** (job.attempts - 1)))
+        job.status = JOB_PENDING
+        job.run_at = time.time() + random.uniform(delay / 2, delay)
+    if commit:
+        db.session.commit()
+    return True, job.status
+
+def requeue_stale_jobs(visibility_timeout):
+    """将超时未完成的 running 任务重新入队"""
+    count = Job.query.filter(Job.status == JOB_RUNNING, Job.locked_at < time.time() - visibility_timeout).update(
+        {"status": JOB_PENDING, "locked_by": None}, synchronize_session=False
+    )
+    db.session.commit()
+    return True, count
+
+def get_job_stats():
+    """队列深度（按类别/状态）与最早到期任务的等待时长"""
+    now = time.time()
+    depth = {}
+    for kind, status, count in db.session.query(Job.kind, Job.status, db.func.count(Job.id)).group_by(Job.kind, Job.status):
+        depth.setdefault(kind, {})[status] = count
+    lag = {}
+    for kind, oldest in (
+        db.session.query(Job.kind, db.func.min(Job.run_at))
+        .filter(Job.status == JOB_PENDING, Job.run_at <= now)
+        .group_by(Job.kind)
+    ):
+        lag[kind] = round(now - oldest, 3)
+    return True, {"depth": depth, "lag_seconds": lag}
+
+class WriteBehindQueue:
+    """
+    非关键写入的后台队列：按批合并为一次事务提交
+    入队的函数需支持 commit=False 参数
+    后台线程在首次入队时启动；线程不随 fork 继承，子进程中重建队列并重新启动
+    """
+
+    def __init__(self, app, batch_size=50, flush_interval=0.2, maxsize=10000, log=None):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.maxsize = maxsize
+        # 写入失败回调 log(message)
+        self.log = log
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+        atexit.register(self.flush)
+
+    def _reset(self):
+        self._queue = queue.Queue(maxsize=self.maxsize)
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    thread = threading.Thread(target=self._run, name="db-write-behind", daemon=True)
+                    thread.start()
+                    self._thread = thread
+
+    def enqueue(self, func, *args):
+        """入队；队列已满时在调用线程中同步写入"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((func, args))
+        except queue.Full:
+            with self.app.app_context():
+                func(*args)
+
+    def _drain(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        with self.app.app_context():
+            try:
+                with transaction():
+                    for func, args in batch:
+                        func(*args, commit=False)
+            except Exception:
+                # 整批失败时逐条重试，避免一条坏数据拖累整批
+                for func, args in batch:
+                    try:
+                        with transaction():
+                            func(*args, commit=False)
+                    except Exception as e:
+                        if self.log is not None:
+                            self.log(f"write-behind: {func.__name__}{args[:1]} failed: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _run(self):
+        while True:
+            self._write(self._drain(self._queue.get()))
+
+    def flush(self, timeout=5.0):
+        """等待队列写完（进程退出时调用）"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+
+write_behind = None
+
+def init_write_behind(app, **kwargs):
+    """启动非关键写入队列"""
+    global write_behind
+    if write_behind is None:
+        write_behind = WriteBehindQueue(app, **kwargs)
+    return write_behind
+
+def enqueue_write(func, *args):
+    """非关键写入：已启动队列时异步批量提交，否则同步写入"""
+    if write_behind is None:
+        return func(*args)
+    write_behind.enqueue(func, *args)
+    return True, None
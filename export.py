@@ -0,0 +1,201 @@
+# export.py
+"""
+批量导出与统计：问题、知识检索结果、联网搜索结果
+
+export（默认）：按 id 键集分页分批读取，流式写入列式文件（Parquet / Arrow IPC，未安装 pyarrow 时回退为 JSONL，
+也可指定 CSV），内存占用只与 --batch-size 有关。每张表记录已导出的最大 id（水位线），
+再次运行只导出新增的行；--full 忽略水位线全量导出。
+水位线只按 id 推进，只捕获新插入的行：检索结果表插入后不再修改；问题行插入后仍会写入回答、状态与总结，
+因此每次从 --reexport-hours 小时内创建的问题所在的分片起重新导出并替换这些分片，更早的行视为已定稿。
+输出：<dir>/<表名>/part-<起始id>.<扩展名>，水位线保存在 <dir>/_watermarks.json。
+
+categories：按知识点类别统计问题数、已回答数与回答平均长度（数据库端聚合），写入 <dir>/category_counts.json。
+
+用法：
+    python export.py [--tables questions,knowledge_search_results] [--format parquet] [--full] [--reexport-hours 24]
+    python export.py categories
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from config import ExportConfig
+from utils.export import TYPE_INT, TYPE_STR, TYPE_TIME, Watermarks, open_writer, resolve_format
+
+
+def question_row(row):
+    question_id, session_id, created_at, content, category_id, answer_status, prompt_tokens, answer, summary = row
+    try:
+        question = json.loads(content)
+    except ValueError:
+        question = {}
+    return (
+        question_id, session_id, created_at, question.get("user_question"), question.get("ocr_msg"), category_id,
+        answer_status, prompt_tokens, answer, len(answer) if answer else 0, summary,
+    )
+
+
+def export_tables():
+    """表名 -> (模型, 查询列, 输出列, 行转换, 创建时间列（插入后仍会修改的表，用于重新导出近期的行）)"""
+    from models import Question, KnowledgeSearchResult, WebSearchResult
+
+    result_columns = [("id", TYPE_INT), ("question_id", TYPE_INT), ("content", TYPE_STR)]
+    return {
+        "questions": (
+            Question,
+            (Question.id, Question.session_id, Question.created_at, Question.content, Question.category_id,
+             Question.answer_status, Question.prompt_tokens, Question.answer, Question.summary),
+            [("id", TYPE_INT), ("session_id", TYPE_STR), ("created_at", TYPE_TIME), ("user_question", TYPE_STR),
+             ("ocr_msg", TYPE_STR), ("category_id", TYPE_STR), ("answer_status", TYPE_STR), ("prompt_tokens", TYPE_INT),
+             ("answer", TYPE_STR), ("answer_chars", TYPE_INT), ("summary", TYPE_STR)],
+            question_row,
+            Question.created_at,
+        ),
+        "knowledge_search_results": (
+            KnowledgeSearchResult,
+            (KnowledgeSearchResult.id, KnowledgeSearchResult.question_id, KnowledgeSearchResult.content),
+            result_columns,
+            tuple,
+            None,
+        ),
+        "web_search_results": (
+            WebSearchResult,
+            (WebSearchResult.id, WebSearchResult.question_id, WebSearchResult.content),
+            result_columns,
+            tuple,
+            None,
+        ),
+    }
+
+
+def part_files(table_dir):
+    """已有分片，按起始 id 排序的 (起始id, 文件名)"""
+    return sorted((int(filename[5:17]), filename) for filename in os.listdir(table_dir) if filename.startswith("part-"))
+
+
+def restart_id(name, created_at, table_dir, watermarks, reexport_hours):
+    """近期创建的行仍可能被修改：返回需要重新导出的第一个分片的起始 id，无需重新导出时返回 None"""
+    from db import get_last_id_before
+
+    if created_at is None or reexport_hours <= 0:
+        return None
+    since = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=reexport_hours)
+    success, settled_id = get_last_id_before(created_at, since)
+    if settled_id >= watermarks.get(name):
+        return None
+    starts = [start for start, filename in part_files(table_dir) if start <= settled_id + 1]
+    return starts[-1] if starts else None
+
+
+def export_table(name, spec, out_dir, fmt, watermarks, full, batch_size, rows_per_file, reexport_hours=0):
+    """
+    导出一张表，返回导出的行数；每写完一个分片推进水位线，中断后可从上一个分片继续
+    全量导出或重新导出近期的行时，先回退水位线再删除被替换的分片（中断后不会留下水位线之前的空洞）
+    """
+    from db import get_max_id, get_rows_after
+
+    model, query_columns, columns, convert, created_at = spec
+    table_dir = os.path.join(out_dir, name)
+    os.makedirs(table_dir, exist_ok=True)
+    first_id = 1 if full else restart_id(name, created_at, table_dir, watermarks, reexport_hours)
+    if first_id is not None:
+        watermarks.set(name, first_id - 1)
+        for start, filename in part_files(table_dir):
+            if start >= first_id:
+                os.remove(os.path.join(table_dir, filename))
+    after_id = watermarks.get(name)
+    success, until_id = get_max_id(model)
+
+    exported = 0
+    writer = None
+    try:
+        while after_id < until_id:
+            success, rows = get_rows_after(query_columns, after_id, until_id, batch_size)
+            if not rows:
+                break
+            if writer is None:
+                writer = open_writer(os.path.join(table_dir, f"part-{rows[0][0]:012d}"), columns, fmt)
+            writer.write([convert(row) for row in rows])
+            after_id = rows[-1][0]
+            exported += len(rows)
+            if writer.rows >= rows_per_file:
+                writer.close()
+                writer = None
+                watermarks.set(name, after_id)
+        if writer is not None:
+            writer.close()
+            writer = None
+        watermarks.set(name, after_id)
+    finally:
+        if writer is not None:
+            writer.abort()
+    return exported
+
+
+def aggregate_categories(out_dir):
+    """按类别统计问题数，附知识点标题"""
+    from app import knowledge_base
+    from db import get_category_counts
+
+    success, rows = get_category_counts()
+    titles = {category_id: item.title for category_id, item in knowledge_base.snapshot.items.items()}
+    result = [
+        {
+            "category_id": category_id,
+            "title": titles.get(category_id, "unclassified" if category_id is None else None),
+            "questions": count,
+            "answered": answered,
+            "avg_answer_chars": round(avg_chars, 1) if avg_chars is not None else None,
+        }
+        for category_id, count, answered, avg_chars in sorted(rows, key=lambda row: -row[1])
+    ]
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, "category_counts.json")
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump({"generated_at": time.time(), "categories": result}, file, ensure_ascii=False, indent=2)
+    return path, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", nargs="?", choices=("export", "categories"), default="export")
+    parser.add_argument("--dir", default=ExportConfig.DIR, help="输出目录")
+    parser.add_argument("--tables", default="questions,knowledge_search_results,web_search_results")
+    parser.add_argument("--format", default=ExportConfig.FORMAT, help="auto / parquet / arrow / csv / jsonl")
+    parser.add_argument("--batch-size", type=int, default=ExportConfig.BATCH_SIZE)
+    parser.add_argument("--rows-per-file", type=int, default=ExportConfig.ROWS_PER_FILE)
+    parser.add_argument("--full", action="store_true", help="忽略水位线，全量导出")
+    parser.add_argument("--reexport-hours", type=float, default=ExportConfig.REEXPORT_HOURS,
+                        help="重新导出该小时数内创建的问题（插入后仍会更新），0 表示只导出新增的行")
+    args = parser.parse_args()
+
+    from app import app
+    from db import init_db
+
+    init_db(app)
+    with app.app_context():
+        if args.command == "categories":
+            path, result = aggregate_categories(args.dir)
+            for row in result[:20]:
+                print(f"{row['category_id']!s:>8} {row['questions']:>10} {row['answered']:>10}  {row['title']}")
+            print(f"{len(result)} categories -> {path}")
+            return
+
+        fmt = resolve_format(args.format)
+        if fmt != args.format and args.format != "auto":
+            print(f"pyarrow not installed, falling back to {fmt}")
+        tables = export_tables()
+        watermarks = Watermarks(os.path.join(args.dir, "_watermarks.json"))
+        for name in args.tables.split(","):
+            start = time.perf_counter()
+            exported = export_table(
+                name, tables[name], args.dir, fmt, watermarks, args.full, args.batch_size, args.rows_per_file,
+                args.reexport_hours,
+            )
+            print(f"{name}: {exported} row(s) as {fmt} in {time.perf_counter() - start:.2f} s, watermark {watermarks.get(name)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+# gunicorn.conf.py
+"""
+gunicorn -c gunicorn.conf.py wsgi:app
+
+preload_app：应用在 master 中导入并预加载知识库、分类器、兜底推荐器，
+worker fork 后写时复制共享这些只读数据；扩容时新 worker 无需重新导入与加载。
+上游客户端、HTTP 连接池、数据库连接池与后台写入线程都在 worker 内首次使用时创建。
+"""
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+preload_app = True
+# 流式回答可能持续较久
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "300"))
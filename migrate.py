@@ -0,0 +1,145 @@
+# migrate.py
+"""
+数据库结构迁移（可重复执行）
+
+1. 检索结果表 question_id 由 String(32) 改为 Integer（与 questions.id 一致），按表重建并拷贝数据
+2. 补充热点查询索引：questions(session_id, id)、api_sessions(session_id)、结果表 (question_id, id)
+3. 补充新增的可空列（如 questions.prompt_tokens、questions.answer_status、questions.recommendations）
+4. SQLite：questions 与结果表按 AUTOINCREMENT 重建（归档删除最大 id 的行后 id 不再被复用），索引随后补建
+
+表重建不能与服务并发执行：部署时先停服务（或在新版本启动前）执行一次；服务启动时只检查是否有待执行的迁移
+
+用法：python migrate.py
+"""
+import logging
+
+from flask import Flask
+from sqlalchemy import Integer, MetaData, inspect, text
+from sqlalchemy.schema import CreateTable
+
+from config import AppConfig
+from models import db, Question, ApiSession, WebSearchResult, RAGResult, KnowledgeSearchResult
+
+logger = logging.getLogger(__name__)
+
+RESULT_MODELS = (WebSearchResult, RAGResult, KnowledgeSearchResult)
+AUTOINCREMENT_MODELS = (Question,) + RESULT_MODELS
+INDEXED_MODELS = (Question, ApiSession) + RESULT_MODELS
+# 后续版本新增的可空列
+ADDED_COLUMNS = (
+    (Question, "prompt_tokens"),
+    (Question, "answer_status"),
+    (Question, "category_id"),
+    (Question, "recommendations"),
+)
+
+
+def _rebuild_result_table(conn, model):
+    """重建结果表：旧表改名 -> 按新结构建表 -> 转换并拷贝数据 -> 删除旧表"""
+    table = model.__tablename__
+    old_table = f"{table}__old"
+    conn.execute(text(f"ALTER TABLE {table} RENAME TO {old_table}"))
+    model.__table__.create(conn)
+    conn.execute(text(
+        f"INSERT INTO {table} (id, question_id, content) "
+        f"SELECT id, CAST(question_id AS INTEGER), content FROM {old_table}"
+    ))
+    conn.execute(text(f"DROP TABLE {old_table}"))
+    if conn.dialect.name == "postgresql":
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 1)) FROM {table}"
+        ))
+
+
+def _has_autoincrement(conn, table):
+    sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": table}).scalar()
+    return "AUTOINCREMENT" in (sql or "").upper()
+
+
+def _rebuild_autoincrement_table(conn, model):
+    """
+    SQLite 只能在建表时声明 AUTOINCREMENT：按新结构建临时表（不含索引）-> 拷贝数据 -> 删除旧表 -> 改名
+    其他表的外键按表名引用，改名后指向新表；sqlite_sequence 从拷贝的最大 id 起计
+    """
+    table = model.__tablename__
+    new_table = f"{table}__new"
+    # 外键需解析被引用的表：在独立的 MetaData 中复制其余表，不影响 db.metadata（create_all）
+    metadata = MetaData()
+    for other in db.metadata.sorted_tables:
+        if other is not model.__table__:
+            other.to_metadata(metadata)
+    conn.execute(CreateTable(model.__table__.to_metadata(metadata, name=new_table)))
+    existing = {column["name"] for column in inspect(conn).get_columns(table)}
+    columns = ", ".join(column.name for column in model.__table__.columns if column.name in existing)
+    conn.execute(text(f"INSERT INTO {new_table} ({columns}) SELECT {columns} FROM {table}"))
+    conn.execute(text(f"DROP TABLE {table}"))
+    conn.execute(text(f"ALTER TABLE {new_table} RENAME TO {table}"))
+
+
+def migrate(engine, dry_run=False):
+    """执行迁移，返回已执行的步骤；dry_run 时只检查并返回待执行的步骤"""
+    steps = []
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+
+    with engine.begin() as conn:
+        for model in RESULT_MODELS:
+            table = model.__tablename__
+            if table not in tables:
+                continue
+            columns = {column["name"]: column for column in inspector.get_columns(table)}
+            if not isinstance(columns["question_id"]["type"], Integer):
+                if not dry_run:
+                    logger.info("rebuild %s: question_id -> INTEGER", table)
+                    _rebuild_result_table(conn, model)
+                steps.append(f"rebuild:{table}")
+
+        for model, name in ADDED_COLUMNS:
+            table = model.__tablename__
+            if table not in tables:
+                continue
+            if name not in {column["name"] for column in inspector.get_columns(table)}:
+                column_type = model.__table__.c[name].type.compile(dialect=conn.dialect)
+                if not dry_run:
+                    logger.info("add column %s.%s", table, name)
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}"))
+                steps.append(f"column:{table}.{name}")
+
+        if conn.dialect.name == "sqlite":
+            for model in AUTOINCREMENT_MODELS:
+                table = model.__tablename__
+                if table in tables and not _has_autoincrement(conn, table):
+                    if not dry_run:
+                        logger.info("rebuild %s: AUTOINCREMENT", table)
+                        _rebuild_autoincrement_table(conn, model)
+                    steps.append(f"autoincrement:{table}")
+
+        for model in INDEXED_MODELS:
+            if model.__tablename__ not in tables:
+                continue
+            existing = {index["name"] for index in inspect(conn).get_indexes(model.__tablename__)}
+            for index in model.__table__.indexes:
+                if index.name not in existing:
+                    if not dry_run:
+                        logger.info("create index %s", index.name)
+                        index.create(conn)
+                    steps.append(f"index:{index.name}")
+
+    if engine.dialect.name == "sqlite" and steps and not dry_run:
+        with engine.connect() as conn:
+            conn.execute(text("ANALYZE"))
+    return steps
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    app = Flask(__name__)
+    app.config.from_object(AppConfig)
+    db.init_app(app)
+    with app.app_context():
+        steps = migrate(db.engine)
+    print(f"migration finished, {len(steps)} step(s) applied")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,7 @@ class Session(db.Model):
     __tablename__ = "sessions"
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     session_id = db.Column(db.String(32), unique=True, nullable=False)
-    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now(timezone.utc))
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
 
 class Question(db.Model):
     __tablename__ = "questions"
@@ -17,29 +17,89 @@ class Question(db.Model):
     content = db.Column(db.Text, nullable=False)
     answer = db.Column(db.Text, nullable=True)
     summary = db.Column(db.Text, nullable=True)
-    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now(timezone.utc))
+    # 智能体输入的估算 token 数
+    prompt_tokens = db.Column(db.Integer, nullable=True)
+    # 回答状态：streaming（生成中，answer 为最近一次检查点）/ done / interrupted
+    answer_status = db.Column(db.String(16), nullable=True)
+    # 知识检索命中的类别id（兜底推荐的类别共现统计）
+    category_id = db.Column(db.String(16), nullable=True)
+    # 回答入库后由 worker 生成的推荐问题（JSON 数组）
+    recommendations = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        # get_previous_questions / get_conversation: session_id = ? ORDER BY id DESC
+        db.Index("ix_questions_session_id_id", "session_id", "id"),
+        # SQLite 默认复用当前最大 rowid 之后的 id：归档删除最大 id 的行后，新行不能复用已归档问题的 id
+        {"sqlite_autoincrement": True},
+    )
 
 class WebSearchResult(db.Model):
     __tablename__ = "web_search_results"
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    question_id = db.Column(db.String(32), db.ForeignKey("questions.id"), nullable=False)
+    question_id = db.Column(db.Integer, db.ForeignKey("questions.id"), nullable=False)
     content = db.Column(db.Text, nullable=False)
 
+    __table_args__ = (
+        db.Index("ix_web_search_results_question_id_id", "question_id", "id"),
+        {"sqlite_autoincrement": True},
+    )
+
 class RAGResult(db.Model):
     __tablename__ = "rag_results"
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    question_id = db.Column(db.String(32), db.ForeignKey("questions.id"), nullable=False)
+    question_id = db.Column(db.Integer, db.ForeignKey("questions.id"), nullable=False)
     content = db.Column(db.Text, nullable=False)
     # java = db.Column(db.Text, nullable=False)
 
+    __table_args__ = (
+        db.Index("ix_rag_results_question_id_id", "question_id", "id"),
+        {"sqlite_autoincrement": True},
+    )
+
 class KnowledgeSearchResult(db.Model):
     __tablename__ = "knowledge_search_results"
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    question_id = db.Column(db.String(32), db.ForeignKey("questions.id"), nullable=False)
+    question_id = db.Column(db.Integer, db.ForeignKey("questions.id"), nullable=False)
     content = db.Column(db.Text, nullable=False)
 
+    __table_args__ = (
+        db.Index("ix_knowledge_search_results_question_id_id", "question_id", "id"),
+        {"sqlite_autoincrement": True},
+    )
+
 class ApiSession(db.Model):
     __tablename__ = "api_sessions"
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     api_session_id = db.Column(db.String(32), unique=True, nullable=False)
-    session_id = db.Column(db.String(32), db.ForeignKey("sessions.session_id"), nullable=False)
\ No newline at end of file
+    session_id = db.Column(db.String(32), db.ForeignKey("sessions.session_id"), nullable=False, index=True)
+
+class AnswerCacheEntry(db.Model):
+    __tablename__ = "answer_cache"
+    key = db.Column(db.String(40), primary_key=True)
+    kind = db.Column(db.String(32), nullable=False)
+    value = db.Column(db.Text, nullable=False)
+    signature = db.Column(db.Text, nullable=True)
+    expires_at = db.Column(db.Float, nullable=False, index=True)
+    accessed_at = db.Column(db.Float, nullable=False, index=True)
+
+class Job(db.Model):
+    __tablename__ = "jobs"
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    kind = db.Column(db.String(32), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    # pending / running / done / failed
+    status = db.Column(db.String(16), nullable=False, default="pending")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.Float, nullable=False)
+    locked_by = db.Column(db.String(64), nullable=True)
+    locked_at = db.Column(db.Float, nullable=True)
+    finished_at = db.Column(db.Float, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+
+    __table_args__ = (
+        # 领取任务：kind = ? AND status = 'pending' AND run_at <= ? ORDER BY id
+        db.Index("ix_jobs_kind_status_run_at", "kind", "status", "run_at"),
+    )
@@ -0,0 +1,189 @@
+# tests/test_upstream.py
+"""
+UpstreamClient 熔断与并发隔离
+
+用法：
+    python -m pytest tests/test_upstream.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.upstream import (
+    BulkheadFullError, CircuitBreaker, CircuitOpenError, RetryableStatusError, UpstreamClient, UpstreamPolicy,
+    UpstreamStatusError,
+)
+
+RESET_TIMEOUT = 0.05
+
+
+def make_client(max_concurrency=2):
+    policy = UpstreamPolicy(max_concurrency=max_concurrency, acquire_timeout=0.01, max_retries=0,
+                            backoff_base=0, failure_threshold=1, reset_timeout=RESET_TIMEOUT)
+    return UpstreamClient("test", policy)
+
+
+def trip(client):
+    def fail():
+        raise RetryableStatusError("test", 503)
+
+    with pytest.raises(Exception):
+        client.call(fail)
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+
+def test_half_open_allows_single_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=RESET_TIMEOUT)
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(RESET_TIMEOUT)
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # 试探进行中，其余调用被拒绝
+    assert not breaker.allow()
+
+
+def test_half_open_probe_expires():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=RESET_TIMEOUT)
+    breaker.record_failure()
+    time.sleep(RESET_TIMEOUT)
+    assert breaker.allow()
+    # 试探调用没有结论（如结果丢失），冷却时间后重新放行
+    time.sleep(RESET_TIMEOUT)
+    assert breaker.allow()
+
+
+def test_half_open_probe_success_closes():
+    client = make_client()
+    trip(client)
+    time.sleep(RESET_TIMEOUT)
+    assert client.call(lambda: "ok") == "ok"
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_probe_failure_reopens():
+    client = make_client()
+    trip(client)
+    time.sleep(RESET_TIMEOUT)
+    trip(client)
+    with pytest.raises(CircuitOpenError):
+        client.call(lambda: "ok")
+
+
+def test_non_retryable_error_releases_probe():
+    client = make_client()
+    trip(client)
+    time.sleep(RESET_TIMEOUT)
+
+    def bad_request():
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        client.call(bad_request)
+    # 不计入熔断，也不占住试探名额
+    assert client.breaker.state == CircuitBreaker.HALF_OPEN
+    assert client.call(lambda: "ok") == "ok"
+    assert client.breaker.state == CircuitBreaker.CLOSED
+    assert client.active == 0
+
+
+def test_stream_rejects_before_iteration():
+    client = make_client(max_concurrency=1)
+    responses = client.stream(lambda: iter([1, 2, 3]))
+    assert client.active == 1
+    # 并发已满在调用时即抛出，而不是在迭代时
+    with pytest.raises(BulkheadFullError):
+        client.stream(lambda: iter([1]))
+    assert list(responses) == [1, 2, 3]
+    assert client.active == 0
+
+    trip(client)
+    with pytest.raises(CircuitOpenError):
+        client.stream(lambda: iter([1]))
+    assert client.active == 0
+
+
+def test_stream_close_releases_permit():
+    client = make_client(max_concurrency=1)
+    responses = client.stream(lambda: iter([1, 2, 3]))
+    assert next(responses) == 1
+    responses.close()
+    responses.close()
+    assert client.active == 0
+    assert list(responses) == []
+
+
+def test_stream_non_retryable_error_releases_probe():
+    client = make_client()
+    trip(client)
+    time.sleep(RESET_TIMEOUT)
+
+    def bad_request():
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        client.stream(bad_request)
+    assert client.active == 0
+    assert list(client.stream(lambda: iter([1]))) == [1]
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+async def chunks(*items, status_code=200):
+    if status_code != 200:
+        raise UpstreamStatusError("test", status_code)
+    for item in items:
+        yield item
+
+
+def test_astream_status_error_before_first_chunk():
+    async def run():
+        client = make_client()
+        with pytest.raises(UpstreamStatusError) as excinfo:
+            await client.astream(chunks, 1, status_code=400)
+        assert excinfo.value.status_code == 400
+        assert client.active == 0
+        assert client.breaker.state == CircuitBreaker.CLOSED
+
+        upstream = await client.astream(chunks, 1, 2)
+        assert client.active == 1
+        assert [item async for item in upstream] == [1, 2]
+        assert client.active == 0
+
+    asyncio.run(run())
+
+
+def test_astream_shares_breaker():
+    async def run():
+        sync_client = make_client()
+        async_client = UpstreamClient("test", sync_client.policy, breaker=sync_client.breaker)
+        trip(sync_client)
+        with pytest.raises(CircuitOpenError):
+            await async_client.astream(chunks, 1)
+        assert async_client.active == 0
+
+    asyncio.run(run())
+
+
+def test_astream_cancelled_wait_releases_permit():
+    async def run():
+        client = make_client(max_concurrency=1)
+        client.policy.acquire_timeout = 1.0
+        held = await client.astream(chunks, 1)
+        waiting = asyncio.ensure_future(client.astream(chunks, 2))
+        await asyncio.sleep(0.05)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        await held.aclose()
+        await asyncio.sleep(0.1)
+        # 等待线程拿到的配额已释放
+        assert client.active == 0
+        upstream = await client.astream(chunks, 3)
+        assert [item async for item in upstream] == [3]
+
+    asyncio.run(run())
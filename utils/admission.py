@@ -0,0 +1,202 @@
+# utils/admission.py
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+class AdmissionRejected(Exception):
+    """请求被准入控制拒绝：status 为 429（会话限流）或 503（过载），retry_after 为建议重试间隔（秒）"""
+
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucketLimiter:
+    """按键（session_id）的令牌桶限流，桶数超过 max_keys 时淘汰最久未访问的桶"""
+
+    def __init__(self, rate, burst, max_keys=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key):
+        """取一个令牌：成功返回 0，否则返回需等待的秒数"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+class Permit:
+    """并发配额，release 可重复调用"""
+    __slots__ = ("gate", "start", "released")
+
+    def __init__(self, gate):
+        self.gate = gate
+        self.start = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.gate._release(time.monotonic() - self.start)
+
+
+class ConcurrencyGate:
+    """
+    路由级并发上限 + 有界等待队列
+    - 并发已满时进入等待队列，队列已满或预计等待超过 queue_timeout 时立即拒绝（503）
+    - 等待超过 queue_timeout 的请求被丢弃，不再占用上游
+    - 预计等待按配额平均占用时长（EWMA）估算，同时作为 Retry-After
+    """
+
+    def __init__(self, name, limit, queue_size, queue_timeout):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self.hold_time = 1.0
+        self.admitted = self.shed = 0
+        self._cond = threading.Condition()
+
+    def _expected_wait(self, position):
+        # 占用中的配额平均每 hold_time / limit 秒释放一个
+        return self.hold_time * (position + 1) / self.limit
+
+    def _reject(self, reason):
+        self.shed += 1
+        raise AdmissionRejected(f"{self.name} overloaded: {reason}", 503, self._expected_wait(self.waiting))
+
+    def try_acquire(self):
+        """不等待：有空闲配额时返回 Permit，否则返回 None"""
+        with self._cond:
+            if self.active < self.limit and not self.waiting:
+                self.active += 1
+                self.admitted += 1
+                return Permit(self)
+        return None
+
+    def acquire(self):
+        """获取配额（可能在队列中等待），被拒绝时抛出 AdmissionRejected"""
+        with self._cond:
+            if self.active < self.limit and not self.waiting:
+                self.active += 1
+                self.admitted += 1
+                return Permit(self)
+            if self.waiting >= self.queue_size:
+                self._reject("queue full")
+            if self._expected_wait(self.waiting) > self.queue_timeout:
+                # 按当前占用时长估算无法在截止时间内轮到，直接拒绝
+                self._reject("expected wait exceeds deadline")
+            deadline = time.monotonic() + self.queue_timeout
+            self.waiting += 1
+            try:
+                while self.active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._reject("queue timeout")
+                    self._cond.wait(remaining)
+                self.active += 1
+                self.admitted += 1
+                return Permit(self)
+            finally:
+                self.waiting -= 1
+
+    def _release(self, held):
+        with self._cond:
+            self.active -= 1
+            self.hold_time = self.hold_time * 0.9 + held * 0.1
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "limit": self.limit,
+                "active": self.active,
+                "waiting": self.waiting,
+                "admitted": self.admitted,
+                "shed": self.shed,
+                "hold_time_ms": round(self.hold_time * 1000, 1),
+            }
+
+
+class AdmissionController:
+    """准入控制：会话令牌桶限流（429）+ 路由并发上限与等待队列（503）"""
+
+    def __init__(self, limiter=None, rate_limited_routes=(), gates=None):
+        self.limiter = limiter
+        self.rate_limited_routes = frozenset(rate_limited_routes)
+        self.gates = gates or {}
+        self.rate_limited = 0
+
+    def check_rate(self, route, key):
+        if self.limiter is None or route not in self.rate_limited_routes or not key:
+            return
+        wait = self.limiter.take(key)
+        if wait:
+            self.rate_limited += 1
+            raise AdmissionRejected("Too many requests for this session", 429, wait)
+
+    def try_acquire(self, route):
+        """返回 (Permit 或 None, 是否需要排队)"""
+        gate = self.gates.get(route)
+        if gate is None:
+            return None, False
+        permit = gate.try_acquire()
+        return permit, permit is None
+
+    def acquire(self, route):
+        gate = self.gates.get(route)
+        return gate.acquire() if gate is not None else None
+
+    def admit(self, route, key):
+        """限流检查 + 获取并发配额（可能阻塞至 queue_timeout），无需配额的路由返回 None"""
+        self.check_rate(route, key)
+        return self.acquire(route)
+
+    def stats(self):
+        return {
+            "rate_limited": self.rate_limited,
+            "routes": {route: gate.stats() for route, gate in self.gates.items()},
+        }
+
+
+def parse_route_limits(value):
+    """解析 "/stream_chat=64,/recommend=16" 形式的配置"""
+    limits = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            route, limit = item.split("=", 1)
+            limits[route.strip()] = int(limit)
+    return limits
+
+
+def create_admission_controller(config):
+    """根据 AppConfig 创建准入控制器，未启用时返回 None"""
+    if not config.ADMISSION_ENABLED:
+        return None
+    limiter = None
+    if config.RATE_LIMIT_PER_SESSION > 0:
+        limiter = TokenBucketLimiter(config.RATE_LIMIT_PER_SESSION, config.RATE_LIMIT_BURST, config.RATE_LIMIT_MAX_SESSIONS)
+    gates = {
+        route: ConcurrencyGate(route, limit, config.ADMISSION_QUEUE_SIZE, config.ADMISSION_QUEUE_TIMEOUT)
+        for route, limit in parse_route_limits(config.ADMISSION_CONCURRENCY_LIMITS).items() if limit > 0
+    }
+    routes = [route.strip() for route in config.RATE_LIMITED_ROUTES.split(",") if route.strip()]
+    return AdmissionController(limiter, routes, gates)
@@ -0,0 +1,382 @@
+# utils/answer_cache.py
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+# 缓存类别
+KIND_STREAM_CHAT = "stream_chat"
+KIND_RECOMMEND = "recommend"
+KIND_KEYWORDS = "keywords"
+KIND_SUMMARY = "summary"
+KIND_WEB_SEARCH = "web_search"
+
+_NORMALIZE_RE = re.compile(r"[\s，。？！、；：,.?!;:\"'“”‘’（）()\[\]【】]+")
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def normalize_text(text):
+    """去除空白与标点，统一小写"""
+    return _NORMALIZE_RE.sub("", str(text or "")).lower()
+
+
+def question_cache_text(user_input):
+    """问题文本 + OCR 文本作为缓存键"""
+    return normalize_text(user_input.get("user_question")) + "\x00" + normalize_text(user_input.get("ocr_msg"))
+
+
+def replay_chunks(text, chunk_size=32):
+    """将缓存的回答按片段回放，保持与上游一致的流式输出"""
+    for start in range(0, len(text), chunk_size):
+        yield text[start:start + chunk_size]
+
+
+class MinHasher:
+    """字符 shingle 的 MinHash 签名"""
+
+    def __init__(self, num_perm=64, shingle_size=3, seed=1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.perms = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME)) for _ in range(num_perm)]
+
+    def _shingles(self, text):
+        size = self.shingle_size
+        if len(text) <= size:
+            return {text}
+        return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+    def signature(self, text):
+        hashes = [
+            int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "little")
+            for shingle in self._shingles(text)
+        ]
+        return [
+            min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self.perms
+        ]
+
+    @staticmethod
+    def similarity(sig_a, sig_b):
+        """估计 Jaccard 相似度"""
+        if not sig_a or len(sig_a) != len(sig_b):
+            return 0.0
+        return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+
+class LSHIndex:
+    """MinHash 分段（banding）索引，用于查找近似重复候选"""
+
+    def __init__(self, num_perm, bands):
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.buckets = defaultdict(set)
+        self.keys = {}
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            start = band * self.rows
+            yield band, tuple(signature[start:start + self.rows])
+
+    def add(self, key, signature):
+        self.keys[key] = signature
+        for band_key in self._band_keys(signature):
+            self.buckets[band_key].add(key)
+
+    def remove(self, key):
+        signature = self.keys.pop(key, None)
+        if signature is None:
+            return
+        for band_key in self._band_keys(signature):
+            bucket = self.buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self.buckets[band_key]
+
+    def query(self, signature):
+        candidates = set()
+        for band_key in self._band_keys(signature):
+            candidates |= self.buckets.get(band_key, set())
+        return [(key, self.keys[key]) for key in candidates]
+
+
+class MemoryCacheBackend:
+    """进程内 LRU 存储，按条目数与字节数限制容量"""
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """返回 (value, expires_at)，不存在时返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0], entry[1]
+
+    def put(self, key, kind, value, signature, expires_at):
+        """写入条目，返回被淘汰的键"""
+        size = len(value.encode("utf-8"))
+        evicted = []
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                evicted_key, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                evicted.append(evicted_key)
+        return evicted
+
+    def delete(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[2]
+
+    def signatures(self):
+        return []
+
+    def size(self):
+        return len(self._entries)
+
+
+class SQLCacheBackend:
+    """
+    存储在业务数据库 answer_cache 表中，多进程共享
+    读取只查询不写入：命中的访问时间先记在内存中，下次写入时随同一事务批量更新（淘汰只在写入时进行）
+    """
+
+    def __init__(self, app, max_entries=100000, trim_interval=100):
+        self.app = app
+        self.max_entries = max_entries
+        self.trim_interval = trim_interval
+        self._writes = 0
+        self._accessed = {}
+        self._accessed_lock = threading.Lock()
+
+    def get(self, key):
+        from models import db, AnswerCacheEntry
+
+        with self.app.app_context():
+            row = db.session.query(AnswerCacheEntry.value, AnswerCacheEntry.expires_at).filter_by(key=key).first()
+        if row is None:
+            return None
+        with self._accessed_lock:
+            self._accessed[key] = time.time()
+        return row.value, row.expires_at
+
+    def _flush_accessed(self):
+        """批量写入内存中累积的访问时间（不提交，由调用方提交）"""
+        from models import db, AnswerCacheEntry
+
+        with self._accessed_lock:
+            accessed, self._accessed = self._accessed, {}
+        if accessed:
+            # 核心层 executemany：条目可能已被淘汰，不检查更新行数
+            table = AnswerCacheEntry.__table__
+            db.session.connection().execute(
+                table.update().where(table.c.key == db.bindparam("cache_key")).values(accessed_at=db.bindparam("cache_accessed_at")),
+                [{"cache_key": key, "cache_accessed_at": accessed_at} for key, accessed_at in accessed.items()],
+            )
+
+    def put(self, key, kind, value, signature, expires_at):
+        from models import db, AnswerCacheEntry
+
+        with self.app.app_context():
+            entry = db.session.get(AnswerCacheEntry, key)
+            if entry is None:
+                entry = AnswerCacheEntry(key=key, kind=kind)
+                db.session.add(entry)
+            entry.value = value
+            entry.signature = json.dumps(signature) if signature else None
+            entry.expires_at = expires_at
+            entry.accessed_at = time.time()
+            self._flush_accessed()
+            db.session.commit()
+
+            self._writes += 1
+            if self._writes % self.trim_interval == 0:
+                return self._trim()
+        return []
+
+    def _trim(self):
+        """删除过期条目，并按最近访问时间淘汰超出容量的条目"""
+        from models import db, AnswerCacheEntry
+
+        expired = [row.key for row in AnswerCacheEntry.query.filter(AnswerCacheEntry.expires_at < time.time()).with_entities(AnswerCacheEntry.key)]
+        overflow = AnswerCacheEntry.query.count() - len(expired) - self.max_entries
+        if overflow > 0:
+            expired += [
+                row.key for row in AnswerCacheEntry.query.filter(AnswerCacheEntry.expires_at >= time.time())
+                .order_by(AnswerCacheEntry.accessed_at.asc()).limit(overflow).with_entities(AnswerCacheEntry.key)
+            ]
+        if expired:
+            AnswerCacheEntry.query.filter(AnswerCacheEntry.key.in_(expired)).delete(synchronize_session=False)
+            db.session.commit()
+        return expired
+
+    def delete(self, key):
+        from models import db, AnswerCacheEntry
+
+        with self.app.app_context():
+            AnswerCacheEntry.query.filter_by(key=key).delete()
+            db.session.commit()
+
+    def signatures(self):
+        """启动时重建近似索引"""
+        from models import AnswerCacheEntry
+
+        with self.app.app_context():
+            rows = AnswerCacheEntry.query.filter(
+                AnswerCacheEntry.signature.isnot(None), AnswerCacheEntry.expires_at >= time.time()
+            ).with_entities(AnswerCacheEntry.key, AnswerCacheEntry.kind, AnswerCacheEntry.signature)
+            return [(row.key, row.kind, json.loads(row.signature)) for row in rows]
+
+    def size(self):
+        from models import AnswerCacheEntry
+
+        with self.app.app_context():
+            return AnswerCacheEntry.query.count()
+
+
+class AnswerCache:
+    """
+    LLM 回答缓存
+    精确层：规范化文本的哈希；近似层（可选）：MinHash + LSH，相似度不低于阈值即命中
+    """
+
+    def __init__(self, backend, ttl=86400, near_duplicate_threshold=0.9, num_perm=64, bands=16):
+        self.backend = backend
+        self.ttl = ttl
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.hasher = MinHasher(num_perm=num_perm)
+        self.num_perm = num_perm
+        self.bands = bands
+        self._indexes = defaultdict(lambda: LSHIndex(self.num_perm, self.bands))
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.counters = defaultdict(int)
+
+    @staticmethod
+    def make_key(kind, text):
+        return hashlib.sha1(f"{kind}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _ensure_index(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            for key, kind, signature in self.backend.signatures():
+                self._indexes[kind].add(key, signature)
+            self._loaded = True
+
+    def _lookup(self, key):
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.time():
+            self.backend.delete(key)
+            return None
+        return value
+
+    def get(self, kind, text, near_duplicate=False):
+        """
+        查询缓存
+        :param kind: 缓存类别
+        :param text: 规范化后的文本
+        :param near_duplicate: 是否启用近似匹配
+        :return: 缓存值，未命中返回 None
+        """
+        value = self._lookup(self.make_key(kind, text))
+        if value is not None:
+            self._count(kind, "hit_exact")
+            return value
+
+        if near_duplicate and self.near_duplicate_threshold:
+            self._ensure_index()
+            signature = self.hasher.signature(text)
+            with self._lock:
+                candidates = self._indexes[kind].query(signature)
+            best_key, best_score = None, 0.0
+            for key, candidate in candidates:
+                score = MinHasher.similarity(signature, candidate)
+                if score > best_score:
+                    best_key, best_score = key, score
+            if best_key and best_score >= self.near_duplicate_threshold:
+                value = self._lookup(best_key)
+                if value is not None:
+                    self._count(kind, "hit_near")
+                    return value
+                with self._lock:
+                    self._indexes[kind].remove(best_key)
+
+        self._count(kind, "miss")
+        return None
+
+    def put(self, kind, text, value, near_duplicate=False, ttl=None):
+        """写入缓存，ttl 为空时使用默认过期时间"""
+        if not value:
+            return
+        key = self.make_key(kind, text)
+        signature = self.hasher.signature(text) if near_duplicate and self.near_duplicate_threshold else None
+        evicted = self.backend.put(key, kind, value, signature, time.time() + (ttl or self.ttl))
+        with self._lock:
+            if signature:
+                self._indexes[kind].add(key, signature)
+            for evicted_key in evicted:
+                for index in self._indexes.values():
+                    index.remove(evicted_key)
+
+    def _count(self, kind, name):
+        with self._lock:
+            self.counters[f"{kind}.{name}"] += 1
+            self.counters[name] += 1
+
+    def stats(self):
+        """命中/未命中计数"""
+        with self._lock:
+            stats = dict(self.counters)
+        lookups = stats.get("hit_exact", 0) + stats.get("hit_near", 0) + stats.get("miss", 0)
+        stats["hit_rate"] = round((lookups - stats.get("miss", 0)) / lookups, 4) if lookups else 0.0
+        stats["entries"] = self.backend.size()
+        return stats
+
+
+class NullAnswerCache:
+    """关闭缓存时使用"""
+
+    def get(self, kind, text, near_duplicate=False):
+        return None
+
+    def put(self, kind, text, value, near_duplicate=False, ttl=None):
+        pass
+
+    def stats(self):
+        return {"enabled": False}
+
+
+def create_answer_cache(app, config):
+    """根据配置创建回答缓存"""
+    if config.BACKEND == "memory":
+        backend = MemoryCacheBackend(config.MAX_ENTRIES, config.MAX_BYTES)
+    elif config.BACKEND == "sqlite":
+        backend = SQLCacheBackend(app, config.MAX_ENTRIES)
+    else:
+        return NullAnswerCache()
+    threshold = config.NEAR_DUPLICATE_THRESHOLD if config.NEAR_DUPLICATE else None
+    return AnswerCache(backend, ttl=config.TTL, near_duplicate_threshold=threshold)
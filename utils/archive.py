@@ -0,0 +1,306 @@
+# utils/archive.py
+import bisect
+import gzip
+import json
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+CODEC_AUTO = "auto"
+CODEC_ZSTD = "zstd"
+CODEC_GZIP = "gzip"
+
+EXTENSIONS = {CODEC_ZSTD: ".jsonl.zst", CODEC_GZIP: ".jsonl.gz"}
+INDEX_EXTENSION = ".idx.jsonl"
+SEGMENT_PREFIX = "segment-"
+
+
+def zstd_available():
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def resolve_codec(requested):
+    """auto 优先 zstd；未安装 zstandard 时回退为 gzip"""
+    if requested not in EXTENSIONS and requested != CODEC_AUTO:
+        raise ValueError(f"unknown archive codec: {requested}")
+    if requested in (CODEC_AUTO, CODEC_ZSTD) and not zstd_available():
+        return CODEC_GZIP
+    return CODEC_ZSTD if requested == CODEC_AUTO else requested
+
+
+def _compress(codec, data):
+    if codec == CODEC_ZSTD:
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def _decompress(codec, data):
+    if codec == CODEC_ZSTD:
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def _codec_of(filename):
+    for codec, extension in EXTENSIONS.items():
+        if filename.endswith(extension):
+            return codec
+    return None
+
+
+def _record_prefix(session_id):
+    # 记录以 session_id 开头，块内按前缀查找，无需解析其它会话
+    return '{"session_id": %s' % json.dumps(session_id, ensure_ascii=False)
+
+
+class SegmentWriter:
+    """
+    归档段写入：会话记录（每行一个 JSON）攒满 block_bytes 后压缩为一个独立的帧（gzip member / zstd frame）追加写入，
+    整个段文件仍是合法的 .jsonl.gz / .jsonl.zst；边车索引每块一行：{offset, length, sessions, question_ids}
+    段文件只追加：块落盘（fsync）后才写索引，读取方只看到已完整写入的块
+    """
+
+    def __init__(self, directory, codec, block_bytes=256 * 1024, segment_max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.codec = codec
+        self.block_bytes = block_bytes
+        self.segment_max_bytes = segment_max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._segment = None
+        self._index = None
+        self._lines = []
+        self._sessions = []
+        self._question_ids = []
+        self._pending = 0
+        self.sessions = self.questions = 0
+        self.raw_bytes = self.compressed_bytes = 0
+
+    def _open_segment(self):
+        numbers = [
+            int(name[len(SEGMENT_PREFIX):].split(".", 1)[0])
+            for name in os.listdir(self.directory) if name.startswith(SEGMENT_PREFIX)
+        ]
+        name = f"{SEGMENT_PREFIX}{max(numbers, default=0) + 1:06d}"
+        self._segment = open(os.path.join(self.directory, name + EXTENSIONS[self.codec]), "ab")
+        self._index = open(os.path.join(self.directory, name + INDEX_EXTENSION), "a", encoding="utf-8")
+
+    def write(self, session_id, questions):
+        """
+        写入一个会话
+        :param questions: [问题 dict]，每个含 id 与各检索结果列表
+        """
+        line = json.dumps({"session_id": session_id, "questions": questions}, ensure_ascii=False) + "\n"
+        self._lines.append(line.encode("utf-8"))
+        self._sessions.append(session_id)
+        self._question_ids.extend(question["id"] for question in questions)
+        self._pending += len(self._lines[-1])
+        self.sessions += 1
+        self.questions += len(questions)
+        if self._pending >= self.block_bytes:
+            self._write_block()
+
+    def _write_block(self):
+        if not self._lines:
+            return
+        if self._segment is None or self._segment.tell() >= self.segment_max_bytes:
+            self._close_segment()
+            self._open_segment()
+        raw = b"".join(self._lines)
+        block = _compress(self.codec, raw)
+        offset = self._segment.tell()
+        self._segment.write(block)
+        self._segment.flush()
+        os.fsync(self._segment.fileno())
+        self._index.write(json.dumps({
+            "offset": offset, "length": len(block), "sessions": self._sessions, "question_ids": self._question_ids,
+        }) + "\n")
+        self._index.flush()
+        os.fsync(self._index.fileno())
+        self.raw_bytes += len(raw)
+        self.compressed_bytes += len(block)
+        self._lines, self._sessions, self._question_ids, self._pending = [], [], [], 0
+
+    def flush(self):
+        """落盘当前未满的块（从数据库删除已归档的行之前调用）"""
+        self._write_block()
+
+    def _close_segment(self):
+        if self._segment is not None:
+            self._segment.close()
+            self._index.close()
+            self._segment = self._index = None
+
+    def close(self):
+        self.flush()
+        self._close_segment()
+
+
+class ArchiveReader:
+    """
+    按需读取已归档的会话
+    - 启动时加载各段的边车索引到内存：session_id -> 块，问题id（有序数组）-> 块；未归档的id在内存中即可判定，不读文件
+    - 每隔 reload_interval 秒检查索引文件是否增长（归档任务在其它进程中运行），只读取新增的行
+    - 最近读取的会话缓存 cache_size 个
+    """
+
+    def __init__(self, directory, reload_interval=10.0, cache_size=256):
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self.cache_size = cache_size
+        # 块：(段文件名, offset, length)
+        self._blocks = []
+        self._session_blocks = {}
+        self._question_ids = array("q")
+        self._question_blocks = array("q")
+        self._positions = {}
+        self._cache = OrderedDict()
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def _scan(self):
+        """读取各索引文件新增的行，返回新增的块数"""
+        try:
+            names = sorted(name for name in os.listdir(self.directory) if name.endswith(INDEX_EXTENSION))
+        except FileNotFoundError:
+            return 0
+        added = []
+        for name in names:
+            segment = name[:-len(INDEX_EXTENSION)]
+            segment_file = next(
+                (segment + extension for extension in EXTENSIONS.values()
+                 if os.path.exists(os.path.join(self.directory, segment + extension))),
+                None,
+            )
+            if segment_file is None:
+                continue
+            position = self._positions.get(name, 0)
+            with open(os.path.join(self.directory, name), "rb") as file:
+                file.seek(position)
+                for line in file:
+                    if not line.endswith(b"\n"):
+                        # 归档任务正在写入的行，下次再读
+                        break
+                    position += len(line)
+                    added.append((segment_file, json.loads(line)))
+            self._positions[name] = position
+
+        if added:
+            pairs = []
+            for segment_file, entry in added:
+                block = len(self._blocks)
+                self._blocks.append((segment_file, entry["offset"], entry["length"]))
+                for session_id in entry["sessions"]:
+                    self._session_blocks.setdefault(session_id, []).append(block)
+                    # 会话再次归档：只让该会话的缓存失效
+                    self._cache.pop(session_id, None)
+                pairs.extend((question_id, block) for question_id in entry["question_ids"])
+            pairs.sort()
+            self._merge_questions(pairs)
+        return len(added)
+
+    def _merge_questions(self, pairs):
+        """
+        将新增的有序 (问题id, 块) 按二分插入已有的有序数组，不重排已有部分
+        新块编号大于已有的块，同一问题id排在已有记录之后；新归档的问题id通常都更大，只需追加
+        """
+        if not pairs:
+            return
+        start = bisect.bisect_right(self._question_ids, pairs[0][0])
+        tail_ids = self._question_ids[start:]
+        tail_blocks = self._question_blocks[start:]
+        del self._question_ids[start:]
+        del self._question_blocks[start:]
+        previous = 0
+        for question_id, block in pairs:
+            index = bisect.bisect_right(tail_ids, question_id, previous)
+            self._question_ids.extend(tail_ids[previous:index])
+            self._question_blocks.extend(tail_blocks[previous:index])
+            self._question_ids.append(question_id)
+            self._question_blocks.append(block)
+            previous = index
+        self._question_ids.extend(tail_ids[previous:])
+        self._question_blocks.extend(tail_blocks[previous:])
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.reload_interval:
+            self._checked_at = now
+            self._scan()
+
+    def _read_block(self, block):
+        segment_file, offset, length = self._blocks[block]
+        with open(os.path.join(self.directory, segment_file), "rb") as file:
+            file.seek(offset)
+            data = file.read(length)
+        return _decompress(_codec_of(segment_file), data)
+
+    def _load_session(self, session_id, blocks):
+        """合并会话在各块中的记录（会话可能被多次归档），按问题id去重排序"""
+        questions = {}
+        prefix = _record_prefix(session_id).encode("utf-8")
+        for block in blocks:
+            for line in self._read_block(block).splitlines():
+                if line.startswith(prefix):
+                    for question in json.loads(line)["questions"]:
+                        questions[question["id"]] = question
+        return [questions[question_id] for question_id in sorted(questions)]
+
+    def session_questions(self, session_id):
+        """会话已归档的问题（按id升序），未归档时返回空列表"""
+        with self._lock:
+            self._maybe_reload()
+            questions = self._cache.get(session_id)
+            if questions is not None:
+                self._cache.move_to_end(session_id)
+                return questions
+            blocks = self._session_blocks.get(session_id)
+        if not blocks:
+            return []
+
+        questions = self._load_session(session_id, blocks)
+        with self._lock:
+            self._cache[session_id] = questions
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return questions
+
+    def has_session(self, session_id):
+        with self._lock:
+            self._maybe_reload()
+            return session_id in self._session_blocks
+
+    def get_question(self, question_id):
+        """已归档的问题 dict，未归档时返回 None"""
+        with self._lock:
+            self._maybe_reload()
+            index = bisect.bisect_left(self._question_ids, question_id)
+            if index == len(self._question_ids) or self._question_ids[index] != question_id:
+                return None
+            block = self._question_blocks[index]
+
+        for line in self._read_block(block).splitlines():
+            record = json.loads(line)
+            for question in record["questions"]:
+                if question["id"] == question_id:
+                    return dict(question, session_id=record["session_id"])
+        return None
+
+    def stats(self):
+        with self._lock:
+            self._maybe_reload()
+            return {
+                "segments": len({segment_file for segment_file, _, _ in self._blocks}),
+                "blocks": len(self._blocks),
+                "sessions": len(self._session_blocks),
+                "questions": len(self._question_ids),
+                "bytes": sum(length for _, _, length in self._blocks),
+            }
@@ -0,0 +1,154 @@
+# utils/conversation_cache.py
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+def question_text(user_input):
+    """问题文本（含 OCR 结果）"""
+    return f'{user_input.get("user_question") or ""} {user_input.get("ocr_msg") or ""}'.strip()
+
+
+class Turn:
+    """一轮对话的紧凑记录：问题与总结（总结未生成时暂存回答开头）"""
+    __slots__ = ("question_id", "question", "summary", "answer_head")
+
+    def __init__(self, question_id, question, summary=None, answer_head=""):
+        self.question_id = question_id
+        self.question = question
+        self.summary = summary
+        self.answer_head = answer_head
+
+    @property
+    def brief(self):
+        return self.summary or self.answer_head
+
+
+class Conversation:
+    __slots__ = ("api_session_id", "turns", "loaded_at", "accessed_at")
+
+    def __init__(self, api_session_id, turns, max_turns):
+        self.api_session_id = api_session_id
+        self.turns = deque(turns, maxlen=max_turns)
+        self.loaded_at = self.accessed_at = time.monotonic()
+
+
+class ConversationCache:
+    """
+    会话历史缓存（进程内 LRU）
+    - 首次访问时经 loader 从数据库加载最近 max_turns 轮，之后每轮回答写库后同步更新（write-through）
+    - 每轮只保存截断后的问题与总结，内存上界约为 max_sessions × max_turns × 2 × turn_max_chars
+    - 超过 ttl 的条目重新加载（多进程部署时同步其他进程写入的轮次）；空闲超过 idle_timeout 的会话被淘汰
+    """
+
+    def __init__(self, loader, summary_loader=None, max_sessions=10000, max_turns=5,
+                 turn_max_chars=300, ttl=300.0, idle_timeout=1800.0):
+        """
+        :param loader: loader(session_id, max_turns) -> (api_session_id, [(question_id, question, summary, answer_head)])
+        :param summary_loader: summary_loader([question_id]) -> {question_id: summary}，补全缓存后由 worker 生成的总结
+        """
+        self.loader = loader
+        self.summary_loader = summary_loader
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self.turn_max_chars = turn_max_chars
+        self.ttl = ttl
+        self.idle_timeout = idle_timeout
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def _clip(self, text):
+        text = (text or "").strip()
+        return text if len(text) <= self.turn_max_chars else text[:self.turn_max_chars] + "…"
+
+    def _turn(self, question_id, question, summary, answer_head):
+        return Turn(question_id, self._clip(question), self._clip(summary) or None, self._clip(answer_head))
+
+    def _evict_idle(self, now):
+        while self._sessions:
+            session_id, conversation = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and now - conversation.accessed_at < self.idle_timeout:
+                break
+            del self._sessions[session_id]
+            self.evictions += 1
+
+    def get(self, session_id):
+        """获取会话（未缓存或已过期时从数据库加载）"""
+        now = time.monotonic()
+        with self._lock:
+            conversation = self._sessions.get(session_id)
+            if conversation is not None and now - conversation.loaded_at < self.ttl:
+                conversation.accessed_at = now
+                self._sessions.move_to_end(session_id)
+                self.hits += 1
+                return conversation
+            self.misses += 1
+
+        # 数据库加载在锁外进行
+        api_session_id, rows = self.loader(session_id, self.max_turns)
+        conversation = Conversation(api_session_id, [self._turn(*row) for row in rows], self.max_turns)
+        with self._lock:
+            self._sessions[session_id] = conversation
+            self._sessions.move_to_end(session_id)
+            self._evict_idle(now)
+        return conversation
+
+    def api_session_id(self, session_id):
+        return self.get(session_id).api_session_id
+
+    def record_answer(self, session_id, question_id, question, answer, api_session_id=None):
+        """回答入库后同步更新缓存；会话未缓存时不加载，下次访问时从数据库读取"""
+        with self._lock:
+            conversation = self._sessions.get(session_id)
+            if conversation is None:
+                return
+            if api_session_id and not conversation.api_session_id:
+                conversation.api_session_id = api_session_id
+            # 同一问题重新生成时替换原记录
+            turns = [turn for turn in conversation.turns if turn.question_id != question_id]
+            turns.append(self._turn(question_id, question, None, answer))
+            turns.sort(key=lambda turn: turn.question_id)
+            conversation.turns = deque(turns, maxlen=self.max_turns)
+
+    def history(self, session_id, before_question_id=None):
+        """当前问题之前的历史轮次（按时间顺序），缺少总结的轮次按需补全"""
+        conversation = self.get(session_id)
+        with self._lock:
+            turns = [turn for turn in conversation.turns
+                     if before_question_id is None or turn.question_id < int(before_question_id)]
+        missing = [turn for turn in turns if turn.summary is None]
+        if missing and self.summary_loader is not None:
+            summaries = self.summary_loader([turn.question_id for turn in missing])
+            for turn in missing:
+                if summaries.get(turn.question_id):
+                    turn.summary = self._clip(summaries[turn.question_id])
+        return turns
+
+    def invalidate(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "turns": sum(len(conversation.turns) for conversation in self._sessions.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def build_history_prompt(turns, budget_tokens, estimate_tokens):
+    """由历史轮次构建本地多轮上下文：从最近一轮向前取，直到用完 token 预算"""
+    lines = []
+    remaining = budget_tokens
+    for turn in reversed(turns):
+        line = f"问：{turn.question}\n答（摘要）：{turn.brief}"
+        cost = estimate_tokens(line)
+        if cost > remaining:
+            break
+        lines.append(line)
+        remaining -= cost
+    return "\n\n".join(reversed(lines))
@@ -0,0 +1,46 @@
+# utils/dashscope_stream.py
+import json
+
+from utils.upstream import RETRYABLE_STATUS, RetryableStatusError, UpstreamStatusError
+
+DEFAULT_BASE_URL = "https://dashscope.aliyuncs.com/api/v1"
+
+
+async def stream_application(client, api_key, app_id, prompt, session_id=None, base_url=None):
+    """
+    异步调用智能体应用（SSE 增量输出）
+    :param client: httpx.AsyncClient
+    :param api_key: DashScope API Key
+    :param app_id: 智能体应用id
+    :param prompt: 用户输入
+    :param session_id: 多轮对话的 api_session_id
+    :param base_url: DashScope API 地址
+    :return: 异步生成器，逐段产出 (text, session_id)；上游返回非 200 时抛出 UpstreamStatusError（携带状态码）
+
+    生成器被关闭或任务被取消时，上游连接随 `async with` 一同关闭。
+    """
+    url = f"{(base_url or DEFAULT_BASE_URL).rstrip('/')}/apps/{app_id}/completion"
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+        "X-DashScope-SSE": "enable",
+    }
+    payload = {
+        "input": {"prompt": prompt},
+        "parameters": {"incremental_output": True},
+    }
+    if session_id:
+        payload["input"]["session_id"] = session_id
+
+    async with client.stream("POST", url, json=payload, headers=headers) as response:
+        if response.status_code in RETRYABLE_STATUS:
+            raise RetryableStatusError("dashscope", response.status_code)
+        if response.status_code != 200:
+            body = await response.aread()
+            raise UpstreamStatusError("dashscope", response.status_code, body[:200].decode("utf-8", "replace"))
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            event = json.loads(line[5:])
+            output = event.get("output") or {}
+            yield output.get("text") or "", output.get("session_id")
@@ -0,0 +1,61 @@
+# utils/db_profile.py
+from sqlalchemy import event
+
+PROFILE_SQLITE = "sqlite"
+PROFILE_POSTGRESQL = "postgresql"
+
+
+def detect_profile(uri):
+    """根据连接串推断数据库配置档"""
+    return PROFILE_POSTGRESQL if uri.startswith(("postgresql", "postgres")) else PROFILE_SQLITE
+
+
+def engine_options(config):
+    """
+    生成 SQLALCHEMY_ENGINE_OPTIONS
+    :param config: Flask app.config
+    :return: create_engine 参数
+    """
+    profile = config.get("DB_PROFILE") or detect_profile(config["SQLALCHEMY_DATABASE_URI"])
+    options = dict(config.get("SQLALCHEMY_ENGINE_OPTIONS") or {})
+
+    if profile == PROFILE_POSTGRESQL:
+        options.setdefault("pool_size", config["PG_POOL_SIZE"])
+        options.setdefault("max_overflow", config["PG_MAX_OVERFLOW"])
+        options.setdefault("pool_timeout", config["PG_POOL_TIMEOUT"])
+        options.setdefault("pool_recycle", config["PG_POOL_RECYCLE"])
+        options.setdefault("pool_pre_ping", config["PG_POOL_PRE_PING"])
+        return options
+
+    if ":memory:" in config["SQLALCHEMY_DATABASE_URI"]:
+        return options
+
+    # 连接在线程间复用，由连接池保证同一时刻只被一个线程使用
+    connect_args = options.setdefault("connect_args", {})
+    connect_args.setdefault("check_same_thread", False)
+    connect_args.setdefault("timeout", config["SQLITE_BUSY_TIMEOUT_MS"] / 1000)
+    options.setdefault("pool_size", config["SQLITE_POOL_SIZE"])
+    options.setdefault("max_overflow", config["SQLITE_MAX_OVERFLOW"])
+    return options
+
+
+def configure_engine(engine, config):
+    """SQLite 配置档：每个新连接设置 WAL 等 PRAGMA"""
+    if engine.dialect.name != "sqlite":
+        return
+
+    pragmas = (
+        ("journal_mode", "WAL"),
+        ("synchronous", config["SQLITE_SYNCHRONOUS"]),
+        ("busy_timeout", config["SQLITE_BUSY_TIMEOUT_MS"]),
+        ("cache_size", -config["SQLITE_CACHE_SIZE_KB"]),
+        ("mmap_size", config["SQLITE_MMAP_SIZE"]),
+        ("temp_store", "MEMORY"),
+    )
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
@@ -0,0 +1,160 @@
+# utils/export.py
+import csv
+import json
+import os
+from datetime import datetime
+
+FORMAT_AUTO = "auto"
+FORMAT_PARQUET = "parquet"
+FORMAT_ARROW = "arrow"
+FORMAT_CSV = "csv"
+FORMAT_JSONL = "jsonl"
+
+COLUMNAR_FORMATS = (FORMAT_PARQUET, FORMAT_ARROW)
+EXTENSIONS = {FORMAT_PARQUET: ".parquet", FORMAT_ARROW: ".arrow", FORMAT_CSV: ".csv", FORMAT_JSONL: ".jsonl"}
+
+# 列类型：int / str / time
+TYPE_INT = "int"
+TYPE_STR = "str"
+TYPE_TIME = "time"
+
+
+def pyarrow_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def resolve_format(requested):
+    """auto 优先 Parquet；未安装 pyarrow 时列式格式回退为 JSONL"""
+    if requested not in EXTENSIONS and requested != FORMAT_AUTO:
+        raise ValueError(f"unknown export format: {requested}")
+    if requested in (FORMAT_AUTO,) + COLUMNAR_FORMATS and not pyarrow_available():
+        return FORMAT_JSONL
+    return FORMAT_PARQUET if requested == FORMAT_AUTO else requested
+
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+class BatchWriter:
+    """
+    按批写入单个分片文件，内存占用只与单批行数有关
+    先写入 .tmp 文件，close 时原子重命名；abort 删除未完成的文件
+    """
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.columns = columns
+        self.rows = 0
+
+    def write(self, rows):
+        self._write(rows)
+        self.rows += len(rows)
+
+    def close(self):
+        self._close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        try:
+            self._close()
+        finally:
+            if os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+
+
+class ArrowBatchWriter(BatchWriter):
+    """Parquet（每批一个 row group）或 Arrow IPC 文件"""
+
+    def __init__(self, path, columns, fmt):
+        super().__init__(path, columns)
+        import pyarrow as pa
+
+        self._pa = pa
+        types = {TYPE_INT: pa.int64(), TYPE_STR: pa.string(), TYPE_TIME: pa.timestamp("us")}
+        self.schema = pa.schema([(name, types[kind]) for name, kind in columns])
+        if fmt == FORMAT_PARQUET:
+            import pyarrow.parquet as pq
+
+            self._writer = pq.ParquetWriter(self.tmp_path, self.schema, compression="zstd")
+        else:
+            self._writer = pa.ipc.new_file(self.tmp_path, self.schema)
+
+    def _write(self, rows):
+        arrays = [
+            self._pa.array([row[index] for row in rows], type=field.type)
+            for index, field in enumerate(self.schema)
+        ]
+        self._writer.write_batch(self._pa.record_batch(arrays, schema=self.schema))
+
+    def _close(self):
+        self._writer.close()
+
+
+class CsvBatchWriter(BatchWriter):
+    def __init__(self, path, columns):
+        super().__init__(path, columns)
+        self._file = open(self.tmp_path, "w", encoding="utf-8", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow([name for name, _ in columns])
+
+    def _write(self, rows):
+        self._writer.writerows([_plain(value) for value in row] for row in rows)
+
+    def _close(self):
+        self._file.close()
+
+
+class JsonlBatchWriter(BatchWriter):
+    def __init__(self, path, columns):
+        super().__init__(path, columns)
+        self._names = [name for name, _ in columns]
+        self._file = open(self.tmp_path, "w", encoding="utf-8")
+
+    def _write(self, rows):
+        self._file.writelines(
+            json.dumps(dict(zip(self._names, map(_plain, row))), ensure_ascii=False) + "\n" for row in rows
+        )
+
+    def _close(self):
+        self._file.close()
+
+
+def open_writer(path, columns, fmt):
+    """
+    :param path: 不含扩展名的分片路径
+    :param columns: [(列名, 列类型)]
+    """
+    path += EXTENSIONS[fmt]
+    if fmt in COLUMNAR_FORMATS:
+        return ArrowBatchWriter(path, columns, fmt)
+    if fmt == FORMAT_CSV:
+        return CsvBatchWriter(path, columns)
+    return JsonlBatchWriter(path, columns)
+
+
+class Watermarks:
+    """各表已导出的最大 id，保存为 JSON 文件（原子替换）"""
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                self.values = json.load(file)
+        except FileNotFoundError:
+            self.values = {}
+
+    def get(self, table):
+        return self.values.get(table, 0)
+
+    def set(self, table, last_id):
+        self.values[table] = last_id
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(self.values, file)
+        os.replace(tmp_path, self.path)
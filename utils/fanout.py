@@ -0,0 +1,39 @@
+# utils/fanout.py
+import contextvars
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+# 各数据源的执行状态
+STATUS_OK = "ok"
+STATUS_EMPTY = "empty"
+STATUS_TIMEOUT = "timeout"
+STATUS_ERROR = "error"
+
+
+def fan_out(executor, tasks):
+    """
+    并发执行多个检索任务，每个任务有独立的超时时间
+    :param executor: 线程池
+    :param tasks: {name: (func, args, timeout)}
+    :return: {name: (status, value)}，超时或出错的任务 value 为 None / 错误信息
+    """
+    start = time.monotonic()
+    # 复制调用方上下文（如当前追踪），检索线程中的埋点归属同一请求
+    futures = {
+        name: (executor.submit(contextvars.copy_context().run, func, *args), start + timeout)
+        for name, (func, args, timeout) in tasks.items()
+    }
+
+    results = {}
+    for name, (future, deadline) in futures.items():
+        try:
+            value = future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            # 已在运行的任务无法中断，结果直接丢弃
+            future.cancel()
+            results[name] = (STATUS_TIMEOUT, None)
+        except Exception as e:
+            results[name] = (STATUS_ERROR, str(e))
+        else:
+            results[name] = (STATUS_OK if value is not None else STATUS_EMPTY, value)
+    return results
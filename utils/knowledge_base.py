@@ -0,0 +1,131 @@
+# utils/knowledge_base.py
+import hashlib
+import json
+import os
+import threading
+import time
+
+from utils.knowledge_classifier import KnowledgeClassifier
+from utils.result import RawJson, dumps, envelope
+
+# 响应中返回的知识点字段
+RESPONSE_FIELDS = ("basic_concept", "basic_operation", "common_theorems", "example_problems", "solving_tips")
+
+
+class KnowledgeItem:
+    """归一化后的知识点记录"""
+    __slots__ = ("id", "title", "content", "items_json", "response_body", "etag")
+
+    def __init__(self, raw):
+        content = raw.get("content") or {}
+        if not isinstance(content, dict):
+            content = {}
+        self.id = str(raw["id"])
+        self.title = raw.get("title", "")
+        self.content = {field: content.get(field, "") for field in RESPONSE_FIELDS}
+        # 入库内容与接口响应均预先序列化（只序列化一次），ETag 为响应体的摘要
+        items = dumps([self.to_dict()])
+        self.items_json = items.decode("utf-8")
+        self.response_body = envelope({"type": "knowledge_search_result", "knowledge_items": RawJson(items)})
+        self.etag = hashlib.blake2b(self.response_body, digest_size=16).hexdigest()
+
+    def to_dict(self):
+        return {"title": self.title, "content": dict(self.content)}
+
+
+class _Snapshot:
+    """一次完整加载的只读索引，整体替换保证读者看到一致的数据"""
+    __slots__ = ("mtime", "items", "keywords", "keywords_prompt", "classifier")
+
+    def __init__(self, raw_items, mtime):
+        self.mtime = mtime
+        self.items = {}
+        for raw in raw_items:
+            item = KnowledgeItem(raw)
+            self.items.setdefault(item.id, item)
+        self.keywords = [{"id": raw["id"], "keyword": raw["title"]} for raw in raw_items]
+        self.keywords_prompt = str(self.keywords)
+        self.classifier = KnowledgeClassifier(raw_items)
+
+
+class KnowledgeBase:
+    """知识库：id 哈希索引 + 预序列化响应，首次访问时加载，文件修改后自动热加载"""
+
+    def __init__(self, path, reload_interval=2.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._reload_lock = threading.Lock()
+        self._last_check = time.monotonic()
+        self._snapshot = None
+
+    def _load(self):
+        mtime = os.stat(self.path).st_mtime
+        with open(self.path, "r", encoding="utf-8") as file:
+            raw_items = json.load(file)
+        return _Snapshot(raw_items, mtime)
+
+    def maybe_reload(self):
+        """
+        检查文件 mtime，变化时在后台线程构建新索引，完成后原子替换；返回是否启动了重载
+        重载锁非阻塞获取，只有一个线程构建，其余线程直接跳过；读取不加锁，构建期间继续使用旧快照
+        """
+        if self._snapshot is None:
+            return self._initial_load()
+        now = time.monotonic()
+        if now - self._last_check < self.reload_interval:
+            return False
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        started = False
+        try:
+            self._last_check = now
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError:
+                return False
+            if mtime == self._snapshot.mtime:
+                return False
+            # 构建（含 TF-IDF 索引）耗时数百毫秒，不占用请求线程；锁由后台线程释放
+            threading.Thread(target=self._reload, name="knowledge-reload", daemon=True).start()
+            started = True
+            return True
+        finally:
+            if not started:
+                self._reload_lock.release()
+
+    def _reload(self):
+        try:
+            self._snapshot = self._load()
+        except (OSError, ValueError, KeyError):
+            # 文件写入未完成或格式错误时保留旧索引
+            pass
+        finally:
+            self._reload_lock.release()
+
+    def _initial_load(self):
+        with self._reload_lock:
+            if self._snapshot is None:
+                self._snapshot = self._load()
+                self._last_check = time.monotonic()
+                return True
+        return False
+
+    @property
+    def snapshot(self):
+        self.maybe_reload()
+        return self._snapshot
+
+    def get(self, category_id):
+        """根据类别id获取知识点，不存在时返回 None"""
+        return self.snapshot.items.get(str(category_id).strip())
+
+    @property
+    def classifier(self):
+        return self.snapshot.classifier
+
+    @property
+    def keywords_prompt(self):
+        return self.snapshot.keywords_prompt
+
+    def __len__(self):
+        return len(self.snapshot.items)
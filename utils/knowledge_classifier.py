@@ -0,0 +1,102 @@
+# utils/knowledge_classifier.py
+import math
+import re
+from collections import defaultdict
+
+# 标题在文档向量中的权重倍数
+TITLE_WEIGHT = 3
+# 参与索引的知识点字段
+CONTENT_FIELDS = ("basic_concept", "basic_operation", "common_theorems", "example_problems", "solving_tips")
+
+_NOISE_RE = re.compile(r"[\s\*\$\\#>`_​]+")
+
+
+def normalize_text(text):
+    """去除 markdown / LaTeX 符号与空白，统一小写"""
+    return _NOISE_RE.sub(" ", str(text or "")).strip().lower()
+
+
+def char_ngrams(text, ngram_range=(1, 3)):
+    """字符 n-gram 切分（跳过含空格的片段）"""
+    grams = []
+    for chunk in normalize_text(text).split(" "):
+        for n in range(ngram_range[0], ngram_range[1] + 1):
+            for i in range(len(chunk) - n + 1):
+                grams.append(chunk[i:i + n])
+    return grams
+
+
+class KnowledgeClassifier:
+    """基于字符 n-gram TF-IDF 的知识点分类器，启动时由 knowledge.json 构建"""
+
+    def __init__(self, knowledge_items, ngram_range=(1, 3)):
+        self.ngram_range = ngram_range
+        self.category_ids = []
+        self.titles = {}
+        self.idf = {}
+        # 倒排索引：gram -> [(文档下标, 归一化权重)]
+        self.postings = defaultdict(list)
+        self._build(knowledge_items)
+
+    def _document_terms(self, item):
+        content = item.get("content") or {}
+        if not isinstance(content, dict):
+            content = {}
+        counts = defaultdict(float)
+        for gram in char_ngrams(item.get("title", ""), self.ngram_range):
+            counts[gram] += TITLE_WEIGHT
+        for field in CONTENT_FIELDS:
+            for gram in char_ngrams(content.get(field, ""), self.ngram_range):
+                counts[gram] += 1
+        return counts
+
+    def _build(self, knowledge_items):
+        doc_terms = []
+        doc_freq = defaultdict(int)
+        for item in knowledge_items:
+            self.category_ids.append(str(item["id"]))
+            self.titles[str(item["id"])] = item.get("title", "")
+            counts = self._document_terms(item)
+            doc_terms.append(counts)
+            for gram in counts:
+                doc_freq[gram] += 1
+
+        total = len(doc_terms)
+        self.idf = {gram: math.log((1 + total) / (1 + df)) + 1 for gram, df in doc_freq.items()}
+
+        for index, counts in enumerate(doc_terms):
+            weights = {gram: (1 + math.log(tf)) * self.idf[gram] for gram, tf in counts.items()}
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            for gram, weight in weights.items():
+                self.postings[gram].append((index, weight / norm))
+
+    def _query_vector(self, text):
+        counts = defaultdict(int)
+        for gram in char_ngrams(text, self.ngram_range):
+            if gram in self.idf:
+                counts[gram] += 1
+        weights = {gram: (1 + math.log(tf)) * self.idf[gram] for gram, tf in counts.items()}
+        norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+        return {gram: weight / norm for gram, weight in weights.items()}
+
+    def classify(self, text, top_k=3):
+        """
+        对用户问题进行知识点分类
+        :param text: 用户问题
+        :param top_k: 返回的候选数量
+        :return: [(category_id, score)]，按余弦相似度降序
+        """
+        scores = defaultdict(float)
+        for gram, q_weight in self._query_vector(text).items():
+            for index, d_weight in self.postings[gram]:
+                scores[index] += q_weight * d_weight
+
+        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
+        return [(self.category_ids[index], round(score, 4)) for index, score in ranked]
+
+    def best_match(self, text, threshold):
+        """返回得分不低于阈值的最佳类别id，否则返回 None"""
+        ranked = self.classify(text, top_k=1)
+        if ranked and ranked[0][1] >= threshold:
+            return ranked[0]
+        return None
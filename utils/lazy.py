@@ -0,0 +1,53 @@
+# utils/lazy.py
+import os
+import threading
+
+
+class Lazy:
+    """
+    首次 get() 时才创建的对象（线程安全）
+    reset_after_fork=True 时 fork 出的子进程丢弃已创建的对象（如连接池），在子进程内重新创建
+    """
+
+    def __init__(self, factory, reset_after_fork=False):
+        self.factory = factory
+        self._value = None
+        self._created = False
+        self._lock = threading.Lock()
+        if reset_after_fork and hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset_in_child)
+
+    def get(self):
+        if not self._created:
+            with self._lock:
+                if not self._created:
+                    self._value = self.factory()
+                    self._created = True
+        return self._value
+
+    @property
+    def created(self):
+        return self._created
+
+    def _reset_in_child(self):
+        self._lock = threading.Lock()
+        self._value = None
+        self._created = False
+
+
+class LazyConsole:
+    """rich Console 代理：关闭控制台日志时不导入 rich，开启时首次输出才创建"""
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self._console = Lazy(self._create)
+
+    @staticmethod
+    def _create():
+        from rich.console import Console
+
+        return Console()
+
+    def print(self, *args, **kwargs):
+        if self.enabled:
+            self._console.get().print(*args, **kwargs)
@@ -0,0 +1,184 @@
+# utils/model_router.py
+import threading
+import time
+
+# LLM 任务类型
+TASK_INTENT = "intent"
+TASK_CATEGORY = "category"
+TASK_KEYWORDS = "keywords"
+TASK_SUMMARY = "summary"
+TASK_RECOMMEND = "recommend"
+
+# 后台任务按任务队列积压判断负载，其余按上游并发占用率
+BACKGROUND_TASKS = frozenset((TASK_SUMMARY, TASK_RECOMMEND))
+
+
+def parse_policy(value):
+    """解析 "intent=qwen-plus,qwen-turbo;summary=qwen-plus" 形式的策略：任务 -> 候选模型（按优先顺序）"""
+    policy = {}
+    for item in (value or "").split(";"):
+        if "=" in item:
+            task, models = item.split("=", 1)
+            models = [model.strip() for model in models.split(",") if model.strip()]
+            if models:
+                policy[task.strip()] = models
+    return policy
+
+
+def parse_numbers(value):
+    """解析 "intent=2,summary=20" 形式的配置"""
+    numbers = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            key, number = item.split("=", 1)
+            numbers[key.strip()] = float(number)
+    return numbers
+
+
+class ModelStats:
+    """单个模型（或模型 + 任务）的调用统计：延迟与错误率 EWMA、token 用量"""
+    __slots__ = ("calls", "errors", "latency", "error_rate", "prompt_tokens", "completion_tokens", "updated_at")
+
+    def __init__(self):
+        self.calls = self.errors = 0
+        self.latency = None
+        self.error_rate = 0.0
+        self.prompt_tokens = self.completion_tokens = 0
+        self.updated_at = 0.0
+
+    def record(self, seconds, ok, prompt_tokens, completion_tokens, alpha):
+        self.calls += 1
+        self.updated_at = time.monotonic()
+        self.error_rate += alpha * ((0.0 if ok else 1.0) - self.error_rate)
+        if ok:
+            self.latency = seconds if self.latency is None else self.latency + alpha * (seconds - self.latency)
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+        else:
+            self.errors += 1
+
+    def as_dict(self):
+        succeeded = self.calls - self.errors
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "recent_error_rate": round(self.error_rate, 3),
+            "latency_ewma_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "avg_prompt_tokens": round(self.prompt_tokens / succeeded, 1) if succeeded else None,
+            "avg_completion_tokens": round(self.completion_tokens / succeeded, 1) if succeeded else None,
+        }
+
+
+class ModelRouter:
+    """
+    按任务选择模型，返回按优先顺序排列的候选模型（首个失败时依次回退）
+    - 策略中每个任务的候选模型按质量从高到低排列，降级即改用最后一个（最快 / 最便宜）
+    - 降级条件：分类类任务输入较短；上游并发占用率过高（请求内任务）或任务队列积压过深（后台任务）
+    - 近期延迟超过任务预算或错误率过高的模型排到最后；统计超过 recovery_time 未更新时重新参与选择
+    """
+
+    def __init__(self, policy, short_input_chars=200, short_input_tasks=(), latency_budgets=None,
+                 degrade_load=0.75, degrade_backlog=100, max_error_rate=0.3, min_calls=5,
+                 recovery_time=60.0, alpha=0.2, load=None, enabled=True):
+        """
+        :param load: load() -> 上游并发占用率（0~1）
+        """
+        self.policy = policy
+        self.short_input_chars = short_input_chars
+        self.short_input_tasks = frozenset(short_input_tasks)
+        self.latency_budgets = latency_budgets or {}
+        self.degrade_load = degrade_load
+        self.degrade_backlog = degrade_backlog
+        self.max_error_rate = max_error_rate
+        self.min_calls = min_calls
+        self.recovery_time = recovery_time
+        self.alpha = alpha
+        self.load = load
+        self.enabled = enabled
+        # 后台任务队列积压（由 worker 定期更新）
+        self.backlog = 0
+        self._models = {}
+        self._tasks = {}
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def _degrade_reason(self, task, input_chars):
+        if task in self.short_input_tasks and input_chars <= self.short_input_chars:
+            return "short_input"
+        if task in BACKGROUND_TASKS:
+            return "backlog" if self.backlog >= self.degrade_backlog else None
+        if self.load is not None and self.load() >= self.degrade_load:
+            return "load"
+        return None
+
+    def _unhealthy(self, task, model, now):
+        stats = self._tasks.get((model, task))
+        if stats is None or stats.calls < self.min_calls or now - stats.updated_at > self.recovery_time:
+            return False
+        budget = self.latency_budgets.get(task)
+        slow = budget is not None and stats.latency is not None and stats.latency > budget
+        return slow or stats.error_rate > self.max_error_rate
+
+    def route(self, task, input_chars=0):
+        """返回候选模型列表，首个为本次选择的模型"""
+        candidates = list(self.policy[task])
+        reason = None
+        if self.enabled and len(candidates) > 1:
+            reason = self._degrade_reason(task, input_chars)
+            if reason is not None:
+                candidates.insert(0, candidates.pop())
+            now = time.monotonic()
+            with self._lock:
+                healthy = [model for model in candidates if not self._unhealthy(task, model, now)]
+            if healthy and len(healthy) < len(candidates):
+                reason = reason or "unhealthy"
+                candidates = healthy + [model for model in candidates if model not in healthy]
+        with self._lock:
+            key = (task, candidates[0], reason or "policy")
+            self._routes[key] = self._routes.get(key, 0) + 1
+        return candidates
+
+    def record(self, task, model, seconds, ok, usage=None):
+        """记录一次调用；usage 为 OpenAI 兼容响应的 usage"""
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        with self._lock:
+            for key, table in ((model, self._models), ((model, task), self._tasks)):
+                stats = table.get(key)
+                if stats is None:
+                    stats = table[key] = ModelStats()
+                stats.record(seconds, ok, prompt_tokens, completion_tokens, self.alpha)
+
+    def stats(self):
+        with self._lock:
+            tasks = {}
+            for (model, task), stats in self._tasks.items():
+                tasks.setdefault(task, {})[model] = stats.as_dict()
+            routes = {}
+            for (task, model, reason), count in self._routes.items():
+                routes.setdefault(task, {}).setdefault(model, {})[reason] = count
+            return {
+                "models": {model: stats.as_dict() for model, stats in self._models.items()},
+                "tasks": tasks,
+                "routes": routes,
+                "backlog": self.backlog,
+                "load": round(self.load(), 3) if self.load is not None else None,
+            }
+
+
+def create_model_router(config, load=None):
+    """根据 ModelRouterConfig 创建模型路由"""
+    return ModelRouter(
+        parse_policy(config.POLICY),
+        short_input_chars=config.SHORT_INPUT_CHARS,
+        short_input_tasks=[task.strip() for task in config.SHORT_INPUT_TASKS.split(",") if task.strip()],
+        latency_budgets=parse_numbers(config.LATENCY_BUDGETS),
+        degrade_load=config.DEGRADE_LOAD,
+        degrade_backlog=config.DEGRADE_BACKLOG,
+        max_error_rate=config.MAX_ERROR_RATE,
+        recovery_time=config.RECOVERY_TIME,
+        load=load,
+        enabled=config.ENABLED,
+    )
@@ -0,0 +1,99 @@
+# utils/prefetch.py
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from utils.fanout import STATUS_OK, STATUS_EMPTY, STATUS_TIMEOUT, STATUS_ERROR
+
+
+class _Entry:
+    __slots__ = ("futures", "created_at")
+
+    def __init__(self, futures):
+        self.futures = futures
+        self.created_at = time.monotonic()
+
+
+class PrefetchRegistry:
+    """
+    预取登记表：创建问题时即在后台启动检索，按 question_id 登记各数据源的 Future
+    - 同时在途的预取任务数不超过 max_inflight，超出时不预取（由接口按原流程检索）
+    - 条目超过 ttl 或总数超过 max_entries 时淘汰
+    """
+
+    def __init__(self, max_workers, max_inflight, ttl=300.0, max_entries=10000):
+        self.max_inflight = max_inflight
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._entries = OrderedDict()
+        self._inflight = 0
+        self._lock = threading.Lock()
+        self.started = self.skipped = self.hits = self.timeouts = 0
+
+    def _evict(self, now):
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if len(self._entries) <= self.max_entries and now - entry.created_at < self.ttl:
+                break
+            del self._entries[key]
+
+    def _done(self, future):
+        with self._lock:
+            self._inflight -= 1
+
+    def submit(self, key, tasks):
+        """
+        启动预取
+        :param tasks: {name: (func, args)}
+        :return: 是否已启动（在途预取已满时返回 False）
+        """
+        with self._lock:
+            self._evict(time.monotonic())
+            if key in self._entries:
+                return True
+            if self._inflight + len(tasks) > self.max_inflight:
+                self.skipped += 1
+                return False
+            self._inflight += len(tasks)
+            self.started += 1
+            futures = {name: self._executor.submit(func, *args) for name, (func, args) in tasks.items()}
+            self._entries[key] = _Entry(futures)
+        for future in futures.values():
+            future.add_done_callback(self._done)
+        return True
+
+    def result(self, key, name, timeout=None):
+        """
+        等待预取结果（最多 timeout 秒，为 None 时等待至完成）
+        :return: 未预取时返回 None，否则 (status, value)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            future = entry.futures.get(name) if entry is not None else None
+        if future is None:
+            return None
+        try:
+            value = future.result(timeout=None if timeout is None else max(0.0, timeout))
+        except FutureTimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            return STATUS_TIMEOUT, None
+        except Exception as e:
+            return STATUS_ERROR, str(e)
+        with self._lock:
+            self.hits += 1
+        return (STATUS_OK if value is not None else STATUS_EMPTY), value
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "inflight": self._inflight,
+                "max_inflight": self.max_inflight,
+                "started": self.started,
+                "skipped": self.skipped,
+                "hits": self.hits,
+                "timeouts": self.timeouts,
+            }
@@ -0,0 +1,141 @@
+# utils/prompt_builder.py
+import json
+import re
+
+# 各来源的排序权重：知识库 > RAG > 联网搜索
+SOURCE_WEIGHTS = {"knowledge": 1.2, "rag": 1.1, "web": 1.0}
+SOURCE_LABELS = {"knowledge": "知识库", "rag": "RAG", "web": "联网搜索"}
+KNOWLEDGE_FIELDS = ("basic_concept", "common_theorems", "solving_tips", "basic_operation", "example_problems")
+
+_CJK_RE = re.compile(r"[　-〿一-鿿＀-￯]")
+_SPACE_RE = re.compile(r"\s+")
+_NORMALIZE_RE = re.compile(r"[\W_]+")
+
+
+def estimate_tokens(text):
+    """粗略估算 token 数：中日韩字符约 1 token/字，其余约 4 字符/token"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncate_to_tokens(text, max_tokens):
+    """按 token 预算截断文本"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens - 1:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low] + "…"
+
+
+def _bigrams(text):
+    text = _NORMALIZE_RE.sub("", text.lower())
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class Snippet:
+    __slots__ = ("source", "title", "text", "score")
+
+    def __init__(self, source, title, text):
+        self.source = source
+        self.title = title
+        self.text = _SPACE_RE.sub(" ", text).strip()
+        self.score = 0.0
+
+
+def _load(raw):
+    if not raw:
+        return []
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except ValueError:
+            return [raw]
+    return raw if isinstance(raw, list) else [raw]
+
+
+def extract_snippets(retrieve_data):
+    """将三类检索结果展开为片段"""
+    snippets = []
+    for item in _load(retrieve_data.get("knowledge_search_result")):
+        if not isinstance(item, dict):
+            continue
+        content = item.get("content") or {}
+        for field in KNOWLEDGE_FIELDS:
+            if content.get(field):
+                snippets.append(Snippet("knowledge", item.get("title", ""), content[field]))
+    for item in _load(retrieve_data.get("rag_result")):
+        if isinstance(item, dict):
+            snippets.append(Snippet("rag", item.get("title", ""), item.get("content") or item.get("text") or ""))
+        elif item:
+            snippets.append(Snippet("rag", "", str(item)))
+    for item in _load(retrieve_data.get("web_search_result")):
+        if isinstance(item, dict):
+            snippets.append(Snippet("web", item.get("title", ""), item.get("content") or ""))
+    return [snippet for snippet in snippets if snippet.text]
+
+
+def rank_snippets(snippets, question):
+    """去重后按与问题的字符 bigram 重合度 × 来源权重排序"""
+    question_grams = _bigrams(question or "")
+    seen = set()
+    unique = []
+    for snippet in snippets:
+        key = _NORMALIZE_RE.sub("", snippet.text.lower())[:200]
+        if key in seen:
+            continue
+        seen.add(key)
+        grams = _bigrams(snippet.title + snippet.text)
+        overlap = len(question_grams & grams) / (len(question_grams) or 1)
+        snippet.score = (overlap + 0.01) * SOURCE_WEIGHTS.get(snippet.source, 1.0)
+        unique.append(snippet)
+    unique.sort(key=lambda snippet: snippet.score, reverse=True)
+    return unique
+
+
+class PromptStats:
+    __slots__ = ("tokens", "chars", "snippets_total", "snippets_used", "raw_chars")
+
+    def __init__(self):
+        self.tokens = self.chars = self.snippets_total = self.snippets_used = self.raw_chars = 0
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def build_references(retrieve_data, question, budget_tokens, snippet_max_tokens):
+    """
+    在 token 预算内构建引用内容
+    :param retrieve_data: get_retrieve_data 返回的三类检索结果
+    :param question: 用户问题，用于排序
+    :param budget_tokens: 引用内容的总 token 预算
+    :param snippet_max_tokens: 单个片段的 token 上限
+    :return: (引用文本, PromptStats)
+    """
+    stats = PromptStats()
+    stats.raw_chars = sum(len(value or "") for value in retrieve_data.values())
+    snippets = rank_snippets(extract_snippets(retrieve_data), question)
+    stats.snippets_total = len(snippets)
+
+    lines = []
+    remaining = budget_tokens
+    for snippet in snippets:
+        header = f"[{len(lines) + 1}]（{SOURCE_LABELS[snippet.source]}）{snippet.title}".rstrip()
+        header_tokens = estimate_tokens(header) + 1
+        if remaining - header_tokens < 20:
+            break
+        body = truncate_to_tokens(snippet.text, min(snippet_max_tokens, remaining - header_tokens))
+        lines.append(f"{header}\n{body}")
+        remaining -= header_tokens + estimate_tokens(body)
+
+    references = "\n\n".join(lines)
+    stats.snippets_used = len(lines)
+    stats.chars = len(references)
+    stats.tokens = estimate_tokens(references)
+    return references, stats
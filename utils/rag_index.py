@@ -0,0 +1,402 @@
+# utils/rag_index.py
+import json
+import math
+import os
+import threading
+import time
+import zlib
+
+from utils.knowledge_classifier import char_ngrams
+
+try:
+    import fcntl
+except ImportError:  # Windows：仅支持单进程写入
+    fcntl = None
+
+VECTORS_FILE = "vectors.f32"
+OFFSETS_FILE = "offsets.i64"
+CHUNKS_FILE = "chunks.jsonl"
+META_FILE = "meta.json"
+LOCK_FILE = ".lock"
+IVF_CENTROIDS_FILE = "ivf_centroids.npy"
+IVF_ORDER_FILE = "ivf_order.npy"
+IVF_OFFSETS_FILE = "ivf_offsets.npy"
+
+# 暴力检索的分块行数，控制单次矩阵乘法的内存占用
+SEARCH_BLOCK_ROWS = 65536
+
+
+def numpy_available():
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class HashingEmbedder:
+    """字符 n-gram 哈希向量化：无需训练与模型文件，同一文本在任意进程中得到相同向量"""
+
+    def __init__(self, dim=512, ngram_range=(1, 3)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    def embed(self, text):
+        import numpy as np
+
+        counts = {}
+        for gram in char_ngrams(text, self.ngram_range):
+            counts[gram] = counts.get(gram, 0) + 1
+
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for gram, count in counts.items():
+            h = zlib.crc32(gram.encode("utf-8"))
+            # 最高位决定符号，抵消哈希冲突带来的偏差
+            sign = -1.0 if h & 0x80000000 else 1.0
+            vector[h % self.dim] += sign * (1.0 + math.log(count))
+
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+    def embed_many(self, texts):
+        import numpy as np
+
+        matrix = np.empty((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            matrix[row] = self.embed(text)
+        return matrix
+
+
+def chunk_text(text, max_chars=300, overlap=50):
+    """按段落合并切分文本，超长段落按固定窗口切分（相邻窗口重叠 overlap 个字符）"""
+    chunks = []
+    current = ""
+    for paragraph in str(text or "").split("\n"):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) + 1 > max_chars:
+            chunks.append(current)
+            current = ""
+        if len(paragraph) > max_chars:
+            step = max(1, max_chars - overlap)
+            for start in range(0, len(paragraph) - overlap, step):
+                chunks.append(paragraph[start:start + max_chars])
+            continue
+        current = f"{current}\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def top_k_rows(scores, rows, k):
+    """从候选分数中取前 k 个，返回按分数降序的 (行号, 分数)"""
+    import numpy as np
+
+    if len(scores) > k:
+        part = np.argpartition(-scores, k - 1)[:k]
+        scores, rows = scores[part], rows[part]
+    order = np.argsort(-scores, kind="stable")
+    return rows[order], scores[order]
+
+
+def _append_array(path, array, committed_bytes):
+    """截断未提交的尾部后追加写入"""
+    import numpy as np
+
+    with open(path, "r+b" if os.path.exists(path) else "wb") as file:
+        file.truncate(committed_bytes)
+        file.seek(committed_bytes)
+        file.write(np.ascontiguousarray(array).tobytes())
+
+
+def _save_npy(path, array):
+    import numpy as np
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        np.save(file, array)
+    os.replace(tmp_path, path)
+
+
+class _FileLock:
+    """跨进程写锁（flock），同一进程内由线程锁串行化"""
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._file = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if fcntl is not None:
+            self._file = open(self.path, "a")
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+
+class _View:
+    """某一时刻索引的只读视图，meta.json 变化时整体替换"""
+    __slots__ = ("count", "vectors", "offsets", "ivf_count", "centroids", "ivf_order", "ivf_offsets")
+
+    def __init__(self, directory, meta, dim):
+        self.count = meta.get("count", 0)
+        self.ivf_count = meta.get("ivf_count", 0)
+        self.vectors = self.offsets = None
+        self.centroids = self.ivf_order = self.ivf_offsets = None
+        if not self.count:
+            return
+        import numpy as np
+
+        # 只映射已提交的前 count 行，写入中的尾部数据不可见
+        self.vectors = np.memmap(os.path.join(directory, VECTORS_FILE), dtype=np.float32, mode="r", shape=(self.count, dim))
+        self.offsets = np.memmap(os.path.join(directory, OFFSETS_FILE), dtype=np.int64, mode="r", shape=(self.count,))
+        if self.ivf_count:
+            self.centroids = np.load(os.path.join(directory, IVF_CENTROIDS_FILE))
+            self.ivf_order = np.load(os.path.join(directory, IVF_ORDER_FILE), mmap_mode="r")
+            self.ivf_offsets = np.load(os.path.join(directory, IVF_OFFSETS_FILE))
+
+
+class RagIndex:
+    """
+    本地向量索引
+    - 向量按行追加写入 float32 矩阵文件，读取时 memmap 只读映射，多进程共享页缓存
+    - 片段原文追加写入 chunks.jsonl，按偏移量读取；meta.json 原子替换作为提交点
+    - 默认暴力检索；构建 IVF 后按聚类中心探查，构建之后新增的行仍暴力检索，无需全量重建
+    - numpy 按需导入：未安装时索引不可用，检索返回空结果，添加文档与构建 IVF 被跳过
+    """
+
+    def __init__(self, directory, embedder=None, nprobe=8, reload_interval=1.0):
+        self.directory = directory
+        self.embedder = embedder or HashingEmbedder()
+        self.nprobe = nprobe
+        self.reload_interval = reload_interval
+        self.available = numpy_available()
+        os.makedirs(directory, exist_ok=True)
+        self._lock = _FileLock(os.path.join(directory, LOCK_FILE))
+        self._keys = None
+        self._keys_count = 0
+        self._meta_mtime = None
+        self._last_check = 0.0
+        self._view = None
+        self._refresh(force=True)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _read_meta(self):
+        try:
+            with open(self._path(META_FILE), "r", encoding="utf-8") as file:
+                meta = json.load(file)
+        except (OSError, ValueError):
+            return {"dim": self.embedder.dim, "count": 0, "chunks_bytes": 0, "ivf_count": 0}
+        if meta.get("dim") != self.embedder.dim:
+            raise ValueError(f"RAG index dim {meta.get('dim')} != embedder dim {self.embedder.dim}, rebuild the index")
+        return meta
+
+    def _write_meta(self, meta):
+        tmp_path = self._path(META_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(meta, file)
+        os.replace(tmp_path, self._path(META_FILE))
+
+    def _refresh(self, force=False):
+        """meta.json 变化时重新映射，其他进程追加的数据随之可见"""
+        now = time.monotonic()
+        if not force and now - self._last_check < self.reload_interval:
+            return
+        self._last_check = now
+        try:
+            mtime = os.stat(self._path(META_FILE)).st_mtime_ns
+        except OSError:
+            mtime = None
+        if not force and mtime == self._meta_mtime:
+            return
+        self._meta_mtime = mtime
+        self._view = _View(self.directory, self._read_meta() if self.available else {}, self.embedder.dim)
+
+    def __len__(self):
+        self._refresh()
+        return self._view.count
+
+    def stats(self):
+        view = self._view
+        return {"available": self.available, "chunks": view.count, "dim": self.embedder.dim, "ivf_rows": view.ivf_count,
+                "ivf_lists": 0 if view.centroids is None else len(view.centroids)}
+
+    def _load_keys(self, meta):
+        keys = set()
+        if meta["count"]:
+            with open(self._path(CHUNKS_FILE), "rb") as file:
+                for line in file.read(meta["chunks_bytes"]).splitlines():
+                    keys.add(json.loads(line)["key"])
+        return keys
+
+    def contains(self, key):
+        with self._lock:
+            meta = self._read_meta()
+            if self._keys is None or self._keys_count != meta["count"]:
+                self._keys = self._load_keys(meta)
+                self._keys_count = meta["count"]
+            return key in self._keys
+
+    def add(self, documents, max_chars=300, overlap=50):
+        """
+        增量添加文档，key 已存在的文档跳过
+        :param documents: [{"key", "title", "text", "source"}]
+        :return: 新增的片段数
+        """
+        if not self.available:
+            return 0
+        import numpy as np
+
+        with self._lock:
+            meta = self._read_meta()
+            # 其他进程可能已写入，持锁后按需重新加载 key 集合
+            if self._keys is None or self._keys_count != meta["count"]:
+                self._keys = self._load_keys(meta)
+            rows = []
+            for document in documents:
+                if document["key"] in self._keys:
+                    continue
+                self._keys.add(document["key"])
+                for text in chunk_text(document["text"], max_chars, overlap):
+                    rows.append({
+                        "key": document["key"],
+                        "title": document.get("title", ""),
+                        "content": text,
+                        "source": document.get("source", ""),
+                    })
+            self._keys_count = meta["count"] + len(rows)
+            if not rows:
+                return 0
+
+            count = meta["count"]
+            lines = [json.dumps(row, ensure_ascii=False).encode("utf-8") + b"\n" for row in rows]
+            offsets = meta["chunks_bytes"] + np.cumsum([0] + [len(line) for line in lines[:-1]], dtype=np.int64)
+            vectors = self.embedder.embed_many([f"{row['title']} {row['content']}" for row in rows])
+
+            # 先写数据文件（截断上次中断残留的尾部），最后替换 meta.json 提交
+            with open(self._path(CHUNKS_FILE), "r+b" if count else "wb") as file:
+                file.truncate(meta["chunks_bytes"])
+                file.seek(meta["chunks_bytes"])
+                file.write(b"".join(lines))
+            _append_array(self._path(VECTORS_FILE), vectors, count * self.embedder.dim * 4)
+            _append_array(self._path(OFFSETS_FILE), offsets, count * 8)
+
+            meta["count"] = count + len(rows)
+            meta["chunks_bytes"] = int(offsets[-1]) + len(lines[-1])
+            self._write_meta(meta)
+        self._refresh(force=True)
+        return len(rows)
+
+    def needs_ivf(self, threshold, tail_ratio=0.2):
+        """语料超过阈值且未建 IVF，或 IVF 之后新增的行超过比例时需要（重新）构建"""
+        self._refresh(force=True)
+        view = self._view
+        if view.count < threshold:
+            return False
+        return not view.ivf_count or view.count - view.ivf_count > view.ivf_count * tail_ratio
+
+    def build_ivf(self, nlist=None, iterations=10, sample_size=50000, seed=0):
+        """球面 k-means 构建倒排聚类（IVF），返回聚类数"""
+        if not self.available:
+            return 0
+        import numpy as np
+
+        with self._lock:
+            meta = self._read_meta()
+            count = meta["count"]
+            if not count:
+                return 0
+            vectors = np.memmap(self._path(VECTORS_FILE), dtype=np.float32, mode="r", shape=(count, self.embedder.dim))
+            nlist = min(count, nlist or max(1, int(math.sqrt(count))))
+
+            rng = np.random.default_rng(seed)
+            sample = np.asarray(vectors[np.sort(rng.choice(count, min(count, sample_size), replace=False))])
+            centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+            for _ in range(iterations):
+                assign = np.argmax(sample @ centroids.T, axis=1)
+                for cluster in range(nlist):
+                    members = sample[assign == cluster]
+                    if len(members):
+                        center = members.sum(axis=0)
+                        norm = np.linalg.norm(center)
+                        if norm > 0:
+                            centroids[cluster] = center / norm
+
+            assign = np.empty(count, dtype=np.int32)
+            for start in range(0, count, SEARCH_BLOCK_ROWS):
+                assign[start:start + SEARCH_BLOCK_ROWS] = np.argmax(vectors[start:start + SEARCH_BLOCK_ROWS] @ centroids.T, axis=1)
+            order = np.argsort(assign, kind="stable").astype(np.int64)
+            list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))]).astype(np.int64)
+
+            _save_npy(self._path(IVF_CENTROIDS_FILE), centroids)
+            _save_npy(self._path(IVF_ORDER_FILE), order)
+            _save_npy(self._path(IVF_OFFSETS_FILE), list_offsets)
+            meta["ivf_count"] = count
+            self._write_meta(meta)
+        self._refresh(force=True)
+        return nlist
+
+    def _brute_force(self, view, query, top_k):
+        import numpy as np
+
+        best_rows, best_scores = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        for start in range(0, view.count, SEARCH_BLOCK_ROWS):
+            scores = view.vectors[start:start + SEARCH_BLOCK_ROWS] @ query
+            rows, scores = top_k_rows(scores, np.arange(start, start + len(scores)), top_k)
+            best_rows, best_scores = top_k_rows(np.concatenate([best_scores, scores]), np.concatenate([best_rows, rows]), top_k)
+        return best_rows, best_scores
+
+    def _ivf(self, view, query, top_k):
+        import numpy as np
+
+        nprobe = min(self.nprobe, len(view.centroids))
+        probe = np.argpartition(-(view.centroids @ query), nprobe - 1)[:nprobe]
+        candidates = [view.ivf_order[view.ivf_offsets[cluster]:view.ivf_offsets[cluster + 1]] for cluster in probe]
+        # IVF 构建之后新增的行
+        candidates.append(np.arange(view.ivf_count, view.count))
+        rows = np.sort(np.concatenate(candidates))
+        if not len(rows):
+            return rows, np.empty(0, dtype=np.float32)
+        return top_k_rows(view.vectors[rows] @ query, rows, top_k)
+
+    def search(self, query, top_k=5, min_score=0.0, exact=False):
+        """
+        检索与 query 最相似的片段
+        :param exact: 为 True 时忽略 IVF，强制暴力检索
+        :return: [{"title", "content", "source", "key", "score"}]
+        """
+        self._refresh()
+        view = self._view
+        if not view.count:
+            return []
+        query_vector = self.embedder.embed(query)
+        if not query_vector.any():
+            return []
+
+        if view.ivf_count and not exact:
+            rows, scores = self._ivf(view, query_vector, top_k)
+        else:
+            rows, scores = self._brute_force(view, query_vector, top_k)
+
+        results = []
+        with open(self._path(CHUNKS_FILE), "rb") as file:
+            for row, score in zip(rows, scores):
+                if score < min_score:
+                    break
+                file.seek(int(view.offsets[row]))
+                chunk = json.loads(file.readline())
+                chunk["score"] = round(float(score), 4)
+                results.append(chunk)
+        return results
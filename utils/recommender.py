@@ -0,0 +1,122 @@
+# utils/recommender.py
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+_EXAMPLE_RE = re.compile(r"\*\*例题\s*\d*\*\*\s*[：:]\s*(.+?)(?=\*\*解答|\*\*例题|\Z)", re.S)
+
+
+def example_stems(text, max_chars=40):
+    """从 example_problems 字段中提取例题题干"""
+    stems = []
+    for match in _EXAMPLE_RE.finditer(text or ""):
+        stem = " ".join(match.group(1).split())
+        if stem:
+            stems.append(stem if len(stem) <= max_chars else stem[:max_chars] + "…")
+    return stems
+
+
+class CooccurrenceRecommender:
+    """
+    无 LLM 的兜底推荐：按知识点类别共现推荐问题
+    - 知识库：例题题干经分类器归到其他类别、正文中提到其他类别标题，均计为两类别共现
+    - 历史问题：同一会话中先后出现的类别计为共现，各类别的高频问题作为候选
+    候选依次为：相关类别的历史高频问题、本类别例题、相关类别的概念问题
+    """
+
+    def __init__(self, snapshot, history_loader=None, refresh_interval=600.0, history_weight=2.0):
+        """
+        :param snapshot: 知识库快照（items + classifier）
+        :param history_loader: history_loader() -> [(session_id, category_id, question_text)]，按时间顺序
+        """
+        self.snapshot = snapshot
+        self.history_loader = history_loader
+        self.refresh_interval = refresh_interval
+        self.history_weight = history_weight
+        self.titles = {category_id: item.title for category_id, item in snapshot.items.items()}
+        self.examples = {}
+        self.base_cooccurrence = defaultdict(Counter)
+        self._build_from_knowledge()
+        self.cooccurrence = self.base_cooccurrence
+        self.popular = {}
+        self._refreshed_at = None
+        self._refresh_lock = threading.Lock()
+
+    def _add_pair(self, counts, a, b, weight=1.0):
+        if a != b and a in self.titles and b in self.titles:
+            counts[a][b] += weight
+            counts[b][a] += weight
+
+    def _build_from_knowledge(self):
+        classifier = self.snapshot.classifier
+        for category_id, item in self.snapshot.items.items():
+            stems = example_stems(item.content.get("example_problems"))
+            self.examples[category_id] = stems
+            for stem in stems:
+                for other, _ in classifier.classify(stem, top_k=2):
+                    self._add_pair(self.base_cooccurrence, category_id, other)
+            text = "".join(str(value) for value in item.content.values())
+            for other, title in self.titles.items():
+                if len(title) >= 2 and title != item.title and title in text:
+                    self._add_pair(self.base_cooccurrence, category_id, other, 0.5)
+
+    def maybe_refresh(self):
+        """按间隔从历史问题重建共现计数与高频问题，构建完成后整体替换"""
+        if self.history_loader is None:
+            return False
+        now = time.monotonic()
+        if self._refreshed_at is not None and now - self._refreshed_at < self.refresh_interval:
+            return False
+        if not self._refresh_lock.acquire(blocking=False):
+            return False
+        try:
+            self._refreshed_at = now
+            cooccurrence = defaultdict(Counter)
+            for category_id, counts in self.base_cooccurrence.items():
+                cooccurrence[category_id].update(counts)
+            questions = defaultdict(Counter)
+            last_category = {}
+            for session_id, category_id, question in self.history_loader():
+                category_id = str(category_id)
+                previous = last_category.get(session_id)
+                if previous is not None:
+                    self._add_pair(cooccurrence, previous, category_id, self.history_weight)
+                last_category[session_id] = category_id
+                if question:
+                    questions[category_id][question] += 1
+            self.cooccurrence = cooccurrence
+            self.popular = {category_id: [text for text, _ in counts.most_common(10)] for category_id, counts in questions.items()}
+            return True
+        finally:
+            self._refresh_lock.release()
+
+    def related(self, category_id, k=2):
+        return [other for other, _ in self.cooccurrence.get(category_id, Counter()).most_common(k)]
+
+    def recommend(self, question_text, category_id=None, k=3):
+        """
+        推荐 k 个问题
+        :param category_id: 问题所属类别，为空时取本地分类器的最佳类别
+        """
+        self.maybe_refresh()
+        if category_id is None:
+            ranked = self.snapshot.classifier.classify(question_text, top_k=1)
+            category_id = ranked[0][0] if ranked and ranked[0][1] > 0 else None
+        if category_id is None or str(category_id) not in self.titles:
+            return []
+        category_id = str(category_id)
+        related = self.related(category_id)
+
+        candidates = []
+        for other in [category_id] + related:
+            candidates += self.popular.get(other, [])[:2]
+        candidates += [f"例题：{stem}" for stem in self.examples.get(category_id, [])[:2]]
+        candidates += [f"什么是{self.titles[other]}？" for other in related]
+        candidates.append(f"{self.titles[category_id]}有哪些解题技巧？")
+
+        items = []
+        for candidate in candidates:
+            if candidate != question_text and candidate not in items:
+                items.append(candidate)
+        return items[:k]
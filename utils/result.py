@@ -1,30 +1,174 @@
-from flask import jsonify
+import gzip
+import json
+import math
+import threading
+from collections import OrderedDict
+
+from flask import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 已安装 brotli 时优先 br，否则只协商 gzip
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+COMPRESSIBLE_MIMETYPES = ("application/json", "text/plain", "text/html")
+
+def _default(obj):
+    if hasattr(obj, "tolist"):
+        # numpy 标量 / 数组
+        return obj.tolist()
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps(obj):
+    """序列化为 UTF-8 JSON 字节串（已安装 orjson 时使用 orjson，否则回退为标准库），非 ASCII 字符不转义"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+class RawJson:
+    """预先序列化的 JSON 片段（如已入库的检索结果），作为 res_data 的字段值时原样嵌入响应，不再解析与序列化"""
+    __slots__ = ("body",)
+
+    def __init__(self, body):
+        self.body = body.encode("utf-8") if isinstance(body, str) else body
+
+def envelope(data, code=200, msg="success"):
+    """
+    生成 {"code", "msg", "res_data"} 响应体
+    :param data: 返回的数据；为 dict 时字段值可为 RawJson
+    :return: JSON 字节串
+    """
+    if isinstance(data, dict) and any(isinstance(value, RawJson) for value in data.values()):
+        fields = b",".join(
+            dumps(str(key)) + b":" + (value.body if isinstance(value, RawJson) else dumps(value))
+            for key, value in data.items()
+        )
+        res_data = b"{" + fields + b"}"
+    else:
+        res_data = dumps(data)
+    return b'{"code":' + dumps(code) + b',"msg":' + dumps(msg) + b',"res_data":' + res_data + b"}"
 
 def success_response(data, code=200, msg="success"):
     """
-    生成成功的响应对象  
-    :param data: 返回的数据  
-    :param code: HTTP状态码，默认为200  
-    :param msg: 成功消息，默认为"success"  
+    生成成功的响应对象
+    :param data: 返回的数据（字段值可为 RawJson）
+    :param code: HTTP状态码，默认为200
+    :param msg: 成功消息，默认为"success"
     :return: JSON响应
     """
-    response = {
-        "code": code,
-        "msg": msg,
-        "res_data": data
-    }
-    return jsonify(response)
+    return Response(envelope(data, code, msg), status=code, mimetype="application/json")
 
 def error_response(msg, code=500):
     """
-    生成错误的响应对象
+    生成错误的响应对象（HTTP 状态码与响应体中的 code 一致，代理据此判断能否缓存 / 重试）
     :param msg: 错误消息
     :param code: HTTP状态码，默认为500
-    :param data: 可选的错误数据
     :return: JSON响应
     """
     response = {
         "code": code,
         "msg": msg,
     }
-    return jsonify(response)
\ No newline at end of file
+    return Response(dumps(response), status=code, mimetype="application/json")
+
+def overload_response(msg, status, retry_after):
+    """
+    生成过载响应（准入控制拒绝）
+    :param msg: 错误消息
+    :param status: HTTP状态码，429 或 503
+    :param retry_after: 建议重试间隔（秒），写入 Retry-After
+    :return: JSON响应
+    """
+    response = error_response(msg, code=status)
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+def raw_json_response(body, status=200, etag=None, max_age=None):
+    """
+    直接返回预先序列化好的 JSON 响应体
+    :param body: JSON 字节串
+    :param status: HTTP状态码，默认为200
+    :param etag: 内容不变的响应体（如知识点）的 ETag，按弱校验设置，压缩后仍可用于重新验证
+    :param max_age: 设置时允许客户端与 CDN 缓存 max_age 秒
+    :return: JSON响应
+    """
+    response = Response(body, status=status, mimetype="application/json")
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+    if max_age is not None:
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+    return response
+
+class ResponseCompressor:
+    """
+    按 Accept-Encoding 协商压缩较大的响应体（br / gzip）
+    - 流式响应、非 2xx 响应与已编码的响应不压缩
+    - 带 ETag 的响应体内容不变，压缩结果按 (ETag, 编码) 缓存
+    """
+
+    def __init__(self, min_bytes=1024, gzip_level=6, brotli_quality=5, cache_size=1024):
+        self.min_bytes = min_bytes
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _compress(self, encoding, body):
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    def _cached_compress(self, encoding, body, etag):
+        if etag is None:
+            return self._compress(encoding, body)
+        key = (etag, encoding)
+        with self._lock:
+            compressed = self._cache.get(key)
+            if compressed is not None:
+                self._cache.move_to_end(key)
+                return compressed
+        compressed = self._compress(encoding, body)
+        with self._lock:
+            self._cache[key] = compressed
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return compressed
+
+    def __call__(self, response, accept_encodings):
+        """
+        :param accept_encodings: werkzeug 解析的 Accept-Encoding（request.accept_encodings）
+        """
+        if (
+            response.is_streamed or response.direct_passthrough
+            or not 200 <= response.status_code < 300
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+        ):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = accept_encodings.best_match(ENCODINGS)
+        if encoding is None:
+            return response
+        body = response.get_data()
+        if len(body) < self.min_bytes:
+            return response
+
+        etag, _ = response.get_etag()
+        response.set_data(self._cached_compress(encoding, body, etag))
+        response.headers["Content-Encoding"] = encoding
+        return response
+
+    def stats(self):
+        with self._lock:
+            return {"encodings": list(ENCODINGS), "json": "orjson" if orjson is not None else "json", "cached": len(self._cache)}
@@ -0,0 +1,96 @@
+# utils/stream_pipeline.py
+import json
+import time
+
+SSE_CONTENT_TYPE = "text/event-stream; charset=utf-8"
+PLAIN_CONTENT_TYPE = "text/plain; charset=utf-8"
+
+
+class AnswerRecorder:
+    """
+    流式回答缓冲：片段追加到列表，按片段数或时间间隔触发检查点
+    偏移量均为 UTF-8 字节偏移，与 SSE 事件 id 及续传 offset 一致
+    """
+
+    def __init__(self, checkpoint=None, checkpoint_chunks=32, checkpoint_interval=1.0):
+        self.checkpoint = checkpoint
+        self.checkpoint_chunks = checkpoint_chunks
+        self.checkpoint_interval = checkpoint_interval
+        self.offset = 0
+        self.api_session_id = None
+        self._chunks = []
+        self._pending = 0
+        self._session_saved = False
+        self._last_checkpoint = time.monotonic()
+
+    def append(self, text, api_session_id=None):
+        """追加片段，返回追加后的字节偏移"""
+        if api_session_id:
+            self.api_session_id = api_session_id
+        if text:
+            self._chunks.append(text)
+            self.offset += len(text.encode("utf-8"))
+            self._pending += 1
+        if self.checkpoint is not None and self._checkpoint_due():
+            self.flush()
+        return self.offset
+
+    def _checkpoint_due(self):
+        if not self._pending:
+            return False
+        return (self._pending >= self.checkpoint_chunks
+                or time.monotonic() - self._last_checkpoint >= self.checkpoint_interval)
+
+    def flush(self):
+        """写入检查点：当前部分回答，及首次出现的 api_session_id"""
+        new_session_id = None
+        if self.api_session_id and not self._session_saved:
+            new_session_id = self.api_session_id
+            self._session_saved = True
+        self.checkpoint(self.text(), new_session_id)
+        self._pending = 0
+        self._last_checkpoint = time.monotonic()
+
+    def text(self):
+        """拼接已接收的全部片段；合并后的结果替换列表，重复调用不会重复拼接"""
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+
+def slice_from_offset(text, offset):
+    """
+    取字节偏移 offset 之后的内容，offset 落在多字节字符中间时向后对齐
+    :return: (剩余文本, 文本末尾的字节偏移)
+    """
+    data = (text or "").encode("utf-8")
+    offset = min(max(0, int(offset)), len(data))
+    while offset < len(data) and data[offset] & 0xC0 == 0x80:
+        offset += 1
+    return data[offset:].decode("utf-8"), len(data)
+
+
+def wants_sse(accept, requested_format=None):
+    """请求体 format=sse 或 Accept: text/event-stream 时使用 SSE"""
+    if requested_format:
+        return requested_format == "sse"
+    return "text/event-stream" in (accept or "")
+
+
+class StreamFormatter:
+    """输出格式：text/plain 直接输出文本；SSE 每个片段一个事件，事件 id 为片段末尾的字节偏移"""
+
+    def __init__(self, sse=False):
+        self.sse = sse
+        self.content_type = SSE_CONTENT_TYPE if sse else PLAIN_CONTENT_TYPE
+
+    def chunk(self, text, offset):
+        if not self.sse:
+            return text
+        return f"id: {offset}\ndata: {json.dumps({'text': text}, ensure_ascii=False)}\n\n"
+
+    def end(self, status, offset):
+        """结束事件（仅 SSE）：携带回答状态与最终偏移，客户端据此决定是否续传"""
+        if not self.sse:
+            return ""
+        return f"id: {offset}\nevent: end\ndata: {json.dumps({'status': status, 'offset': offset})}\n\n"
@@ -0,0 +1,232 @@
+# utils/tracing.py
+import atexit
+import bisect
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# 延迟直方图分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+METRIC_HELP = {
+    "mathecho_http_request_seconds": "HTTP request latency until response headers, by route",
+    "mathecho_stage_seconds": "Latency of request stages (db lookup, LLM calls, stream), by stage",
+    "mathecho_upstream_seconds": "Upstream call latency including retries, by upstream and outcome",
+    "mathecho_llm_seconds": "LLM call latency by routed model, task and outcome",
+}
+
+_current_trace = contextvars.ContextVar("mathecho_trace", default=None)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in items) + "}"
+
+
+class MetricsRegistry:
+    """进程内直方图汇总，按 Prometheus 文本格式导出"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def render(self):
+        with self._lock:
+            snapshot = sorted(
+                (name, labels, list(histogram.counts), histogram.sum, histogram.count)
+                for (name, labels), histogram in self._histograms.items()
+            )
+
+        lines = []
+        current = None
+        for name, labels, counts, total, count in snapshot:
+            if name != current:
+                current = name
+                lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(labels, ('le', bound))} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+class Trace:
+    """一次请求的阶段耗时记录；仅被采样的请求保存明细并写日志"""
+    __slots__ = ("trace_id", "name", "attrs", "sampled", "deferred", "start", "wall_start", "spans", "_token")
+
+    def __init__(self, name, sampled, attrs):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.sampled = sampled
+        # 流式响应在请求返回后继续，由生成器结束时再写日志
+        self.deferred = False
+        self.start = time.perf_counter()
+        self.wall_start = time.time()
+        self.spans = []
+        self._token = None
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def as_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "start": round(self.wall_start, 3),
+            "duration_ms": round(self.elapsed() * 1000, 2),
+            **self.attrs,
+            "spans": self.spans,
+        }
+
+
+class Tracer:
+    """
+    阶段耗时埋点
+    - 所有请求的阶段耗时计入直方图（加锁累加，开销可忽略）
+    - 按 sample_rate 采样的请求额外记录明细，经队列由后台线程写日志，不阻塞请求线程
+    """
+
+    def __init__(self, registry, logger=None, sample_rate=0.01, enabled=True):
+        self.registry = registry
+        self.logger = logger
+        self.sample_rate = sample_rate
+        self.enabled = enabled
+
+    def start(self, name, **attrs):
+        """开始请求级追踪并设为当前追踪"""
+        trace = Trace(name, self.enabled and self.logger is not None and random.random() < self.sample_rate, attrs)
+        trace._token = _current_trace.set(trace)
+        return trace
+
+    def detach(self, trace):
+        """请求结束时解除当前追踪；未延后的追踪直接结束"""
+        if trace._token is not None:
+            _current_trace.reset(trace._token)
+            trace._token = None
+        if not trace.deferred:
+            self.finish(trace)
+
+    def finish(self, trace, **attrs):
+        if trace.sampled:
+            trace.attrs.update(attrs)
+            self.logger.info(json.dumps(trace.as_dict(), ensure_ascii=False))
+
+    @staticmethod
+    def current():
+        return _current_trace.get()
+
+    @contextmanager
+    def activate(self, trace):
+        """在请求上下文之外（流式生成器、后台线程）将 trace 设为当前追踪"""
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            _current_trace.reset(token)
+
+    def record(self, name, seconds, trace=None, **attrs):
+        """记录一个阶段耗时；trace 为空时使用当前追踪"""
+        if not self.enabled:
+            return
+        self.registry.observe("mathecho_stage_seconds", seconds, stage=name)
+        trace = trace or _current_trace.get()
+        if trace is not None and trace.sampled:
+            span = {"name": name, "offset_ms": round((trace.elapsed() - seconds) * 1000, 2), "duration_ms": round(seconds * 1000, 2)}
+            if attrs:
+                span.update(attrs)
+            trace.spans.append(span)
+
+    @contextmanager
+    def span(self, name, trace=None, **attrs):
+        """计时上下文：with tracer.span("db_lookup"): ..."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, trace, **attrs)
+
+    def observe_request(self, route, method, status, seconds):
+        if self.enabled:
+            self.registry.observe("mathecho_http_request_seconds", seconds, route=route, method=method, status=status)
+
+    def observe_upstream(self, upstream, outcome, seconds):
+        if self.enabled:
+            self.registry.observe("mathecho_upstream_seconds", seconds, upstream=upstream, outcome=outcome)
+
+    def observe_llm(self, model, task, outcome, seconds):
+        if self.enabled:
+            self.registry.observe("mathecho_llm_seconds", seconds, model=model, task=task, outcome=outcome)
+
+
+def create_trace_logger(path=None, name="mathecho.trace"):
+    """
+    追踪日志：请求线程只入队（QueueHandler），由 QueueListener 后台线程写文件或 stderr
+    监听线程不随 fork 继承（gunicorn preload_app）：子进程中新建队列并重新启动监听线程
+    :param path: 日志文件路径，为空时写 stderr
+    """
+    target = logging.FileHandler(path, encoding="utf-8") if path else logging.StreamHandler(sys.stderr)
+    target.setFormatter(logging.Formatter("%(message)s"))
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    def start_listener():
+        log_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(log_queue, target)
+        listener.start()
+        atexit.register(listener.stop)
+        logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+
+    start_listener()
+    os.register_at_fork(after_in_child=start_listener)
+    return logger
+
+
+def create_tracer(config):
+    """根据 ObservabilityConfig 创建 Tracer"""
+    logger = create_trace_logger(config.TRACE_LOG_FILE) if config.ENABLED and config.TRACE_SAMPLE_RATE > 0 else None
+    return Tracer(MetricsRegistry(), logger, config.TRACE_SAMPLE_RATE, config.ENABLED)
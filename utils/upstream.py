@@ -0,0 +1,411 @@
+# utils/upstream.py
+import asyncio
+import random
+import sys
+import threading
+import time
+
+from utils.lazy import Lazy
+
+# 可重试的 HTTP 状态码
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+
+class UpstreamError(Exception):
+    """上游服务调用失败"""
+
+    def __init__(self, upstream, msg):
+        super().__init__(f"{upstream}: {msg}")
+        self.upstream = upstream
+
+
+class BulkheadFullError(UpstreamError):
+    """上游并发配额已满"""
+
+
+class CircuitOpenError(UpstreamError):
+    """熔断器打开，暂停调用上游"""
+
+
+class UpstreamStatusError(UpstreamError):
+    """上游返回非 200 状态码"""
+
+    def __init__(self, upstream, status_code, msg=""):
+        super().__init__(upstream, f"HTTP {status_code} {msg}".rstrip())
+        self.status_code = status_code
+
+
+class RetryableStatusError(UpstreamStatusError):
+    """上游返回可重试的状态码"""
+
+
+def retryable_exceptions():
+    """网络层可重试异常；各 SDK 延迟导入，只需匹配已导入 SDK 的异常类（未导入的不会被抛出）"""
+    exceptions = [RetryableStatusError]
+    requests = sys.modules.get("requests")
+    if requests is not None:
+        exceptions += [requests.ConnectionError, requests.Timeout]
+    openai = sys.modules.get("openai")
+    if openai is not None:
+        exceptions += [openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError]
+    httpx = sys.modules.get("httpx")
+    if httpx is not None:
+        exceptions += [httpx.TransportError]
+    return tuple(exceptions)
+
+
+class UpstreamPolicy:
+    """单个上游的超时、并发、重试与熔断参数"""
+    __slots__ = (
+        "connect_timeout", "read_timeout", "max_concurrency", "acquire_timeout",
+        "max_retries", "backoff_base", "backoff_max", "failure_threshold", "reset_timeout",
+    )
+
+    def __init__(self, connect_timeout=3.0, read_timeout=30.0, max_concurrency=10, acquire_timeout=1.0,
+                 max_retries=2, backoff_base=0.2, backoff_max=5.0, failure_threshold=5, reset_timeout=30.0):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_concurrency = max_concurrency
+        self.acquire_timeout = acquire_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+
+class CircuitBreaker:
+    """
+    连续失败达到阈值后打开，冷却后放行一次试探调用（半开）
+    试探调用未给出结论（非上游故障的异常）时释放名额；超过冷却时间仍无结论时重新放行一次试探
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        # 半开状态下试探调用的开始时间，None 表示没有进行中的试探
+        self.probe_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == self.OPEN:
+                if now - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+            elif self.probe_at is not None and now - self.probe_at < self.reset_timeout:
+                return False
+            self.probe_at = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.probe_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.probe_at = None
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        """调用以非上游故障结束（如请求参数错误），不计入熔断，释放半开状态的试探名额"""
+        with self._lock:
+            self.probe_at = None
+
+
+class UpstreamClient:
+    """
+    上游调用包装：并发隔离（bulkhead）+ 指数退避重试（带抖动）+ 熔断
+    HTTP 调用共享同一个连接池（session 可为 Lazy，首次请求时创建）
+    """
+
+    def __init__(self, name, policy, session=None, observe=None, breaker=None):
+        self.name = name
+        self.policy = policy
+        self.session = session
+        # 耗时回调 observe(upstream, outcome, seconds)，用于延迟直方图
+        self.observe = observe
+        # 同一上游的多个客户端（如同步与异步调用）可共享熔断器
+        self.breaker = breaker or CircuitBreaker(policy.failure_threshold, policy.reset_timeout)
+        self._slots = threading.BoundedSemaphore(policy.max_concurrency)
+        # 占用中的并发配额数
+        self.active = 0
+        self._active_lock = threading.Lock()
+
+    @property
+    def timeout(self):
+        """(连接超时, 读取超时)"""
+        return self.policy.connect_timeout, self.policy.read_timeout
+
+    def utilization(self):
+        """并发配额占用率（0~1）"""
+        return self.active / self.policy.max_concurrency
+
+    def _acquire(self, timeout=None):
+        if not self._slots.acquire(timeout=self.policy.acquire_timeout if timeout is None else timeout):
+            raise BulkheadFullError(self.name, "too many concurrent requests")
+        with self._active_lock:
+            self.active += 1
+
+    def _release(self):
+        with self._active_lock:
+            self.active -= 1
+        self._slots.release()
+
+    def _backoff_delay(self, attempt):
+        # full jitter
+        delay = min(self.policy.backoff_max, self.policy.backoff_base * (2 ** attempt))
+        return random.uniform(0, delay)
+
+    def _backoff(self, attempt):
+        time.sleep(self._backoff_delay(attempt))
+
+    def _attempts(self):
+        """逐次产出重试序号，每次调用前检查熔断器"""
+        for attempt in range(self.policy.max_retries + 1):
+            if not self.breaker.allow():
+                raise CircuitOpenError(self.name, "circuit open")
+            yield attempt
+
+    def _record(self, outcome, start):
+        if self.observe is not None:
+            self.observe(self.name, outcome, time.perf_counter() - start)
+
+    def call(self, func, *args, **kwargs):
+        """同步调用上游 SDK / 函数"""
+        start = time.perf_counter()
+        self._acquire()
+        outcome = "error"
+        try:
+            for attempt in self._attempts():
+                try:
+                    result = func(*args, **kwargs)
+                except retryable_exceptions() as e:
+                    self.breaker.record_failure()
+                    if attempt >= self.policy.max_retries:
+                        raise UpstreamError(self.name, str(e)) from e
+                    self._backoff(attempt)
+                except BaseException:
+                    self.breaker.release()
+                    raise
+                else:
+                    self.breaker.record_success()
+                    outcome = "ok"
+                    return result
+        finally:
+            self._release()
+            self._record(outcome, start)
+
+    def _send(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        session = self.session.get() if isinstance(self.session, Lazy) else self.session
+        resp = session.request(method, url, **kwargs)
+        if resp.status_code in RETRYABLE_STATUS:
+            raise RetryableStatusError(self.name, resp.status_code)
+        return resp
+
+    def post(self, url, **kwargs):
+        """通过共享连接池发送 POST 请求"""
+        return self.call(self._send, "POST", url, **kwargs)
+
+    def stream(self, func, *args, **kwargs):
+        """
+        流式调用：首个片段到达前可重试，整个流期间占用并发配额
+        返回前即占用配额并取得首个片段，并发已满、熔断与上游错误在开始响应前抛出
+        返回 UpstreamStream，迭代结束或 close() 时释放配额
+        """
+        start = time.perf_counter()
+        self._acquire()
+        try:
+            for attempt in self._attempts():
+                try:
+                    iterator = iter(func(*args, **kwargs))
+                    first = next(iterator, None)
+                    status_code = getattr(first, "status_code", None)
+                    if status_code in RETRYABLE_STATUS:
+                        raise RetryableStatusError(self.name, status_code)
+                except retryable_exceptions() as e:
+                    self.breaker.record_failure()
+                    if attempt >= self.policy.max_retries:
+                        raise UpstreamError(self.name, str(e)) from e
+                    self._backoff(attempt)
+                except BaseException:
+                    self.breaker.release()
+                    raise
+                else:
+                    self.breaker.record_success()
+                    break
+        except BaseException:
+            self._release()
+            self._record("error", start)
+            raise
+
+        # 流式调用记录首个片段的到达耗时
+        self._record("first_chunk", start)
+        return UpstreamStream(self, first, iterator, start)
+
+    async def _acquire_async(self):
+        """在线程中等待并发配额；等待期间任务被取消时，线程拿到的配额随即释放"""
+        def release_late(future):
+            if not future.cancelled() and future.exception() is None:
+                self._release()
+
+        waiter = asyncio.ensure_future(asyncio.to_thread(self._acquire))
+        try:
+            await asyncio.shield(waiter)
+        except asyncio.CancelledError:
+            waiter.add_done_callback(release_late)
+            raise
+
+    async def astream(self, func, *args, **kwargs):
+        """
+        stream 的异步版本：func 返回异步迭代器，与同步调用共享并发配额与熔断器
+        并发配额在线程中等待，不阻塞事件循环
+        返回 AsyncUpstreamStream，迭代结束或 aclose() 时释放配额
+        """
+        start = time.perf_counter()
+        try:
+            self._acquire(timeout=0)
+        except BulkheadFullError:
+            await self._acquire_async()
+        try:
+            for attempt in self._attempts():
+                try:
+                    iterator = aiter(func(*args, **kwargs))
+                    first = await anext(iterator, None)
+                except retryable_exceptions() as e:
+                    self.breaker.record_failure()
+                    if attempt >= self.policy.max_retries:
+                        raise UpstreamError(self.name, str(e)) from e
+                    await asyncio.sleep(self._backoff_delay(attempt))
+                except BaseException:
+                    self.breaker.release()
+                    raise
+                else:
+                    self.breaker.record_success()
+                    break
+        except BaseException:
+            self._release()
+            self._record("error", start)
+            raise
+
+        self._record("first_chunk", start)
+        return AsyncUpstreamStream(self, first, iterator, start)
+
+
+class UpstreamStream:
+    """流式调用的片段迭代器：迭代结束、出错或 close() 时释放并发配额（只释放一次）"""
+
+    def __init__(self, client, first, iterator, start):
+        self.client = client
+        self._first = first
+        self._iterator = iterator
+        self._start = start
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._closed:
+            raise StopIteration
+        if self._first is not None:
+            first, self._first = self._first, None
+            return first
+        try:
+            return next(self._iterator)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        try:
+            close = getattr(self._iterator, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self.client._release()
+            self.client._record("ok", self._start)
+
+    def __del__(self):
+        # 未迭代完即被丢弃时兜底释放配额
+        self.close()
+
+
+class AsyncUpstreamStream:
+    """异步流式调用的片段迭代器：迭代结束、出错或 aclose() 时释放并发配额（只释放一次）"""
+
+    def __init__(self, client, first, iterator, start):
+        self.client = client
+        self._first = first
+        self._iterator = iterator
+        self._start = start
+        self._closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._closed:
+            raise StopAsyncIteration
+        if self._first is not None:
+            first, self._first = self._first, None
+            return first
+        try:
+            return await anext(self._iterator)
+        except BaseException:
+            await self.aclose()
+            raise
+
+    async def aclose(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            aclose = getattr(self._iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        finally:
+            self.client._release()
+            self.client._record("ok", self._start)
+
+
+def create_http_session(pool_maxsize):
+    """共享 HTTP 连接池（keep-alive）"""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def create_openai_http_client(policy, pool_maxsize):
+    """OpenAI 兼容客户端使用的 httpx 连接池"""
+    import httpx
+
+    return httpx.Client(
+        timeout=httpx.Timeout(policy.read_timeout, connect=policy.connect_timeout),
+        limits=httpx.Limits(max_connections=pool_maxsize, max_keepalive_connections=pool_maxsize),
+    )
@@ -0,0 +1,25 @@
+# utils/web_search.py
+from utils.answer_cache import normalize_text
+
+# 搜索结果保留的字段
+RESULT_FIELDS = ("title", "content", "link", "media")
+
+
+def keyword_cache_text(keywords):
+    """关键词集合的缓存键：规范化、去重、排序，与关键词顺序无关"""
+    return "\x00".join(sorted({normalize_text(keyword) for keyword in keywords if normalize_text(keyword)}))
+
+
+def compact_results(results, max_results=8, content_max_chars=600):
+    """只保留有用字段，正文截断，丢弃无正文的结果"""
+    compacted = []
+    for result in results or []:
+        if not isinstance(result, dict) or not result.get("content"):
+            continue
+        item = {field: result.get(field) or "" for field in RESULT_FIELDS}
+        if len(item["content"]) > content_max_chars:
+            item["content"] = item["content"][:content_max_chars] + "…"
+        compacted.append(item)
+        if len(compacted) >= max_results:
+            break
+    return compacted
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+后台任务 worker：从 jobs 表领取任务并执行，可独立于 Web 进程横向扩展
+
+用法：python worker.py [--kinds summary,recommend] [--batch-size 5] [--once]
+"""
+import argparse
+import json
+import os
+import time
+import uuid
+
+from app import app, console, model_router, summarize_answers, recommend_questions, answer_documents, add_rag_documents, rag_index, JOB_SUMMARY, JOB_RECOMMEND
+from db import init_db, claim_jobs, complete_job, fail_job, requeue_stale_jobs, get_job_stats, add_question_summary, add_question_recommendations, transaction
+from models import db, Question
+from config import JobConfig, RagConfig
+
+
+def handle_summary(jobs):
+    """批量总结：一次 LLM 调用处理多条回答，结果在同一事务中入库"""
+    payloads = [json.loads(job.payload) for job in jobs]
+    question_ids = [payload["question_id"] for payload in payloads]
+    rows = Question.query.with_entities(Question.id, Question.content, Question.answer).filter(Question.id.in_(question_ids)).all()
+    contents = {question_id: content for question_id, content, _ in rows}
+    answers = {question_id: answer for question_id, _, answer in rows}
+
+    runnable = []
+    for job, question_id in zip(jobs, question_ids):
+        if answers.get(question_id):
+            runnable.append((job, question_id))
+        else:
+            # 问题已删除或没有回答，无需总结
+            complete_job(job, commit=False)
+
+    if runnable:
+        summaries = summarize_answers([answers[question_id] for _, question_id in runnable])
+        documents = []
+        for (job, question_id), summary in zip(runnable, summaries):
+            add_question_summary(question_id, summary, commit=False)
+            complete_job(job, commit=False)
+            documents += answer_documents(question_id, contents[question_id], answers[question_id], summary)
+
+        # 回答与总结增量写入 RAG 索引，失败不影响总结入库
+        try:
+            add_rag_documents(documents)
+        except Exception as e:
+            console.print(f"[red](worker) rag index add failed: {e}[/red]")
+
+
+def handle_recommend(jobs):
+    """批量生成推荐问题：一次 LLM 调用处理多条回答，结果写入问题记录"""
+    question_ids = [json.loads(job.payload)["question_id"] for job in jobs]
+    answers = dict(Question.query.with_entities(Question.id, Question.answer).filter(Question.id.in_(question_ids)).all())
+
+    runnable = []
+    for job, question_id in zip(jobs, question_ids):
+        if answers.get(question_id):
+            runnable.append((job, question_id))
+        else:
+            complete_job(job, commit=False)
+
+    if runnable:
+        results = recommend_questions([answers[question_id] for _, question_id in runnable])
+        for (job, question_id), result in zip(runnable, results):
+            # 生成失败时不写入，接口继续使用兜底推荐
+            if result is not None:
+                add_question_recommendations(question_id, result, commit=False)
+            complete_job(job, commit=False)
+
+
+HANDLERS = {
+    JOB_SUMMARY: handle_summary,
+    JOB_RECOMMEND: handle_recommend,
+}
+
+
+def run_batch(kind, worker_id, batch_size):
+    """领取并执行一批任务，返回处理的任务数"""
+    success, jobs = claim_jobs(kind, worker_id, batch_size)
+    if not jobs:
+        return 0
+
+    try:
+        with transaction():
+            HANDLERS[kind](jobs)
+    except Exception as e:
+        console.print(f"[red](worker) {kind} batch failed: {e}[/red]")
+        for job in jobs:
+            fail_job(job, e, JobConfig.BACKOFF_BASE, JobConfig.BACKOFF_MAX, commit=False)
+        db.session.commit()
+    return len(jobs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kinds", default=",".join(HANDLERS), help="处理的任务类别，逗号分隔")
+    parser.add_argument("--batch-size", type=int, default=JobConfig.BATCH_SIZE)
+    parser.add_argument("--once", action="store_true", help="处理完当前到期任务后退出")
+    args = parser.parse_args()
+
+    kinds = [kind for kind in args.kinds.split(",") if kind in HANDLERS]
+    worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    init_db(app)
+    console.print(f"[blue](worker {worker_id}) kinds={kinds} batch_size={args.batch_size}[/blue]")
+
+    last_maintenance = 0.0
+    with app.app_context():
+        while True:
+            if time.monotonic() - last_maintenance > JobConfig.VISIBILITY_TIMEOUT / 2:
+                requeue_stale_jobs(JobConfig.VISIBILITY_TIMEOUT)
+                success, stats = get_job_stats()
+                console.print(f"[blue](worker {worker_id}) queue: {stats}[/blue]")
+                # 积压过深时模型路由降级后台任务
+                model_router.backlog = sum(depth.get("pending", 0) for depth in stats["depth"].values())
+                if rag_index.needs_ivf(RagConfig.IVF_THRESHOLD, RagConfig.IVF_TAIL_RATIO):
+                    console.print(f"[blue](worker {worker_id}) rag ivf lists: {rag_index.build_ivf()}[/blue]")
+                last_maintenance = time.monotonic()
+
+            processed = sum(run_batch(kind, worker_id, args.batch_size) for kind in kinds)
+            if not processed:
+                if args.once:
+                    break
+                time.sleep(JobConfig.POLL_INTERVAL)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+# wsgi.py
+"""
+WSGI 入口：gunicorn -c gunicorn.conf.py wsgi:app
+导入时经应用工厂初始化数据库、预加载只读数据并预先导入上游 SDK，
+配合 preload_app 只在 master 中执行一次
+"""
+from app import create_app
+
+app = create_app(import_sdks=True)